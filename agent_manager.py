@@ -2,24 +2,29 @@
 
 import os
 import sys
+import hashlib
 import pandas as pd
 import logging
 import tempfile
-import PyPDF2
+import time
 import streamlit as st
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, TYPE_CHECKING
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
 from file_reader import FileReader
-from llm_utils import gerar_resposta_llm as llm_resposta
+from response_cache import calcular_fingerprint
+from llm_utils import gerar_resposta_llm as llm_resposta, gerar_resposta_llm_stream as llm_resposta_stream, obter_estatisticas_cache
 # ✅ CORREÇÃO: Importa AMBAS as classes
-from memory_module import MemoriaInteligente, MemoriaCompartilhada
+from memory_module import obter_memoria, MemoriaCompartilhada
+from embedding_registry import obter_embeddings
+from embedding_cache import EmbeddingsComCache
+from context_packer import empacotar_contexto, dividir_passagens, ORCAMENTO_PDF
+from telemetry import obter_telemetria
+
+if TYPE_CHECKING:
+    from pdf_index import IndicePDF
 
 # ══════════════════════════════════════════════════════════════
 # ✅ CORREÇÃO 1: CONFIGURAÇÃO DE LOGGING COM UTF-8 PARA WINDOWS
@@ -53,6 +58,13 @@ formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
+# Tipo de pergunta → modo de resposta do LLMInteligente (rótulo da telemetria)
+MODO_POR_TIPO_PERGUNTA = {'csv': 'csv', 'pdf': 'pdf', 'conjunta': 'consolidada'}
+
+# Teto de trechos candidatos por busca: além disso o empacotador descarta tudo
+# (ORCAMENTO_PDF), então a busca não cresce com o número de PDFs da sessão
+MAX_TRECHOS_BUSCA = int(os.getenv("CHATFISCAL_MAX_TRECHOS", "50"))
+
 # ══════════════════════════════════════════════════════════════
 # CLASSE AgentManager
 # ══════════════════════════════════════════════════════════════
@@ -62,24 +74,26 @@ class AgentManager:
         self.persist_directory = "vectorstore"
         os.makedirs(self.persist_directory, exist_ok=True)
 
-        # ✅ CORREÇÃO 2: ESPECIFICA DISPOSITIVO CPU EXPLICITAMENTE
+        # ✅ CORREÇÃO 2: MODELO COMPARTILHADO PELO PROCESSO (CPU, carregado uma única vez)
         try:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': False}
-            )
-            logger.info("Embeddings carregados com sucesso")
+            self.embeddings = obter_embeddings(device='cpu')
+            logger.info("Embeddings configurados (modelo carregado na primeira embedding)")
         except Exception as e:
             logger.error(f"Erro ao inicializar embeddings: {e}")
             raise
 
-        self.vetorstore_list = []
+        # Cache hash(chunk) -> vetor: reenviar um PDF já indexado não recalcula embeddings
+        self.embeddings_pdf = EmbeddingsComCache(
+            self.embeddings,
+            cache_dir=os.path.join(self.persist_directory, "embeddings_cache")
+        )
+
         self.arquivos_processados = set()
         
         # INICIALIZA MEMÓRIAS
         try:
-            self.memoria_inteligente = MemoriaInteligente(persist_dir="memoria_chatfiscal")
+            # Mesma instância usada pelo LLMInteligente (uma memória por processo)
+            self.memoria_inteligente = obter_memoria("memoria_chatfiscal")
             self.memoria_compartilhada = MemoriaCompartilhada()
             logger.info("Memoria Inteligente inicializada")
         except Exception as e:
@@ -157,10 +171,29 @@ class AgentManager:
         temp_path = None
         
         try:
+            conteudo = arquivo.read()
+            doc_id = hashlib.sha1(conteudo).hexdigest()[:16]
+            indice = self._obter_indice_pdf()
+            
+            if doc_id in indice:
+                self.arquivos_processados.add(arquivo.name.lower())
+                return f"PDF '{arquivo.name}' ja estava indexado"
+            
+            # Mesmo conteúdo já indexado antes (outra sessão/execução): reanexa do disco
+            if indice.carregar_documento(doc_id, arquivo.name):
+                total_chunks = indice.documentos[doc_id]["chunks"]
+                self._registrar_pdf_sessao(arquivo.name, doc_id, total_chunks, indice.texto_documento(doc_id))
+                logger.info(f"PDF '{arquivo.name}' recuperado do indice salvo")
+                return f"PDF '{arquivo.name}' recuperado do indice salvo ({total_chunks} blocos)"
+            
             with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-                temp_pdf.write(arquivo.read())
+                temp_pdf.write(conteudo)
                 temp_path = temp_pdf.name
 
+            # Leitores e splitter de PDF só quando chega um PDF (fora da abertura do app)
+            from langchain_community.document_loaders import PyPDFLoader
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+
             docs = []
             try:
                 loader = PyPDFLoader(temp_path)
@@ -170,6 +203,7 @@ class AgentManager:
                 logger.warning(f"PyPDFLoader falhou, tentando PyPDF2: {e}")
                 
                 try:
+                    import PyPDF2
                     pdf_reader = PyPDF2.PdfReader(temp_path)
                     for i, page in enumerate(pdf_reader.pages):
                         texto = page.extract_text()
@@ -200,37 +234,11 @@ class AgentManager:
                 logger.warning(f"Nenhum chunk extraido: {arquivo.name}")
                 return f"Nenhum conteudo pode ser indexado em '{arquivo.name}'"
 
-            faiss_index = FAISS.from_documents(chunks, self.embeddings)
-            self.vetorstore_list.append(faiss_index)
-
-            if "pdf_list" not in st.session_state:
-                st.session_state["pdf_list"] = []
-            if "pdf_metadata" not in st.session_state:
-                st.session_state["pdf_metadata"] = []
-            if "texto_pdf_list" not in st.session_state:
-                st.session_state["texto_pdf_list"] = []
-
-            st.session_state["pdf_list"].append(faiss_index)
-            st.session_state["pdf_metadata"].append({
-                "nome": arquivo.name,
-                "chunks": len(chunks),
-                "timestamp": datetime.now().isoformat(),
-                "status": "indexado"
-            })
-            st.session_state["texto_pdf_list"].append({
-                "nome": arquivo.name,
-                "texto": "\n".join([c.page_content for c in chunks])
-            })
-
-            # SALVA NA MEMÓRIA COMPARTILHADA
-            if self.memoria_compartilhada:
-                self.memoria_compartilhada.salvar(f"arquivo_{arquivo.name}", {
-                    "nome": arquivo.name,
-                    "tipo": "PDF",
-                    "chunks": len(chunks),
-                    "timestamp": datetime.now().isoformat()
-                })
-
+            # Índice ÚNICO da sessão (persistido em vectorstore/pdfs/<doc_id>)
+            indice.adicionar_documento(doc_id, arquivo.name, chunks)
+            self._registrar_pdf_sessao(
+                arquivo.name, doc_id, len(chunks), "\n".join([c.page_content for c in chunks])
+            )
             logger.info(f"PDF '{arquivo.name}' indexado com {len(chunks)} chunks")
             return f"PDF '{arquivo.name}' indexado com {len(chunks)} blocos"
 
@@ -245,16 +253,61 @@ class AgentManager:
                 except:
                     pass
 
-    def get_contexto_pdf(self):
-        """Retorna o texto completo de todos os PDFs carregados"""
+    def _registrar_pdf_sessao(self, nome, doc_id, total_chunks, texto):
+        """Registra um PDF indexado no session state e na memória compartilhada"""
+        if "pdf_list" not in st.session_state:
+            st.session_state["pdf_list"] = []
+        if "pdf_metadata" not in st.session_state:
+            st.session_state["pdf_metadata"] = []
+        if "texto_pdf_list" not in st.session_state:
+            st.session_state["texto_pdf_list"] = []
+
+        st.session_state["pdf_list"].append(doc_id)
+        st.session_state["pdf_metadata"].append({
+            "nome": nome,
+            "doc_id": doc_id,
+            "chunks": total_chunks,
+            "timestamp": datetime.now().isoformat(),
+            "status": "indexado"
+        })
+        st.session_state["texto_pdf_list"].append({
+            "nome": nome,
+            "texto": texto
+        })
+
+        # SALVA NA MEMÓRIA COMPARTILHADA
+        if self.memoria_compartilhada:
+            self.memoria_compartilhada.salvar(f"arquivo_{nome}", {
+                "nome": nome,
+                "tipo": "PDF",
+                "chunks": total_chunks,
+                "timestamp": datetime.now().isoformat()
+            })
+
+        self.arquivos_processados.add(nome.lower())
+
+    def _obter_indice_pdf(self) -> "IndicePDF":
+        """Retorna o índice vetorial único dos PDFs da sessão (cria se necessário)"""
+        if st.session_state.get("indice_pdf") is None:
+            from pdf_index import IndicePDF
+            st.session_state["indice_pdf"] = IndicePDF(
+                self.embeddings_pdf,
+                self.embeddings,
+                persist_dir=os.path.join(self.persist_directory, "pdfs")
+            )
+        return st.session_state["indice_pdf"]
+
+    def get_contexto_pdf(self, pergunta=None, orcamento_tokens=ORCAMENTO_PDF):
+        """Retorna o texto dos PDFs carregados, priorizado pela pergunta e limitado ao orçamento de tokens"""
         texto_pdf_list = st.session_state.get("texto_pdf_list", [])
         if not texto_pdf_list:
             return None
 
-        contexto = ""
+        passagens = []
         for item in texto_pdf_list:
-            contexto += f"\n[{item['nome']}]\n{item['texto']}\n"
+            passagens.extend(dividir_passagens(item['texto'], origem=item['nome']))
         
+        contexto = empacotar_contexto(passagens, orcamento_tokens, pergunta=pergunta)
         return contexto if contexto.strip() else None
 
     def get_contexto_csv(self):
@@ -459,22 +512,87 @@ class AgentManager:
         """
         Gera resposta com base no tipo de pergunta
         AGORA COM MEMÓRIA INTELIGENTE INTEGRADA
+        
+        Respostas determinísticas (soma, contagem) são salvas aqui; nas demais,
+        o LLMInteligente faz a única busca e a única gravação na memória do turno.
         """
         logger.info(f"Pergunta: {pergunta[:60]}")
+        telemetria = obter_telemetria()
         
-        df = st.session_state.get("df_csv_unificado")
-        pdf_list = st.session_state.get("pdf_list", [])
+        try:
+            with telemetria.medir("resposta", modo="deterministica") as rotulos:
+                resposta = self._resposta_deterministica(pergunta)
+                if resposta is not None:
+                    return resposta
+                
+                df = st.session_state.get("df_csv_unificado")
+                pdf_list = st.session_state.get("pdf_list", [])
+                
+                tipo_pergunta = self._detectar_tipo_pergunta(pergunta)
+                rotulos["modo"] = MODO_POR_TIPO_PERGUNTA.get(tipo_pergunta, tipo_pergunta)
+                
+                # Gera resposta (memória consultada e salva dentro do LLMInteligente)
+                if tipo_pergunta == 'conjunta':
+                    resposta = self._responder_conjunta(pergunta, df, pdf_list)
+                elif tipo_pergunta == 'pdf':
+                    resposta = self._responder_pdf(pergunta, pdf_list)
+                elif tipo_pergunta == 'csv':
+                    resposta = self._responder_csv(pergunta, df)
+                else:
+                    resposta = "Nenhum dado disponível."
+                
+                return resposta
+        finally:
+            telemetria.gravar_periodicamente()
+
+    def gerar_resposta_stream(self, pergunta):
+        """
+        Versão em streaming de gerar_resposta: gera pedaços de texto para a
+        interface. Respostas determinísticas e mensagens de erro saem inteiras;
+        com o prazo do LLM esgotado, o primeiro pedaço é uma RespostaRapida.
         
-        # BUSCA CONTEXTO RELEVANTE NA MEMÓRIA
-        contexto_memoria = ""
-        if self.memoria_inteligente:
-            try:
-                contexto_memoria = self.memoria_inteligente.buscar_contexto_relevante(pergunta, k=3)
-                if contexto_memoria:
-                    logger.info("Contexto relevante recuperado da memoria")
-            except Exception as e:
-                logger.warning(f"Erro ao buscar memoria: {e}")
+        A latência até o primeiro pedaço visível vai para o histograma primeira_resposta.
+        """
+        logger.info(f"Pergunta (streaming): {pergunta[:60]}")
+        telemetria = obter_telemetria()
+        inicio = time.perf_counter()
         
+        try:
+            with telemetria.medir("resposta", modo="deterministica") as rotulos:
+                resposta = self._resposta_deterministica(pergunta)
+                if resposta is not None:
+                    telemetria.observar("primeira_resposta", time.perf_counter() - inicio, **rotulos)
+                    yield resposta
+                    return
+                
+                df = st.session_state.get("df_csv_unificado")
+                pdf_list = st.session_state.get("pdf_list", [])
+                
+                tipo_pergunta = self._detectar_tipo_pergunta(pergunta)
+                rotulos["modo"] = MODO_POR_TIPO_PERGUNTA.get(tipo_pergunta, tipo_pergunta)
+                
+                if tipo_pergunta == 'conjunta':
+                    resposta = self._responder_conjunta(pergunta, df, pdf_list, stream=True)
+                elif tipo_pergunta == 'pdf':
+                    resposta = self._responder_pdf(pergunta, pdf_list, stream=True)
+                elif tipo_pergunta == 'csv':
+                    resposta = self._responder_csv(pergunta, df, stream=True)
+                else:
+                    resposta = "Nenhum dado disponível."
+                
+                pedacos = [resposta] if isinstance(resposta, str) else resposta
+                for i, pedaco in enumerate(pedacos):
+                    if not i:
+                        telemetria.observar("primeira_resposta", time.perf_counter() - inicio, **rotulos)
+                    yield pedaco
+        finally:
+            telemetria.gravar_periodicamente()
+
+    def _resposta_deterministica(self, pergunta):
+        """
+        Soma de valores e contagem de notas, calculadas direto do DataFrame
+        (sem LLM) e salvas na memória. None se a pergunta não é desses tipos.
+        """
         pergunta_lower = pergunta.lower()
         
         # Verificação de soma
@@ -556,35 +674,7 @@ class AgentManager:
             
             return resposta
         
-        tipo_pergunta = self._detectar_tipo_pergunta(pergunta)
-        
-        # Gera resposta
-        if tipo_pergunta == 'conjunta':
-            resposta = self._responder_conjunta(pergunta, df, pdf_list, contexto_memoria)
-        elif tipo_pergunta == 'pdf':
-            resposta = self._responder_pdf(pergunta, pdf_list, contexto_memoria)
-        elif tipo_pergunta == 'csv':
-            resposta = self._responder_csv(pergunta, df, contexto_memoria)
-        else:
-            resposta = "Nenhum dado disponível."
-        
-        # SALVA NA MEMÓRIA AUTOMATICAMENTE
-        if self.memoria_inteligente and resposta and not resposta.startswith("Nenhum"):
-            try:
-                self.memoria_inteligente.salvar_contexto(
-                    pergunta=pergunta,
-                    resposta=resposta,
-                    metadados_extras={
-                        "tipo_pergunta": tipo_pergunta,
-                        "tem_csv": df is not None and not df.empty,
-                        "tem_pdf": len(pdf_list) > 0
-                    }
-                )
-                logger.info("Conversa salva na memoria inteligente")
-            except Exception as e:
-                logger.warning(f"Erro ao salvar na memoria: {e}")
-        
-        return resposta
+        return None
 
     def _detectar_tipo_pergunta(self, pergunta: str) -> str:
         """Detecta o tipo de pergunta"""
@@ -615,41 +705,40 @@ class AgentManager:
         else:
             return 'nenhum'
 
-    def _responder_conjunta(self, pergunta, df, pdf_list, contexto_memoria=""):
-        """Responde com dados conjuntos + memória"""
+    def _responder_conjunta(self, pergunta, df, pdf_list, stream=False):
+        """Responde com dados conjuntos (stream=True: gerador de pedaços)"""
         try:
             contexto = f"Total registros: {len(df)}\n"
             contexto += f"Amostra:\n{df.head(3).to_string()}\n\n"
 
-            for i, vetorstore in enumerate(pdf_list):
-                resultados = vetorstore.similarity_search(pergunta, k=3)
-                if resultados:
-                    contexto += f"\nPDF {i+1}:\n"
-                    contexto += "\n".join([r.page_content for r in resultados])
-            
-            # Adiciona contexto da memória
-            if contexto_memoria:
-                contexto += f"\n\nCONTEXTO DE CONVERSAS ANTERIORES:\n{contexto_memoria}"
-
-            return llm_resposta(pergunta, df=df, contexto_pdf=contexto)
+            indice = self._obter_indice_pdf()
+            doc_ids = indice.documentos_citados(pergunta)
+            resultados = indice.buscar_trechos([pergunta], k=min(3 * len(doc_ids or indice), MAX_TRECHOS_BUSCA),
+                                           doc_ids=doc_ids)
+            contexto += self._empacotar_trechos(resultados)
+            # Dados da sessão, não os trechos desta pergunta: reformulações reaproveitam o cache
+            fingerprint = calcular_fingerprint(df, doc_ids=pdf_list)
+
+            if stream:
+                return llm_resposta_stream(pergunta, df=df, contexto_pdf=contexto, fingerprint=fingerprint)
+            return llm_resposta(pergunta, df=df, contexto_pdf=contexto, fingerprint=fingerprint)
         except Exception as e:
+            obter_telemetria().contar("erros", etapa="resposta")
             return f"Erro: {str(e)}"
 
-    def _responder_csv(self, pergunta, df, contexto_memoria=""):
-        """Responde com dados CSV/XML + memória"""
+    def _responder_csv(self, pergunta, df, stream=False):
+        """Responde com dados CSV/XML (stream=True: gerador de pedaços)"""
         if df is None or df.empty:
             return "Nenhum dado tabular carregado."
         
-        # Se há contexto da memória, adiciona como "contexto_pdf" (workaround)
-        if contexto_memoria:
-            contexto_extra = f"CONVERSAS ANTERIORES RELEVANTES:\n{contexto_memoria}"
-            return llm_resposta(pergunta, df=df, contexto_pdf=contexto_extra)
-        
+        if stream:
+            return llm_resposta_stream(pergunta, df=df)
         return llm_resposta(pergunta, df=df)
 
-    def _responder_pdf(self, pergunta, pdf_list, contexto_memoria=""):
-        """Responde com PDFs + memória"""
-        if not pdf_list:
+    def _responder_pdf(self, pergunta, pdf_list, stream=False):
+        """Responde com PDFs (stream=True: gerador de pedaços)"""
+        indice = self._obter_indice_pdf()
+        if not pdf_list or not len(indice):
             return "Nenhum PDF carregado."
         
         pergunta_lower = pergunta.lower()
@@ -657,34 +746,32 @@ class AgentManager:
         palavras_produto = ['produto', 'item', 'mercadoria', 'caro', 'barato', 'tabela', 'mais', 'menos']
         eh_pergunta_produto = any(palavra in pergunta_lower for palavra in palavras_produto)
         
-        contexto = ""
-        
         if eh_pergunta_produto:
             logger.info("Detectada pergunta sobre produtos")
-            for vetorstore in pdf_list:
-                termos_busca = [
-                    "DADOS DOS PRODUTOS SERVIÇOS",
-                    "DESCRIÇÃO DOS PRODUTOS",
-                    "VALOR UNIT",
-                    "QUANTIDADE VALOR"
-                ]
-                
-                for termo in termos_busca:
-                    resultados = vetorstore.similarity_search(termo, k=5)
-                    if resultados:
-                        contexto += "\n".join([r.page_content for r in resultados])
-                        contexto += "\n\n"
         
-        for vetorstore in pdf_list:
-            resultados = vetorstore.similarity_search(pergunta, k=5)
-            if resultados:
-                contexto += "\n".join([r.page_content for r in resultados])
-        
-        # Adiciona contexto da memória
-        if contexto_memoria:
-            contexto += f"\n\nCONTEXTO DE CONVERSAS ANTERIORES:\n{contexto_memoria}"
-
-        return llm_resposta(pergunta, contexto_pdf=contexto)
+        # Tabela de produtos já marcada na indexação + UMA busca pela pergunta no índice único,
+        # restrita aos PDFs citados na pergunta (se houver)
+        doc_ids = indice.documentos_citados(pergunta)
+        resultados = indice.buscar_trechos(
+            [pergunta],
+            k=min(5 * len(doc_ids or indice), MAX_TRECHOS_BUSCA),
+            doc_ids=doc_ids,
+            incluir_produtos=eh_pergunta_produto
+        )
+        contexto = self._empacotar_trechos(resultados)
+        fingerprint = calcular_fingerprint(doc_ids=pdf_list)
+
+        if stream:
+            return llm_resposta_stream(pergunta, contexto_pdf=contexto, fingerprint=fingerprint)
+        return llm_resposta(pergunta, contexto_pdf=contexto, fingerprint=fingerprint)
+
+    def _empacotar_trechos(self, resultados, orcamento_tokens=ORCAMENTO_PDF):
+        """Trechos recuperados → contexto sem sobreposições, dentro do orçamento de tokens"""
+        passagens = [
+            {"texto": r.page_content, "origem": r.metadata.get("arquivo", "")}
+            for r in resultados
+        ]
+        return empacotar_contexto(passagens, orcamento_tokens)
 
     def limpar_todos_pdfs(self):
         """Limpa todos os PDFs e dados"""
@@ -693,7 +780,7 @@ class AgentManager:
         st.session_state["texto_pdf_list"] = []
         st.session_state["dados_tabulares"] = []
         st.session_state["df_csv_unificado"] = None
-        self.vetorstore_list = []
+        st.session_state["indice_pdf"] = None
         self.arquivos_processados = set()
         
         # LIMPA MEMÓRIA COMPARTILHADA (mas mantém memória inteligente persistente)
@@ -710,6 +797,10 @@ class AgentManager:
             return None
         return self.memoria_inteligente.estatisticas()
     
+    def obter_estatisticas_cache(self):
+        """Retorna acertos/falhas do cache de respostas da LLM"""
+        return obter_estatisticas_cache()
+    
     def obter_historico_conversas(self, ultimos_n=10):
         """Retorna histórico formatado das últimas conversas"""
         if not self.memoria_inteligente:
@@ -9,10 +9,10 @@ from datetime import datetime
 from dotenv import load_dotenv
 import streamlit as st
 from agent_manager import AgentManager
+from llm_utils import aquecer as aquecer_llm
+from quick_answer import RespostaRapida
 import logging
 import sys
-from gerar_pdf import gerar_relatorio_pdf
-from visualizacao.interface import exibir_visualizacao
 
 # CONFIGURAÇÃO INICIAL
 def get_base64_icon(path):
@@ -58,8 +58,12 @@ except ImportError:
     def gerar_dica_corujito_inteligente(df, contexto_empresa="", historico=None):
         return "Análise dos dados carregada com sucesso. Continue fazendo perguntas!"
 
-# Inicializa o manager
-manager = AgentManager()
+# Inicializa o manager (um por sessão; o modelo de embeddings é compartilhado pelo processo)
+if "manager" not in st.session_state:
+    st.session_state["manager"] = AgentManager()
+    # Gemini + memória criados em segundo plano, antes da primeira pergunta
+    aquecer_llm(em_segundo_plano=True)
+manager = st.session_state["manager"]
 
 # ESTILOS GLOBAIS
 st.markdown("""
@@ -176,7 +180,7 @@ with abas[0]:
             if arquivo.size > MAX_SIZE:
                 st.error(f"Arquivo '{nome}' muito grande (máx 50MB)")
                 continue
-            if nome in manager.arquivos_processados:
+            if nome.lower() in manager.arquivos_processados:
                 continue
             try:
                 if nome.lower().endswith(".pdf"):
@@ -290,14 +294,26 @@ with abas[0]:
         elif not (df_unificado is not None or st.session_state.get("pdf_carregado")):
             st.error("Nenhum arquivo carregado! Faça upload primeiro.")
         else:
-            with st.spinner("Analisando sua pergunta..."):
-                try:
-                    resposta = manager.gerar_resposta(user_input_limpo)
-                    st.session_state["past"].append(user_input_limpo)
-                    st.session_state["generated"].append(resposta)
-                except Exception as e:
-                    st.error(f"Erro ao processar: {e}")
-                    logger.error(f"Erro: {e}")
+            try:
+                # 🌊 Resposta exibida conforme o Gemini gera; a resposta rápida (prazo
+                # esgotado) fica na tela até o primeiro pedaço da resposta completa
+                with st.chat_message("assistant", avatar="👨‍💼"):
+                    area_resposta = st.empty()
+                    resposta, rapida = "", ""
+                    for pedaco in manager.gerar_resposta_stream(user_input_limpo):
+                        if isinstance(pedaco, RespostaRapida):
+                            rapida = pedaco
+                            area_resposta.markdown(rapida)
+                            continue
+                        resposta += pedaco
+                        area_resposta.markdown(resposta + "▌")
+                    resposta = resposta or rapida
+                    area_resposta.markdown(resposta)
+                st.session_state["past"].append(user_input_limpo)
+                st.session_state["generated"].append(resposta)
+            except Exception as e:
+                st.error(f"Erro ao processar: {e}")
+                logger.error(f"Erro: {e}")
             st.rerun()
 
 # ABA 1: HISTÓRICO
@@ -524,7 +540,8 @@ with abas[2]:
                         "pdf_list": st.session_state.get("pdf_list", []),
                     }
                     
-                    # Gera PDF usando o módulo externo
+                    # Gera PDF usando o módulo externo (reportlab só é importado aqui)
+                    from gerar_pdf import gerar_relatorio_pdf
                     pdf_bytes = gerar_relatorio_pdf(dados)
                     
                     # Botão de download
@@ -592,6 +609,7 @@ with abas[3]:
         st.markdown("---")
         
         # Seu código existente
+        from visualizacao.interface import exibir_visualizacao
         exibir_visualizacao(df_unificado)
     else:
         st.warning("📭 Nenhum dado carregado. Faça upload na aba 'Dados & Chat'.")
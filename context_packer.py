@@ -0,0 +1,145 @@
+# context_packer.py - EMPACOTADOR DE CONTEXTO COM ORÇAMENTO DE TOKENS
+"""
+Empacotador de contexto do ChatFiscal
+
+Monta o contexto enviado à LLM (trechos de PDF, conversas anteriores)
+dentro de um orçamento fixo de tokens:
+- Remove trechos duplicados ou contidos em outros
+- Corta a sobreposição entre chunks vizinhos (chunk_overlap)
+- Ordena por relevância (ordem da busca ou termos em comum com a pergunta)
+- Preenche o orçamento, truncando o último trecho se necessário
+
+Assim o tamanho do prompt deixa de crescer com o número de PDFs.
+"""
+
+import os
+import logging
+from typing import Dict, List, Optional
+
+from lexical_index import tokenizar
+
+logger = logging.getLogger(__name__)
+
+ORCAMENTO_PDF = int(os.getenv("CHATFISCAL_ORCAMENTO_PDF", "2500"))
+ORCAMENTO_MEMORIA = int(os.getenv("CHATFISCAL_ORCAMENTO_MEMORIA", "400"))
+
+# Sobreposição mínima/máxima (caracteres) considerada entre chunks vizinhos
+SOBREPOSICAO_MIN = 30
+SOBREPOSICAO_MAX = 400
+
+# Fim de um trecho truncado para caber no orçamento
+MARCA_CORTE = " [...]"
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa rápida de tokens (~4 caracteres por token em português)."""
+    return (len(texto) + 3) // 4
+
+
+def dividir_passagens(texto: str, origem: str = "", tamanho: int = 1000) -> List[Dict[str, str]]:
+    """Quebra um texto longo em passagens por parágrafo, com até ~`tamanho` caracteres."""
+    passagens, atual = [], ""
+    for paragrafo in texto.split("\n"):
+        if atual and len(atual) + len(paragrafo) > tamanho:
+            passagens.append({"texto": atual, "origem": origem})
+            atual = ""
+        atual = f"{atual}\n{paragrafo}" if atual else paragrafo
+    if atual.strip():
+        passagens.append({"texto": atual, "origem": origem})
+    return passagens
+
+
+def _cortar_sobreposicao(texto: str, anterior: str) -> str:
+    """Remove do início de `texto` o trecho que repete o final de `anterior` (e vice-versa)."""
+    limite = min(SOBREPOSICAO_MAX, len(texto), len(anterior))
+    for k in range(limite, SOBREPOSICAO_MIN - 1, -1):
+        if anterior.endswith(texto[:k]):
+            return texto[k:]
+        if anterior.startswith(texto[-k:]):
+            return texto[:-k]
+    return texto
+
+
+def _relevancia(texto: str, termos_pergunta: set) -> float:
+    """Fração dos termos da pergunta presentes na passagem."""
+    if not termos_pergunta:
+        return 0.0
+    return len(termos_pergunta & set(tokenizar(texto))) / len(termos_pergunta)
+
+
+def empacotar_contexto(passagens: List[Dict[str, str]], orcamento_tokens: int = ORCAMENTO_PDF,
+                       pergunta: Optional[str] = None, separador: str = "\n\n") -> str:
+    """
+    Monta o contexto dentro do orçamento de tokens.
+
+    Args:
+        passagens: Lista de {"texto", "origem"} na ordem de relevância da busca
+        orcamento_tokens: Máximo de tokens (estimados) do contexto final
+        pergunta: Se informada, reordena as passagens pelos termos em comum com ela
+        separador: Texto entre passagens
+
+    Returns:
+        Contexto pronto para o prompt, com "[origem]" antes dos trechos de cada fonte
+    """
+    if pergunta:
+        termos = set(tokenizar(pergunta))
+        passagens = sorted(passagens, key=lambda p: _relevancia(p["texto"], termos), reverse=True)
+
+    selecionadas: List[Dict[str, str]] = []
+    tokens_originais = 0
+    # estimar_tokens(contexto) <= orçamento  ⇔  len(contexto) <= 4 × orçamento
+    limite = orcamento_tokens * 4
+    tamanho = 0
+    origem_atual = None
+
+    for passagem in passagens:
+        texto = passagem["texto"].strip()
+        origem = passagem.get("origem", "")
+        tokens_originais += estimar_tokens(texto)
+
+        # Duplicatas, trechos contidos em outros e sobreposição de chunks vizinhos
+        for anterior in selecionadas:
+            if anterior["origem"] != origem:
+                continue
+            if texto in anterior["texto"]:
+                texto = ""
+                break
+            texto = _cortar_sobreposicao(texto, anterior["texto"]).strip()
+        if not texto:
+            continue
+
+        # Separador e "[origem]" também ocupam o orçamento
+        novo_cabecalho = bool(origem) and origem != origem_atual
+        prefixo = (separador if selecionadas else "") + (f"[{origem}]{separador}" if novo_cabecalho else "")
+        restante = limite - tamanho - len(prefixo)
+        if len(texto) > restante:
+            if restante < 200:
+                break
+            texto = texto[:restante - len(MARCA_CORTE)].rsplit(" ", 1)[0] + MARCA_CORTE
+
+        selecionadas.append({"texto": texto, "origem": origem})
+        tamanho += len(prefixo) + len(texto)
+        if novo_cabecalho:
+            origem_atual = origem
+        if tamanho >= limite:
+            break
+
+    partes, origem_atual = [], None
+    for passagem in selecionadas:
+        if passagem["origem"] and passagem["origem"] != origem_atual:
+            partes.append(f"[{passagem['origem']}]")
+            origem_atual = passagem["origem"]
+        partes.append(passagem["texto"])
+    contexto = separador.join(partes)
+    usados = estimar_tokens(contexto)
+
+    logger.info(f"📦 Contexto empacotado: ~{usados} tokens (de ~{tokens_originais}) em {len(selecionadas)} trechos")
+    return contexto
+
+
+def empacotar_memoria(contexto_memoria: str, orcamento_tokens: int = ORCAMENTO_MEMORIA) -> str:
+    """Empacota o contexto de conversas anteriores (blocos separados por linha em branco)."""
+    if not contexto_memoria:
+        return ""
+    blocos = [{"texto": bloco, "origem": ""} for bloco in contexto_memoria.split("\n\n") if bloco.strip()]
+    return empacotar_contexto(blocos, orcamento_tokens)
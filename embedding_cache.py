@@ -0,0 +1,222 @@
+# embedding_cache.py - CACHE DE EMBEDDINGS DOS CHUNKS DE PDF
+"""
+Cache de embeddings do ChatFiscal
+
+Evita recalcular os vetores de chunks já vistos (ex: o mesmo contrato
+enviado novamente). Estrutura em disco, por modelo:
+- vetores.f32      → matriz float32 (linhas × dimensão), lida via np.memmap
+- indice.json      → hash do conteúdo do chunk → linha da matriz (compactado)
+- indice.json.log  → uma linha por lote acrescentado depois da compactação
+
+Chunks inéditos são codificados em lotes de tamanho configurável, um lote
+por vez (o modelo compartilhado já usa as threads de CPU do PyTorch), fora
+do lock: uploads de sessões diferentes codificam ao mesmo tempo.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Lotes no log do índice antes de regravar o indice.json inteiro
+LOTES_POR_COMPACTACAO = 256
+
+
+class EmbeddingsComCache(Embeddings):
+    """
+    ♻️ Embeddings com cache persistente hash(conteúdo) → vetor.
+
+    Mantém a interface do LangChain, podendo ser passado direto para
+    FAISS.from_documents. Consultas (embed_query) não são cacheadas.
+    """
+
+    def __init__(self, base: Embeddings, cache_dir: str = "vectorstore/embeddings_cache",
+                 tamanho_lote: Optional[int] = None):
+        """
+        Inicializa o cache.
+
+        Args:
+            base: Embeddings reais (ex: handle compartilhado do registro)
+            cache_dir: Diretório raiz do cache (um subdiretório por modelo)
+            tamanho_lote: Chunks por lote de codificação (padrão: CHATFISCAL_EMBED_LOTE ou 64)
+        """
+        self.base = base
+        self.tamanho_lote = tamanho_lote or int(os.getenv("CHATFISCAL_EMBED_LOTE", "64"))
+
+        modelo = getattr(base, "model_name", type(base).__name__)
+        # Nome do modelo cujos vetores este diretório guarda (o base pode cair no fallback depois)
+        self._nome_no_cache = getattr(base, "model_name", None) or self.nome
+        self.cache_dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", modelo))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.vetores_path = os.path.join(self.cache_dir, "vetores.f32")
+        self.indice_path = os.path.join(self.cache_dir, "indice.json")
+        self.log_path = f"{self.indice_path}.log"
+
+        self.linhas: Dict[str, int] = {}
+        self.dimensao: Optional[int] = None
+        self.lotes_no_log = 0
+        self._memmap: Optional[np.memmap] = None
+        self.lock = threading.Lock()
+
+        self._carregar_indice()
+        logger.info(f"✅ Cache de embeddings: {len(self.linhas)} vetores em {self.cache_dir}")
+
+    @property
+    def nome(self) -> str:
+        """Modelo que gera os vetores (o do embeddings base)."""
+        return getattr(self.base, "nome", getattr(self.base, "model_name", type(self.base).__name__))
+
+    @staticmethod
+    def hash_texto(texto: str) -> str:
+        """Chave do cache: hash do conteúdo do chunk."""
+        return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de chunks: reaproveita o cache e codifica só os inéditos, em lotes."""
+        if not texts:
+            return []
+        if self.nome != self._nome_no_cache:
+            # Base caiu no fallback depois da criação: vetores de outro modelo não entram neste cache
+            return self.base.embed_documents(texts)
+
+        chaves = [self.hash_texto(t) for t in texts]
+
+        with self.lock:
+            pendentes: Dict[str, str] = {}
+            for chave, texto in zip(chaves, texts):
+                if chave not in self.linhas:
+                    pendentes.setdefault(chave, texto)
+
+        if pendentes:
+            # Codificação fora do lock; outra sessão pode ter gravado alguns enquanto isso
+            novos = self._codificar_em_lotes(list(pendentes.values()))
+            chaves_pendentes = list(pendentes)
+            with self.lock:
+                faltando = [i for i, chave in enumerate(chaves_pendentes) if chave not in self.linhas]
+                if faltando:
+                    self._anexar([chaves_pendentes[i] for i in faltando], novos[faltando])
+
+        with self.lock:
+            matriz = self._matriz()
+            resultado = np.array(matriz[[self.linhas[c] for c in chaves]])
+
+        logger.info(f"♻️ Embeddings: {len(texts) - len(pendentes)} do cache, {len(pendentes)} calculados")
+        return resultado.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embedding de consulta (sem cache)."""
+        return self.base.embed_query(text)
+
+    def carregar(self) -> None:
+        """Carrega agora o modelo do embeddings base (se ele carregar sob demanda)."""
+        carregar = getattr(self.base, "carregar", None)
+        if carregar is not None:
+            carregar()
+
+    def __len__(self) -> int:
+        return len(self.linhas)
+
+    def _codificar_em_lotes(self, textos: List[str]) -> np.ndarray:
+        """Codifica textos em lotes de `tamanho_lote`, em sequência."""
+        lotes = [textos[i:i + self.tamanho_lote] for i in range(0, len(textos), self.tamanho_lote)]
+        vetores: List[List[float]] = []
+        for lote in lotes:
+            vetores.extend(self.base.embed_documents(lote))
+        return np.asarray(vetores, dtype="float32")
+
+    def _matriz(self) -> np.memmap:
+        """Matriz de vetores mapeada em memória (reaberta quando cresce)."""
+        total = os.path.getsize(self.vetores_path) // (4 * self.dimensao)
+        if self._memmap is None or self._memmap.shape[0] != total:
+            self._memmap = np.memmap(self.vetores_path, dtype="float32", mode="r", shape=(total, self.dimensao))
+        return self._memmap
+
+    def _anexar(self, chaves: List[str], vetores: np.ndarray) -> None:
+        """Acrescenta vetores ao final da matriz e uma linha ao log do índice (chamado com o lock)."""
+        if self.dimensao is None:
+            self.dimensao = int(vetores.shape[1])
+
+        # Libera o mapeamento antes de crescer o arquivo (necessário no Windows)
+        self._memmap = None
+
+        primeira_linha = 0
+        if os.path.exists(self.vetores_path):
+            primeira_linha = os.path.getsize(self.vetores_path) // (4 * self.dimensao)
+
+        with open(self.vetores_path, "ab") as f:
+            f.write(np.ascontiguousarray(vetores, dtype="float32").tobytes())
+
+        novas = {chave: primeira_linha + i for i, chave in enumerate(chaves)}
+        self.linhas.update(novas)
+
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"dimensao": self.dimensao, "linhas": novas}) + "\n")
+            self.lotes_no_log += 1
+        except Exception as e:
+            logger.error(f"❌ Erro ao salvar índice do cache de embeddings: {e}")
+            return
+
+        if self.lotes_no_log >= LOTES_POR_COMPACTACAO:
+            self._compactar_indice()
+
+    def _compactar_indice(self) -> None:
+        """Grava o índice inteiro de forma atômica (temporário + replace) e esvazia o log."""
+        try:
+            temp_path = f"{self.indice_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"dimensao": self.dimensao, "linhas": self.linhas}, f)
+            os.replace(temp_path, self.indice_path)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self.lotes_no_log = 0
+        except Exception as e:
+            logger.error(f"❌ Erro ao compactar índice do cache de embeddings: {e}")
+
+    def _carregar_indice(self) -> None:
+        """Carrega o índice hash → linha e reaplica o log, descartando linhas além do fim da matriz."""
+        if not os.path.exists(self.vetores_path):
+            return
+
+        try:
+            linhas: Dict[str, int] = {}
+            if os.path.exists(self.indice_path):
+                with open(self.indice_path, "r", encoding="utf-8") as f:
+                    dados = json.load(f)
+                self.dimensao = dados["dimensao"]
+                linhas.update(dados["linhas"])
+
+            truncado = False
+            if os.path.exists(self.log_path):
+                with open(self.log_path, "r", encoding="utf-8") as f:
+                    for linha in f:
+                        try:
+                            lote = json.loads(linha)
+                        except json.JSONDecodeError:
+                            # Última linha truncada por uma queda no meio da escrita
+                            truncado = True
+                            continue
+                        self.dimensao = lote["dimensao"]
+                        linhas.update(lote["linhas"])
+                        self.lotes_no_log += 1
+
+            if self.dimensao is None:
+                return
+            total = os.path.getsize(self.vetores_path) // (4 * self.dimensao)
+            self.linhas = {c: l for c, l in linhas.items() if l < total}
+            if truncado:
+                # Regrava sem a linha quebrada: o próximo lote não pode continuá-la
+                self._compactar_indice()
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao carregar cache de embeddings: {e}")
+            self.linhas = {}
+            self.dimensao = None
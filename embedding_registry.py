@@ -0,0 +1,202 @@
+# embedding_registry.py - REGISTRO COMPARTILHADO DE MODELOS DE EMBEDDINGS
+"""
+Registro de modelos de embeddings do ChatFiscal
+
+Carrega cada modelo UMA única vez por processo (st.cache_resource) e entrega
+handles compartilhados e thread-safe para AgentManager e MemoriaInteligente,
+evitando múltiplas cópias do all-MiniLM-L6-v2 na memória. O carregamento
+acontece na primeira embedding, fora da inicialização do app.
+
+Backends (CHATFISCAL_BACKEND_EMBEDDINGS ou argumento `backend`):
+- "huggingface" (padrão): sentence-transformers, baixado do HuggingFace Hub
+- "hashing": EmbeddingsHashing, determinístico e sem download (máquinas sem
+  rede, testes de vazão reprodutíveis)
+Outros backends entram com registrar_backend_embeddings.
+"""
+
+import os
+import zlib
+import logging
+import threading
+import importlib.util
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from lexical_index import tokenizar
+
+logger = logging.getLogger(__name__)
+
+MODELO_PADRAO = "sentence-transformers/all-MiniLM-L6-v2"
+BACKEND_PADRAO = os.getenv("CHATFISCAL_BACKEND_EMBEDDINGS", "huggingface")
+
+try:
+    import streamlit as st
+    _cache_resource = st.cache_resource(show_spinner=False)
+except ImportError:
+    import functools
+    _cache_resource = functools.lru_cache(maxsize=None)
+
+# Garante um único carregamento mesmo com sessões concorrentes
+_lock_registro = threading.Lock()
+
+
+class EmbeddingsCompartilhados(Embeddings):
+    """
+    Handle thread-safe sobre um modelo de embeddings compartilhado pelo processo.
+
+    O modelo (torch + sentence-transformers, alguns segundos) só é carregado na
+    primeira embedding, não na criação do handle: a primeira tela do app não espera.
+    O lock cobre só o carregamento; as embeddings rodam em paralelo.
+
+    Se o carregamento falhar (sem rede para baixar o modelo, torch ausente...),
+    a falha é lembrada e o handle passa a usar EmbeddingsHashing, sem tentar de
+    novo a cada chamada. `nome` muda junto: quem guarda vetores compara o nome
+    para reindexar.
+    """
+
+    def __init__(self, model_name: str, device: str):
+        self.model_name = model_name
+        self.device = device
+        self.falha_carregamento: Optional[str] = None
+        self._modelo: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def nome(self) -> str:
+        if self.falha_carregamento is not None:
+            return self._modelo.nome
+        return self.model_name
+
+    @property
+    def carregado(self) -> bool:
+        return self._modelo is not None
+
+    def carregar(self) -> Embeddings:
+        """Carrega o modelo agora (ou cai no fallback) em vez de na primeira embedding."""
+        modelo = self._modelo
+        if modelo is not None:
+            return modelo
+        with self._lock:
+            if self._modelo is None:
+                try:
+                    self._modelo = _carregar_modelo(self.model_name, self.device)
+                except Exception as e:
+                    logger.error(f"❌ Falha ao carregar {self.model_name}: {e}")
+                    logger.warning("⚠️ Fallback para embeddings por hashing de n-gramas")
+                    self._modelo = EmbeddingsHashing()
+                    self.falha_carregamento = str(e)
+            return self._modelo
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings para múltiplos textos."""
+        return self.carregar().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embedding de uma consulta."""
+        return self.carregar().embed_query(text)
+
+
+@_cache_resource
+def _carregar_modelo(model_name: str, device: str) -> Embeddings:
+    """Carrega o modelo HuggingFace (executado uma vez por combinação nome/dispositivo)."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    modelo = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': device},
+        encode_kwargs={'normalize_embeddings': False}
+    )
+    logger.info(f"✅ Modelo de embeddings carregado: {model_name} ({device})")
+    return modelo
+
+
+class EmbeddingsHashing(Embeddings):
+    """
+    Embeddings determinísticos e rápidos, sem modelo: fallback quando o
+    HuggingFace não está disponível e backend "hashing" (testes de carga offline).
+    
+    Hashing trick sobre palavras e n-gramas de caracteres (crc32, não hash(),
+    que muda a cada processo): o mesmo texto gera o mesmo vetor após reiniciar,
+    e grafias parecidas ("nota fiscal" / "notas fiscais") ficam próximas.
+    """
+    
+    def __init__(self, dimensao: int = 256, ngramas: Tuple[int, ...] = (3, 4)):
+        self.dimensao = dimensao
+        self.ngramas = ngramas
+    
+    @property
+    def nome(self) -> str:
+        return f"hashing-{self.dimensao}"
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Vetor normalizado do texto."""
+        return self._vetor(text).tolist()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings para múltiplos textos."""
+        return [self._vetor(text).tolist() for text in texts]
+    
+    def _vetor(self, texto: str) -> np.ndarray:
+        palavras = tokenizar(texto)
+        normalizado = f" {' '.join(palavras)} "
+        itens = palavras + [normalizado[i:i + n] for n in self.ngramas for i in range(len(normalizado) - n + 1)]
+        
+        vetor = np.zeros(self.dimensao, dtype="float32")
+        if not itens:
+            return vetor
+        hashes = np.fromiter((zlib.crc32(item.encode("utf-8")) for item in itens), dtype=np.uint32, count=len(itens))
+        sinais = np.where(hashes & 0x80000000, -1.0, 1.0)
+        vetor += np.bincount(hashes % self.dimensao, weights=sinais, minlength=self.dimensao).astype("float32")
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+
+# ══════════════════════════════════════════════════════════════════
+# 🔌 BACKENDS
+# ══════════════════════════════════════════════════════════════════
+def _criar_huggingface(model_name: str, device: str) -> Embeddings:
+    if importlib.util.find_spec("langchain_huggingface") is None:
+        raise ImportError("langchain_huggingface não está instalado")
+    return EmbeddingsCompartilhados(model_name, device)
+
+
+_backends: Dict[str, Callable[[str, str], Embeddings]] = {
+    "huggingface": _criar_huggingface,
+    "hashing": lambda model_name, device: EmbeddingsHashing(),
+}
+
+_handles: Dict[Tuple[str, str, str], Embeddings] = {}
+
+
+def registrar_backend_embeddings(nome: str, fabrica: Callable[[str, str], Embeddings]) -> None:
+    """Registra um backend: fabrica(model_name, device) → Embeddings (chamada uma vez por combinação)."""
+    with _lock_registro:
+        _backends[nome] = fabrica
+
+
+def obter_embeddings(model_name: str = MODELO_PADRAO, device: str = "cpu",
+                     backend: Optional[str] = None) -> Embeddings:
+    """
+    Retorna o handle compartilhado de embeddings do backend.
+
+    No backend "huggingface" o modelo é carregado na primeira embedding.
+
+    Args:
+        model_name: Modelo (ignorado por backends sem modelo, como "hashing")
+        device: Dispositivo do modelo
+        backend: Nome do backend (padrão: CHATFISCAL_BACKEND_EMBEDDINGS ou "huggingface")
+
+    Raises:
+        ImportError: langchain_huggingface não instalado (quem chama cai no fallback na hora)
+        ValueError: Backend desconhecido
+    """
+    backend = backend or BACKEND_PADRAO
+    with _lock_registro:
+        if backend not in _backends:
+            raise ValueError(f"Backend de embeddings desconhecido: {backend} (disponíveis: {', '.join(_backends)})")
+        chave = (backend, model_name, device)
+        if chave not in _handles:
+            _handles[chave] = _backends[backend](model_name, device)
+        return _handles[chave]
@@ -2,10 +2,6 @@
 
 import pandas as pd
 import xml.etree.ElementTree as ET
-from PyPDF2 import PdfReader
-import pytesseract
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-from PIL import Image
 import logging
 
 
@@ -342,6 +338,7 @@ class FileReader:
     @staticmethod
     def carregar_pdf(arquivo):
         try:
+            from PyPDF2 import PdfReader
             reader = PdfReader(arquivo)
             texto = "".join(page.extract_text() or "" for page in reader.pages)
             return texto
@@ -351,6 +348,10 @@ class FileReader:
     @staticmethod
     def carregar_imagem_com_ocr(arquivo):
         try:
+            # OCR só quando chega uma imagem (pytesseract e PIL ficam fora da abertura do app)
+            import pytesseract
+            from PIL import Image
+            pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
             img = Image.open(arquivo)
             return pytesseract.image_to_string(img, lang="por")
         except Exception as e:
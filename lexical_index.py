@@ -0,0 +1,98 @@
+# lexical_index.py - ÍNDICE LÉXICO (BM25) PARA CÓDIGOS FISCAIS
+"""
+Índice léxico invertido (BM25) do ChatFiscal
+
+Embeddings densos representam mal tokens exatos como CNPJ, CFOP, NCM e
+chaves de acesso. Este índice invertido resolve esses termos por
+correspondência exata e é combinado à busca vetorial (FAISS) por
+Reciprocal Rank Fusion em `pdf_index.IndicePDF`.
+
+Códigos formatados ("12.345.678/0001-90", chave de acesso em grupos de 4
+dígitos) também são indexados na forma só com dígitos, então a pergunta
+encontra o chunk com ou sem pontuação.
+"""
+
+import re
+import math
+import heapq
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Números com separadores (. / - espaço) que formam um código de 8+ dígitos
+_PADRAO_CODIGO = re.compile(r"\d[\d./\- ]{6,}\d")
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Tokens em minúsculas e sem acentos + códigos numéricos compactados."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+    tokens = re.findall(r"\w+", texto)
+    for trecho in _PADRAO_CODIGO.findall(texto):
+        digitos = re.sub(r"\D", "", trecho)
+        if len(digitos) >= 8:
+            tokens.append(digitos)
+    return tokens
+
+
+class IndiceBM25:
+    """
+    🔎 Índice invertido com ranqueamento BM25, construído incrementalmente.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.ids: List[str] = []
+        self.doc_ids: List[str] = []
+        self.tamanhos: List[int] = []
+        self._soma_tamanhos = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def adicionar(self, ids: List[str], textos: List[str], doc_id: str) -> None:
+        """Indexa chunks (id do chunk no docstore + texto) de um documento."""
+        for id_chunk, texto in zip(ids, textos):
+            pos = len(self.ids)
+            frequencias = Counter(tokenizar(texto))
+            for termo, tf in frequencias.items():
+                self.postings[termo][pos] = tf
+
+            tamanho = sum(frequencias.values())
+            self.ids.append(id_chunk)
+            self.doc_ids.append(doc_id)
+            self.tamanhos.append(tamanho)
+            self._soma_tamanhos += tamanho
+
+    def buscar(self, consulta: str, k: int = 5,
+               doc_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Top-k (id_chunk, score BM25) para a consulta, opcionalmente restrito a doc_ids."""
+        if not self.ids:
+            return []
+
+        filtro = set(doc_ids) if doc_ids else None
+        total = len(self.ids)
+        media = self._soma_tamanhos / total or 1.0
+
+        scores: Dict[int, float] = defaultdict(float)
+        for termo in set(tokenizar(consulta)):
+            postings = self.postings.get(termo)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for pos, tf in postings.items():
+                if filtro is not None and self.doc_ids[pos] not in filtro:
+                    continue
+                norma = self.k1 * (1 - self.b + self.b * self.tamanhos[pos] / media)
+                scores[pos] += idf * tf * (self.k1 + 1) / (tf + norma)
+
+        melhores = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.ids[pos], score) for pos, score in melhores]
+
+    def limpar(self) -> None:
+        """Remove todos os chunks do índice."""
+        self.__init__(self.k1, self.b)
@@ -0,0 +1,275 @@
+# llm_client.py - CLIENTE ASSÍNCRONO DO LLM
+"""
+Cliente assíncrono das chamadas ao LLM do ChatFiscal
+
+Todas as sessões do Streamlit compartilham o mesmo LLMInteligente; as
+chamadas passam por aqui:
+- Um event loop asyncio próprio, em uma thread daemon (o script do
+  Streamlit é síncrono e cada sessão roda em sua thread)
+- Semáforo global: no máximo N chamadas simultâneas ao Gemini no processo
+- Timeout por chamada
+- Coalescência: prompts idênticos em andamento compartilham UMA chamada
+- Telemetria por modo: espera na fila, latência, tokens e erros de cada chamada
+"""
+
+import os
+import queue
+import asyncio
+import threading
+import logging
+from typing import Any, Dict, Iterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from context_packer import estimar_tokens
+from telemetry import obter_telemetria
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCORRENTES = int(os.getenv("CHATFISCAL_LLM_CONCORRENCIA", "4"))
+TIMEOUT_SEGUNDOS = float(os.getenv("CHATFISCAL_LLM_TIMEOUT", "60"))
+
+_FIM = object()
+
+# Gerado por `transmitir` quando o primeiro pedaço não chega dentro do prazo
+PRAZO_ESGOTADO = object()
+
+
+class ContadorTokens(BaseCallbackHandler):
+    """
+    Conta os tokens do prompt e da resposta de cada chamada ao modelo.
+
+    Usa o usage_metadata devolvido pelo Gemini; sem ele (modelos falsos,
+    respostas sem metadados), a estimativa de ~4 caracteres por token.
+    """
+
+    run_inline = True
+
+    def __init__(self, modo: str):
+        self.modo = modo
+        self._prompts: Dict[Any, int] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._prompts[run_id] = sum(estimar_tokens(str(m.content)) for lista in messages for m in lista)
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        prompt_estimado = self._prompts.pop(run_id, 0)
+        usos = [getattr(getattr(g, "message", None), "usage_metadata", None)
+                for geracoes in response.generations for g in geracoes]
+        if usos and all(usos):
+            prompt = sum(u["input_tokens"] for u in usos)
+            resposta = sum(u["output_tokens"] for u in usos)
+        else:
+            prompt = prompt_estimado
+            resposta = sum(estimar_tokens(g.text) for geracoes in response.generations for g in geracoes)
+
+        telemetria = obter_telemetria()
+        telemetria.contar("llm_tokens", prompt, modo=self.modo, tipo="prompt")
+        telemetria.contar("llm_tokens", resposta, modo=self.modo, tipo="resposta")
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._prompts.pop(run_id, None)
+
+
+class ClienteLLMAssincrono:
+    """
+    ⚡ Executa cadeias LangChain (ainvoke/astream) com limite de concorrência,
+    timeout e coalescência de prompts idênticos.
+
+    Os métodos síncronos (executar, transmitir) podem ser chamados de qualquer
+    thread; o trabalho assíncrono roda no loop interno.
+    """
+
+    def __init__(self, max_concorrentes: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        Args:
+            max_concorrentes: Chamadas simultâneas ao LLM (padrão: CHATFISCAL_LLM_CONCORRENCIA)
+            timeout: Segundos por chamada (padrão: CHATFISCAL_LLM_TIMEOUT)
+        """
+        self.max_concorrentes = max_concorrentes or MAX_CONCORRENTES
+        self.timeout = timeout or TIMEOUT_SEGUNDOS
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="chatfiscal-llm", daemon=True)
+        self._thread.start()
+        self._semaforo = asyncio.Semaphore(self.max_concorrentes)
+
+        # chave → Task da chamada em andamento (acessado só dentro do loop)
+        self._em_andamento: Dict[str, asyncio.Task] = {}
+
+        self.chamadas = 0
+        self.coalescidas = 0
+        self.timeouts = 0
+        self.ativas = 0
+        self.pico_ativas = 0
+
+        logger.info(f"⚡ Cliente LLM assíncrono: até {self.max_concorrentes} chamadas, timeout {self.timeout:.0f}s")
+
+    # ═══════════════════════════════════════════════════════════
+    # API SÍNCRONA (threads do Streamlit)
+    # ═══════════════════════════════════════════════════════════
+
+    def executar(self, chain, entradas: Dict[str, Any], chave: Optional[str] = None,
+                 modo: str = "outro") -> Any:
+        """
+        Executa chain.ainvoke(entradas) no loop interno e espera o resultado.
+
+        Args:
+            chain: Runnable LangChain
+            entradas: Entradas da cadeia
+            chave: Identifica o prompt; chamadas simultâneas com a mesma chave
+                   compartilham o resultado (None: sem coalescência)
+            modo: Rótulo da telemetria (csv, pdf, consolidada)
+
+        Raises:
+            TimeoutError: O LLM não respondeu dentro do timeout
+        """
+        futuro = asyncio.run_coroutine_threadsafe(self.executar_async(chain, entradas, chave, modo), self._loop)
+        return futuro.result()
+
+    def transmitir(self, chain, entradas: Dict[str, Any], modo: str = "outro",
+                   prazo_primeiro_pedaco: Optional[float] = None) -> Iterator[Any]:
+        """
+        Gera os pedaços de chain.astream(entradas) conforme chegam.
+
+        Ocupa uma vaga do semáforo durante todo o streaming; o timeout vale para
+        a resposta inteira. Parar de consumir libera a vaga. Sem coalescência:
+        cada consumidor precisa dos próprios pedaços.
+
+        Args:
+            prazo_primeiro_pedaco: Segundos de espera pelo primeiro pedaço; esgotado,
+                gera uma vez PRAZO_ESGOTADO e continua esperando (até o timeout)
+        """
+        fila: "queue.Queue[Any]" = queue.Queue()
+        futuro = asyncio.run_coroutine_threadsafe(self._produzir(chain, entradas, fila, modo), self._loop)
+        try:
+            espera = prazo_primeiro_pedaco or None
+            while True:
+                try:
+                    item = fila.get(timeout=espera)
+                except queue.Empty:
+                    espera = None
+                    yield PRAZO_ESGOTADO
+                    continue
+                espera = None
+                if item is _FIM:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            futuro.cancel()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Contadores de chamadas, coalescências, timeouts e concorrência"""
+        return {
+            "chamadas": self.chamadas,
+            "coalescidas": self.coalescidas,
+            "timeouts": self.timeouts,
+            "ativas": self.ativas,
+            "pico_ativas": self.pico_ativas,
+            "max_concorrentes": self.max_concorrentes,
+            "timeout_segundos": self.timeout
+        }
+
+    # ═══════════════════════════════════════════════════════════
+    # API ASSÍNCRONA (dentro do loop)
+    # ═══════════════════════════════════════════════════════════
+
+    async def executar_async(self, chain, entradas: Dict[str, Any], chave: Optional[str] = None,
+                             modo: str = "outro") -> Any:
+        """Versão assíncrona de `executar` (deve rodar no loop do cliente)."""
+        if chave is None:
+            return await self._chamar(chain, entradas, modo)
+
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is not None:
+            self.coalescidas += 1
+            logger.info("🔗 Prompt idêntico em andamento: aguardando a mesma chamada")
+        else:
+            tarefa = self._loop.create_task(self._chamar(chain, entradas, modo))
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda _: self._em_andamento.pop(chave, None))
+
+        # shield: um consumidor cancelado não cancela a chamada dos demais
+        return await asyncio.shield(tarefa)
+
+    async def _chamar(self, chain, entradas: Dict[str, Any], modo: str = "outro") -> Any:
+        """Uma chamada ao LLM: vaga no semáforo + timeout."""
+        telemetria = obter_telemetria()
+        chegada = self._loop.time()
+        async with self._semaforo:
+            telemetria.observar("llm_fila", self._loop.time() - chegada, modo=modo)
+            self._entrar()
+            try:
+                with telemetria.medir("llm", modo=modo):
+                    configuracao = {"callbacks": [ContadorTokens(modo)]}
+                    return await asyncio.wait_for(chain.ainvoke(entradas, config=configuracao), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise TimeoutError(f"LLM não respondeu em {self.timeout:.0f}s")
+            finally:
+                self.ativas -= 1
+
+    async def _produzir(self, chain, entradas: Dict[str, Any], fila: "queue.Queue[Any]",
+                        modo: str = "outro") -> None:
+        """Coloca os pedaços do astream na fila (exceção, se houver, e depois _FIM)."""
+        telemetria = obter_telemetria()
+        chegada = self._loop.time()
+        try:
+            async with self._semaforo:
+                telemetria.observar("llm_fila", self._loop.time() - chegada, modo=modo)
+                self._entrar()
+                try:
+                    with telemetria.medir("llm", modo=modo):
+                        limite = self._loop.time() + self.timeout
+                        configuracao = {"callbacks": [ContadorTokens(modo)]}
+                        pedacos = chain.astream(entradas, config=configuracao).__aiter__()
+                        try:
+                            primeiro = True
+                            while True:
+                                try:
+                                    pedaco = await asyncio.wait_for(pedacos.__anext__(), limite - self._loop.time())
+                                except StopAsyncIteration:
+                                    break
+                                if primeiro:
+                                    telemetria.observar("llm_primeiro_pedaco", self._loop.time() - chegada, modo=modo)
+                                    primeiro = False
+                                fila.put(pedaco)
+                        finally:
+                            await pedacos.aclose()
+                finally:
+                    self.ativas -= 1
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            fila.put(TimeoutError(f"LLM não respondeu em {self.timeout:.0f}s"))
+        except Exception as e:
+            fila.put(e)
+        finally:
+            fila.put(_FIM)
+
+    def _entrar(self) -> None:
+        self.chamadas += 1
+        self.ativas += 1
+        self.pico_ativas = max(self.pico_ativas, self.ativas)
+
+
+# ══════════════════════════════════════════════════════════════════
+# 🔒 CLIENTE ÚNICO POR PROCESSO
+# ══════════════════════════════════════════════════════════════════
+_cliente: Optional[ClienteLLMAssincrono] = None
+_lock_cliente = threading.Lock()
+
+
+def obter_cliente_llm() -> ClienteLLMAssincrono:
+    """
+    Retorna o cliente assíncrono único do processo.
+
+    O semáforo só limita a concorrência (e a cota do Gemini) se todas as
+    sessões passarem pelo mesmo cliente.
+    """
+    global _cliente
+    with _lock_cliente:
+        if _cliente is None:
+            _cliente = ClienteLLMAssincrono()
+        return _cliente
@@ -0,0 +1,130 @@
+# llm_falso.py - LLM LOCAL FALSO PARA TESTES DE CARGA
+"""
+LLM local falso do ChatFiscal (backend "falso" do LLMInteligente)
+
+Substitui o Gemini em benchmarks e testes de vazão em máquinas sem rede:
+- Respostas prontas por palavra-chave da pergunta (ou uma resposta padrão)
+- Latência injetada: tempo até o primeiro token + tempo por token
+- Variação de latência determinística (derivada do prompt e da semente):
+  a mesma carga tem o mesmo tempo em qualquer execução
+- Cauda de latência: uma fração das chamadas bem mais lenta (fracao_lenta)
+- Streaming palavra a palavra e usage_metadata como o Gemini
+
+Configuração do backend: CHATFISCAL_LLM_FALSO_LATENCIA (segundos até o
+primeiro token, padrão 0.2) e CHATFISCAL_LLM_FALSO_POR_TOKEN (padrão 0).
+"""
+
+import os
+import re
+import time
+import zlib
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from context_packer import estimar_tokens
+
+RESPOSTA_PADRAO = "Resposta simulada do ChatFiscal: análise concluída com os dados fornecidos."
+
+
+class LLMFalso(BaseChatModel):
+    """
+    🧪 Chat model LangChain sem rede, com respostas prontas e latência controlada.
+
+    respostas: palavra-chave → resposta; vale a primeira contida na pergunta
+    (linha "PERGUNTA...: " da última mensagem, ou a mensagem inteira).
+    Sem correspondência: resposta_padrao.
+    """
+
+    respostas: Dict[str, str] = {}
+    resposta_padrao: str = RESPOSTA_PADRAO
+    latencia: float = float(os.getenv("CHATFISCAL_LLM_FALSO_LATENCIA", "0.2"))
+    latencia_por_token: float = float(os.getenv("CHATFISCAL_LLM_FALSO_POR_TOKEN", "0"))
+    variacao: float = 0.0
+    fracao_lenta: float = 0.0
+    latencia_lenta: float = 0.0
+    semente: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "chatfiscal-falso"
+
+    # ═══════════════════════════════════════════════════════════
+    # RESPOSTA E TEMPOS
+    # ═══════════════════════════════════════════════════════════
+
+    def _responder(self, messages: List[BaseMessage]) -> str:
+        texto = str(messages[-1].content).lower() if messages else ""
+        # Prompts do ChatFiscal ("PERGUNTA DO USUÁRIO: ..."): casa com a pergunta, não com dados ou instruções
+        linhas_pergunta = re.findall(r"^\W*pergunta(?: do usuário)?:(.*)$", texto, flags=re.MULTILINE)
+        if linhas_pergunta:
+            texto = linhas_pergunta[-1]
+        for chave, resposta in self.respostas.items():
+            if chave.lower() in texto:
+                return resposta
+        return self.resposta_padrao
+
+    def _atraso_inicial(self, messages: List[BaseMessage]) -> float:
+        """
+        Latência até o primeiro token. A variação (±variacao) e as chamadas lentas
+        (fracao_lenta delas levam latencia_lenta) dependem só do prompt e da semente.
+        """
+        if not self.variacao and not self.fracao_lenta:
+            return self.latencia
+        prompt = "\x1f".join(str(m.content) for m in messages)
+        if self.fracao_lenta and self._sorteio(f"lenta\x1f{prompt}") < self.fracao_lenta:
+            return self.latencia_lenta
+        return max(0.0, self.latencia * (1 + self.variacao * (2 * self._sorteio(prompt) - 1)))
+
+    def _sorteio(self, texto: str) -> float:
+        """Número em [0, 1] fixo para o texto e a semente"""
+        return zlib.crc32(f"{self.semente}\x1f{texto}".encode("utf-8")) / 0xFFFFFFFF
+
+    def _uso(self, messages: List[BaseMessage], resposta: str) -> Dict[str, int]:
+        entrada = sum(estimar_tokens(str(m.content)) for m in messages)
+        saida = estimar_tokens(resposta)
+        return {"input_tokens": entrada, "output_tokens": saida, "total_tokens": entrada + saida}
+
+    @staticmethod
+    def _palavras(resposta: str) -> List[str]:
+        palavras = resposta.split(" ")
+        return [palavras[0]] + [" " + p for p in palavras[1:]]
+
+    # ═══════════════════════════════════════════════════════════
+    # API DO BaseChatModel
+    # ═══════════════════════════════════════════════════════════
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        resposta = self._responder(messages)
+        time.sleep(self._atraso_inicial(messages) + self.latencia_por_token * estimar_tokens(resposta))
+        mensagem = AIMessage(content=resposta, usage_metadata=self._uso(messages, resposta))
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        resposta = self._responder(messages)
+        await asyncio.sleep(self._atraso_inicial(messages) + self.latencia_por_token * estimar_tokens(resposta))
+        mensagem = AIMessage(content=resposta, usage_metadata=self._uso(messages, resposta))
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        resposta = self._responder(messages)
+        time.sleep(self._atraso_inicial(messages))
+        for palavra in self._palavras(resposta):
+            time.sleep(self.latencia_por_token * estimar_tokens(palavra))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=palavra))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._uso(messages, resposta)))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        resposta = self._responder(messages)
+        await asyncio.sleep(self._atraso_inicial(messages))
+        for palavra in self._palavras(resposta):
+            await asyncio.sleep(self.latencia_por_token * estimar_tokens(palavra))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=palavra))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._uso(messages, resposta)))
@@ -4,16 +4,26 @@ import os
 import pandas as pd
 import logging
 import re
+import hashlib
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as PrazoEsgotado, wait
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 
 # ✨ IMPORTA MEMÓRIA INTELIGENTE
-from memory_module import MemoriaInteligente
+from memory_module import obter_memoria
+from response_cache import CacheRespostas, calcular_fingerprint, fingerprint_tabela
+from context_packer import empacotar_memoria, estimar_tokens
+from table_encoder import codificar_tabela, ORCAMENTO_TABELA
+from row_selector import selecionar_linhas
+from llm_client import obter_cliente_llm, PRAZO_ESGOTADO, MAX_CONCORRENTES
+from telemetry import obter_telemetria
+from quick_answer import gerar_resposta_rapida, PRAZO_RESPOSTA
 
 load_dotenv()
 
@@ -27,6 +37,176 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Maior trecho retido à espera do ">" de uma tag; além disso o "<" é tratado como texto
+LIMITE_TAG_HTML = 200
+
+# Respostas completas que seguem em segundo plano depois da resposta rápida.
+# O cliente LLM só atende MAX_CONCORRENTES chamadas por vez: mais threads só
+# esperariam no semáforo dele. As vagas limitam o trabalho acumulado (em
+# andamento + na fila) quando o LLM está lento.
+_executor_respostas = ThreadPoolExecutor(max_workers=MAX_CONCORRENTES, thread_name_prefix="chatfiscal-resposta")
+_vagas_respostas = threading.BoundedSemaphore(2 * MAX_CONCORRENTES)
+_respostas_pendentes = set()
+_lock_pendentes = threading.Lock()
+
+
+def remover_html_incremental(pedacos):
+    """
+    Remove tags HTML de um fluxo de pedaços de texto sem esperar o fim da resposta.
+    
+    Equivale a re.sub(r'<[^>]+>', '', texto).strip() sobre o texto completo: um
+    "<" ainda sem ">" fica retido até a tag fechar, e espaços no fim de um pedaço
+    só saem quando chega mais texto.
+    """
+    retido = ""
+    espacos = ""
+    inicio = True
+    
+    for pedaco in itertools.chain(pedacos, [None]):
+        fim = pedaco is None
+        retido += pedaco or ""
+        
+        abertura = retido.find("<", retido.rfind(">") + 1)
+        if not fim and abertura != -1 and len(retido) - abertura <= LIMITE_TAG_HTML:
+            texto, retido = retido[:abertura], retido[abertura:]
+        else:
+            texto, retido = retido, ""
+        
+        texto = espacos + re.sub(r'<[^>]+>', '', texto)
+        if inicio:
+            texto = texto.lstrip()
+        corpo = texto.rstrip()
+        espacos = texto[len(corpo):]
+        
+        if corpo:
+            inicio = False
+            yield corpo
+
+
+# ═══════════════════════════════════════════════════════════════
+# 📝 PROMPTS DO USUÁRIO POR MODO (montados uma vez em _criar_cadeias)
+# ═══════════════════════════════════════════════════════════════
+
+TEMPLATE_CSV = """
+{contexto_estrutural}
+
+📈 ESTATÍSTICAS:
+{estatisticas}
+
+📄 REGISTROS (uma linha por registro, colunas separadas por ";"; colunas sempre vazias omitidas):
+{dados_tabela}
+
+─────────────────────────
+🔍 PERGUNTA DO USUÁRIO: {pergunta}
+
+─────────────────────────
+INSTRUÇÕES CRÍTICAS:
+1. Use APENAS os registros acima para responder
+2. Cite valores EXATOS dos registros
+3. Se a pergunta menciona "prestador", "tomador", "emitente", "destinatário": busque nas colunas correspondentes (ou nos valores comuns)
+4. Para perguntas sobre valores: use as estatísticas e os registros
+5. Para perguntas sobre quantidade: use total_registros
+6. Responda de forma direta e natural
+7. NÃO invente dados - use apenas o que está nos registros
+8. Se não encontrar nos registros, diga claramente que o dado não está disponível
+"""
+
+TEMPLATE_PDF = """
+📄 CONTEXTO DO DOCUMENTO PDF
+─────────────────────────
+{contexto_pdf}
+
+─────────────────────────
+PERGUNTA: {pergunta}
+
+INSTRUÇÕES:
+- Use APENAS as informações do documento acima
+- Responda de forma direta
+- Não mencione "segundo o PDF" ou "no documento"
+- Se não encontrar, diga claramente
+- Sem tags HTML
+"""
+
+TEMPLATE_CONSOLIDADO = """
+📊 REGISTROS FISCAIS ELETRÔNICOS
+─────────────────────────
+{contexto_estrutural}
+
+Registros (colunas separadas por ";"):
+{dados_tabela}
+
+───────────────────────────
+📄 DOCUMENTOS FISCAIS (PDF)
+─────────────────────────
+{contexto_pdf}
+
+───────────────────────────
+PERGUNTA: {pergunta}
+
+INSTRUÇÕES:
+- Analise ambas as fontes
+- Responda de forma integrada
+- Cite origem apenas se houver discrepância
+- Sem tags HTML
+"""
+
+TEMPLATES_USUARIO = {
+    "csv": TEMPLATE_CSV,
+    "pdf": TEMPLATE_PDF,
+    "consolidada": TEMPLATE_CONSOLIDADO
+}
+
+
+# ══════════════════════════════════════════════════════════════════
+# 🔌 BACKENDS DO MODELO
+# ══════════════════════════════════════════════════════════════════
+BACKEND_LLM = os.getenv("CHATFISCAL_BACKEND_LLM", "gemini")
+
+
+def _criar_gemini():
+    # Importado aqui: o SDK do Gemini custa ~1,5s e só é preciso ao criar a instância
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    
+    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        logger.warning("⚠️ GOOGLE_API_KEY ou GEMINI_API_KEY não encontrada")
+
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.0-flash",
+        google_api_key=api_key,
+        temperature=0.3
+    )
+
+
+def _criar_falso():
+    from llm_falso import LLMFalso
+    return LLMFalso()
+
+
+_backends_llm: Dict[str, Callable[[], object]] = {
+    "gemini": _criar_gemini,
+    "falso": _criar_falso,
+}
+
+
+def registrar_backend_llm(nome: str, fabrica: Callable[[], object]) -> None:
+    """Registra um backend: fabrica() → chat model LangChain (com ainvoke/astream)."""
+    _backends_llm[nome] = fabrica
+
+
+def criar_modelo_llm(backend: Optional[str] = None):
+    """
+    Cria o chat model do backend (padrão: CHATFISCAL_BACKEND_LLM ou "gemini").
+    
+    Raises:
+        ValueError: Backend desconhecido
+    """
+    backend = backend or BACKEND_LLM
+    if backend not in _backends_llm:
+        raise ValueError(f"Backend de LLM desconhecido: {backend} (disponíveis: {', '.join(_backends_llm)})")
+    logger.info(f"🔌 Backend do LLM: {backend}")
+    return _backends_llm[backend]()
+
 
 class LLMInteligente:
     """
@@ -34,21 +214,33 @@ class LLMInteligente:
     🧠 AGORA COM MEMÓRIA INTELIGENTE INTEGRADA
     """
 
-    def __init__(self):
+    def __init__(self, backend: Optional[str] = None, persist_dir: str = "memoria_chatfiscal",
+                 backend_embeddings: Optional[str] = None, modelo=None):
+        """
+        Args:
+            backend: Backend do modelo (padrão: CHATFISCAL_BACKEND_LLM ou "gemini";
+                     "falso": LLM local sem rede, para testes de carga)
+            persist_dir: Diretório da memória e do cache de respostas
+            backend_embeddings: Backend de embeddings da memória (padrão: CHATFISCAL_BACKEND_EMBEDDINGS)
+            modelo: Chat model já criado (substitui o backend)
+        """
         try:
-            api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                logger.warning("⚠️ GOOGLE_API_KEY ou GEMINI_API_KEY não encontrada")
-
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash",
-                google_api_key=api_key,
-                temperature=0.3
-            )
+            self.llm = modelo if modelo is not None else criar_modelo_llm(backend)
             
-            # ✨ INICIALIZA MEMÓRIA INTELIGENTE
-            self.memoria = MemoriaInteligente(persist_dir="memoria_chatfiscal")
-            logger.info("✅ LLM Gemini v2.0-flash + MemoriaInteligente inicializados")
+            # 🔗 PROMPTS E CADEIAS DE CADA MODO, MONTADOS UMA ÚNICA VEZ
+            self._criar_cadeias()
+            
+            # ⚡ CHAMADAS AO GEMINI: concorrência limitada, timeout e coalescência
+            self.cliente_llm = obter_cliente_llm()
+            
+            # ✨ MEMÓRIA INTELIGENTE ÚNICA DO PROCESSO (a mesma do AgentManager)
+            self.memoria = obter_memoria(persist_dir, backend_embeddings)
+
+            # ⚡ CACHE DE RESPOSTAS (pergunta normalizada + fingerprint dos dados)
+            self.cache_respostas = CacheRespostas(
+                persist_path=os.path.join(persist_dir, "cache_respostas.json")
+            )
+            logger.info(f"✅ LLM ({type(self.llm).__name__}) + MemoriaInteligente inicializados")
             
         except Exception as e:
             logger.error(f"❌ Erro ao inicializar LLM: {e}")
@@ -65,15 +257,15 @@ class LLMInteligente:
 IMPORTANTE: Responda APENAS o que foi perguntado de forma natural e direta.
 
 Regras:
-- Use APENAS os dados JSON fornecidos
+- Use APENAS os registros fornecidos na tabela
 - Responda de forma natural, sem mencionar "dados estruturados", "registros" ou "com base em"
-- Cite valores específicos dos dados JSON quando relevante
+- Cite valores específicos dos registros quando relevante
 - Use terminologia fiscal profissional quando apropriado
-- Se um dado não está disponível no JSON, informe de forma clara e direta
+- Se um dado não está disponível nos registros, informe de forma clara e direta
 - Seja conciso e objetivo
 - NUNCA use tags HTML na resposta
 - Responda em português brasileiro
-- Para perguntas sobre prestador/tomador/emitente: use os campos correspondentes do JSON"""
+- Para perguntas sobre prestador/tomador/emitente: use as colunas correspondentes da tabela"""
 
         elif tipo_resposta == "pdf":
             return """Você é um especialista em análise de documentos fiscais.
@@ -157,17 +349,143 @@ Regras:
         
         return False
 
-    def gerar_resposta_llm(self, pergunta, df=None, contexto_pdf=None, historico=None):
+    def gerar_resposta_llm(self, pergunta, df=None, contexto_pdf=None, historico=None, prazo=None, fingerprint=None):
         """
         Gera resposta baseado no que está disponível.
         🧠 AGORA COM BUSCA SEMÂNTICA AUTOMÁTICA
+        
+        `fingerprint` identifica os dados carregados (DataFrame + doc_ids dos PDFs,
+        ver calcular_fingerprint) para o cache e a memória; sem ele, é calculado
+        do DataFrame e do texto de contexto_pdf.
+        
+        Se o LLM não responder em `prazo` segundos (padrão: CHATFISCAL_PRAZO_RESPOSTA;
+        0: sem prazo), retorna uma RespostaRapida calculada localmente; a resposta
+        completa continua em segundo plano, fica no cache e na memória e chega ao
+        chamador por `rapida.completa` (Future) / `rapida.aguardar_completa()`.
+        Com 2 × MAX_CONCORRENTES respostas já em andamento, a RespostaRapida sai
+        na hora e sem resposta completa (`completa` None): o LLM está saturado.
+        """
+        resposta, plano = self._preparar_resposta(pergunta, df, contexto_pdf, fingerprint)
+        if resposta is not None:
+            return resposta
+        
+        prazo = PRAZO_RESPOSTA if prazo is None else prazo
+        if not prazo:
+            return self._responder_plano(pergunta, df, plano)
+        
+        vagas = _vagas_respostas
+        if not vagas.acquire(blocking=False):
+            logger.warning("⏱️ LLM saturado: enviando só a resposta rápida")
+            obter_telemetria().contar("respostas_rapidas", modo=plano["tipo_resposta"])
+            return gerar_resposta_rapida(pergunta, df if plano["tem_csv"] else None, contexto_pdf,
+                                          chave=plano["chave_tabela"])
+        
+        futuro = _executor_respostas.submit(self._responder_plano, pergunta, df, plano)
+        futuro.add_done_callback(lambda _: vagas.release())
+        try:
+            return futuro.result(timeout=prazo)
+        except PrazoEsgotado:
+            logger.warning(f"⏱️ LLM sem resposta em {prazo:g}s: enviando resposta rápida")
+            obter_telemetria().contar("respostas_rapidas", modo=plano["tipo_resposta"])
+            with _lock_pendentes:
+                _respostas_pendentes.add(futuro)
+            futuro.add_done_callback(_descartar_pendente)
+            rapida = gerar_resposta_rapida(pergunta, df if plano["tem_csv"] else None, contexto_pdf,
+                                           chave=plano["chave_tabela"])
+            rapida.completa = futuro
+            return rapida
+
+    def _responder_plano(self, pergunta, df, plano):
+        """Chamada ao LLM do tipo de resposta do plano + gravação na memória e no cache"""
+        tipo_resposta = plano["tipo_resposta"]
+        
+        try:
+            chave = plano["chave_prompt"]
+            if tipo_resposta == "csv":
+                resposta = self._responder_csv(pergunta, df, chave, plano["chave_tabela"])
+            elif tipo_resposta == "pdf":
+                resposta = self._responder_pdf(pergunta, plano["contexto_pdf"], chave)
+            elif tipo_resposta == "consolidada":
+                resposta = self._responder_consolidado(pergunta, df, plano["contexto_pdf"], chave, plano["chave_tabela"])
+            
+            self._concluir_resposta(pergunta, resposta, plano)
+            return resposta
+
+        except Exception as e:
+            logger.error(f"Erro ao gerar resposta: {e}")
+            return f"Erro ao processar pergunta: {str(e)}"
+
+    def gerar_resposta_llm_stream(self, pergunta, df=None, contexto_pdf=None, prazo=None, fingerprint=None):
+        """
+        Versão em streaming de gerar_resposta_llm: gera pedaços de texto conforme
+        o Gemini responde (astream da cadeia do modo), já sem tags HTML.
+        
+        Cache, cache semântico e saudação chegam num único pedaço. A memória e o
+        cache só são gravados com o texto final, depois do último pedaço.
+        
+        Se o primeiro pedaço não chegar em `prazo` segundos, gera antes uma
+        RespostaRapida: a interface a mostra e a troca pelos pedaços seguintes.
+        """
+        resposta, plano = self._preparar_resposta(pergunta, df, contexto_pdf, fingerprint)
+        if resposta is not None:
+            yield resposta
+            return
+        
+        tipo_resposta = plano["tipo_resposta"]
+        prazo = PRAZO_RESPOSTA if prazo is None else prazo
+        logger.info(f"🌊 Streaming da resposta ({tipo_resposta})")
+        
+        pedacos = []
+        rapida = None
+        try:
+            entradas = self._montar_entradas(tipo_resposta, pergunta, df, plano["contexto_pdf"], plano["chave_tabela"])
+            
+            pedacos_llm = iter(self.cliente_llm.transmitir(self.cadeias[tipo_resposta], entradas,
+                                                           modo=tipo_resposta, prazo_primeiro_pedaco=prazo))
+            primeiro = next(pedacos_llm, None)
+            if primeiro is PRAZO_ESGOTADO:
+                logger.warning(f"⏱️ Primeiro pedaço não chegou em {prazo:g}s: enviando resposta rápida")
+                obter_telemetria().contar("respostas_rapidas", modo=tipo_resposta)
+                rapida = gerar_resposta_rapida(pergunta, df if plano["tem_csv"] else None, contexto_pdf,
+                                          chave=plano["chave_tabela"])
+                yield rapida
+                primeiro = next(pedacos_llm, None)
+            
+            restantes = itertools.chain([] if primeiro is None else [primeiro], pedacos_llm)
+            for pedaco in remover_html_incremental(restantes):
+                pedacos.append(pedaco)
+                yield pedaco
+
+        except Exception as e:
+            logger.error(f"Erro no streaming da resposta: {e}")
+            erro = f"Erro ao processar pergunta: {str(e)}"
+            if rapida is not None and not pedacos:
+                # Mantém a resposta rápida na tela, com o aviso da falha
+                yield f"{rapida}\n\n⚠️ {erro}"
+            else:
+                yield ("\n\n" if pedacos else "") + erro
+            return
+        
+        resposta = "".join(pedacos)
+        if not resposta:
+            resposta = "Desculpe, não consegui processar sua pergunta com os dados disponíveis."
+            yield resposta
+        
+        self._concluir_resposta(pergunta, resposta, plano)
+
+    def _preparar_resposta(self, pergunta, df, contexto_pdf, fingerprint=None):
         """
+        Etapas comuns antes do LLM: dados disponíveis, saudação, cache exato e memória.
         
+        Returns:
+            (resposta, None) quando já há resposta pronta, senão (None, plano) com
+            o tipo de resposta, o contexto PDF (+ memória) e o que a gravação final usa
+        """
         tem_csv = df is not None and not df.empty
         tem_pdf = contexto_pdf is not None and contexto_pdf.strip()
         
         if not tem_csv and not tem_pdf:
-            return "❌ Nenhum dado disponível. Carregue um arquivo CSV/XML ou PDF para começar."
+            return "❌ Nenhum dado disponível. Carregue um arquivo CSV/XML ou PDF para começar.", None
         
         if self._eh_saudacao_pura(pergunta):
             return """Olá! 👋 Sou o assistente fiscal do ChatFiscal.
@@ -182,10 +500,33 @@ Você pode me fazer perguntas como:
 - Liste todos os prestadores de serviço
 - Quais são os CFOPs utilizados?
 
-**Como posso ajudar?**"""
+**Como posso ajudar?**""", None
+        
+        # ⚡ CONSULTA O CACHE ANTES DE QUALQUER TRABALHO (memória ou LLM)
+        # Índice de registros: chave só do DataFrame (a do cache muda com os PDFs)
+        chave_tabela = fingerprint_tabela(df) if tem_csv else None
+        if not fingerprint:
+            fingerprint = calcular_fingerprint(df if tem_csv else None, contexto_pdf) if tem_pdf else chave_tabela
+        telemetria = obter_telemetria()
+        resposta_cache = self.cache_respostas.obter(pergunta, fingerprint)
+        telemetria.contar("cache", cache="exato", resultado="acerto" if resposta_cache is not None else "falha")
+        if resposta_cache is not None:
+            logger.info("⚡ Resposta recuperada do cache")
+            return resposta_cache, None
+        
+        # 🧠 UMA ÚNICA BUSCA NA MEMÓRIA: cache semântico + contexto relevante
+        consulta_memoria = self.memoria.consultar(pergunta, fingerprint, k=3)
         
-        # ✨ BUSCA CONTEXTO RELEVANTE DA MEMÓRIA
-        contexto_memoria = self.memoria.buscar_contexto_relevante(pergunta, k=3)
+        # 🎯 CACHE SEMÂNTICO: mesma pergunta reformulada sobre os mesmos dados
+        anterior = consulta_memoria["resposta_semelhante"]
+        telemetria.contar("cache", cache="semantico", resultado="acerto" if anterior else "falha")
+        if anterior:
+            logger.info(f"🎯 Reaproveitando resposta anterior (similaridade {anterior['similaridade']:.3f})")
+            self.cache_respostas.salvar(pergunta, fingerprint, anterior["resposta"])
+            return anterior["resposta"], None
+        
+        # ✨ CONTEXTO RELEVANTE DA MEMÓRIA
+        contexto_memoria = empacotar_memoria(consulta_memoria["contexto"])
         
         if contexto_memoria:
             logger.info(f"🧠 Contexto relevante encontrado na memória")
@@ -204,117 +545,124 @@ Você pode me fazer perguntas como:
 
         logger.info(f"📋 Tipo de resposta: {tipo_resposta}")
         
-        try:
-            sistema_prompt = SystemMessagePromptTemplate.from_template(
-                self._criar_sistema_prompt(tipo_resposta)
-            )
+        # Prompt = tipo + pergunta + dados (fingerprint) + contexto PDF/memória
+        chave_prompt = hashlib.sha256(
+            "\x1f".join([tipo_resposta, pergunta, fingerprint, contexto_pdf or ""]).encode("utf-8")
+        ).hexdigest()
+        
+        return None, {
+            "tipo_resposta": tipo_resposta,
+            "chave_prompt": chave_prompt,
+            "contexto_pdf": contexto_pdf,
+            "tem_csv": tem_csv,
+            "tem_pdf": tem_pdf,
+            "fingerprint": fingerprint,
+            "chave_tabela": chave_tabela,
+            "vetor": consulta_memoria["vetor"]
+        }
 
-            if tipo_resposta == "csv":
-                resposta = self._responder_csv(pergunta, df, sistema_prompt)
-            elif tipo_resposta == "pdf":
-                resposta = self._responder_pdf(pergunta, contexto_pdf, sistema_prompt)
-            elif tipo_resposta == "consolidada":
-                resposta = self._responder_consolidado(pergunta, df, contexto_pdf, sistema_prompt)
-            
-            # ✨ SALVA CONVERSA NA MEMÓRIA AUTOMATICAMENTE
-            self.memoria.salvar_contexto(
-                pergunta=pergunta,
-                resposta=resposta,
-                metadados_extras={
-                    "tipo_resposta": tipo_resposta,
-                    "tem_csv": tem_csv,
-                    "tem_pdf": tem_pdf
-                }
-            )
-            logger.info("💾 Conversa salva na memória inteligente")
-            
-            return resposta
+    def _concluir_resposta(self, pergunta, resposta, plano):
+        """Grava o turno na memória e, se a resposta for válida, no cache"""
+        # ✨ SALVA CONVERSA NA MEMÓRIA AUTOMATICAMENTE
+        self.memoria.salvar_contexto(
+            pergunta=pergunta,
+            resposta=resposta,
+            metadados_extras={
+                "tipo_resposta": plano["tipo_resposta"],
+                "tem_csv": plano["tem_csv"],
+                "tem_pdf": plano["tem_pdf"],
+                "fingerprint": plano["fingerprint"]
+            },
+            vetor=plano["vetor"]
+        )
+        logger.info("💾 Conversa salva na memória inteligente")
+        
+        # ⚡ SÓ ARMAZENA NO CACHE RESPOSTAS VÁLIDAS
+        if resposta and not resposta.startswith("Erro"):
+            self.cache_respostas.salvar(pergunta, plano["fingerprint"], resposta)
 
-        except Exception as e:
-            logger.error(f"Erro ao gerar resposta: {e}")
-            return f"Erro ao processar pergunta: {str(e)}"
+    def _criar_cadeias(self):
+        """
+        Monta UMA vez, por modo, o prompt (sistema + usuário) e a cadeia prompt | LLM | texto.
+        A cada pergunta só mudam as entradas (_montar_entradas).
+        """
+        self.prompts = {
+            tipo: ChatPromptTemplate.from_messages([
+                SystemMessagePromptTemplate.from_template(self._criar_sistema_prompt(tipo)),
+                HumanMessagePromptTemplate.from_template(template)
+            ])
+            for tipo, template in TEMPLATES_USUARIO.items()
+        }
+        self.cadeias = {
+            tipo: prompt | self.llm | StrOutputParser()
+            for tipo, prompt in self.prompts.items()
+        }
+
+    def _montar_entradas(self, tipo_resposta, pergunta, df, contexto_pdf, chave_dados=None):
+        """Variáveis do prompt do tipo de resposta para esta pergunta"""
+        if tipo_resposta == "csv":
+            return self._entradas_csv(pergunta, df, chave_dados)
+        if tipo_resposta == "pdf":
+            return self._entradas_pdf(pergunta, contexto_pdf)
+        return self._entradas_consolidado(pergunta, df, contexto_pdf, chave_dados)
+
+    def _tabela_para_pergunta(self, pergunta, df, orcamento_tokens, max_linhas, chave_dados=None):
+        """
+        Registros citados pela pergunta (DataFrame inteiro) + agregados, codificados no orçamento.
+        chave_dados: fingerprint só do DataFrame, do plano (índice de registros reaproveitado)
+        """
+        linhas, selecao = selecionar_linhas(df, pergunta, max_linhas, chave=chave_dados)
+        tabela = codificar_tabela(linhas, orcamento_tokens - estimar_tokens(selecao), max_linhas)
+        return f"🎯 {selecao}\n\n{tabela}" if selecao else tabela
 
     # ✅ ADICIONE OS MÉTODOS _responder_*
     
-    def _responder_csv(self, pergunta, df, sistema_prompt):
-        """Responde usando APENAS dados estruturados - VERSÃO CORRIGIDA"""
-        logger.info("📊 Modo: Dados Estruturados")
+    def _entradas_csv(self, pergunta, df, chave_dados=None):
+        """Entradas do modo dados estruturados (tabela compacta + estatísticas do DataFrame)"""
+        tem_nfe = any(col.startswith('emit_') for col in df.columns)
+        tem_nfse = any(col.startswith('prestador_') for col in df.columns)
         
-        try:
-            tem_nfe = any(col.startswith('emit_') for col in df.columns)
-            tem_nfse = any(col.startswith('prestador_') for col in df.columns)
-            
-            dados_json = df.head(50).to_json(orient='records', force_ascii=False, indent=2)
-            
-            total_registros = len(df)
-            resumo_colunas = ", ".join(df.columns.tolist())
-            
-            colunas_valor = [col for col in df.columns if 'valor' in col.lower() or 'total' in col.lower()]
-            estatisticas = ""
-            if colunas_valor:
-                for col in colunas_valor:
-                    if pd.api.types.is_numeric_dtype(df[col]):
-                        try:
-                            estatisticas += f"\n{col}: Soma={df[col].sum():.2f}, Média={df[col].mean():.2f}, Min={df[col].min():.2f}, Max={df[col].max():.2f}"
-                        except:
-                            pass
-            
-            contexto_estrutural = f"""
+        dados_tabela = self._tabela_para_pergunta(pergunta, df, ORCAMENTO_TABELA, max_linhas=50, chave_dados=chave_dados)
+        
+        total_registros = len(df)
+        
+        colunas_valor = [col for col in df.columns if 'valor' in col.lower() or 'total' in col.lower()]
+        estatisticas = ""
+        if colunas_valor:
+            for col in colunas_valor:
+                if pd.api.types.is_numeric_dtype(df[col]):
+                    try:
+                        estatisticas += f"\n{col}: Soma={df[col].sum():.2f}, Média={df[col].mean():.2f}, Min={df[col].min():.2f}, Max={df[col].max():.2f}"
+                    except:
+                        pass
+        
+        contexto_estrutural = f"""
 📊 ESTRUTURA DOS DADOS:
 - Total de registros: {total_registros}
 - Total de campos: {len(df.columns)}
 """
-            
-            if tem_nfe:
-                contexto_estrutural += "🔵 **Contém NF-e (Nota Fiscal Eletrônica)**\n"
-            
-            if tem_nfse:
-                contexto_estrutural += "🟣 **Contém NFS-e (Nota Fiscal de Serviço)**\n"
-            
-            template_usuario = """
-{contexto_estrutural}
-
-📋 COLUNAS DISPONÍVEIS:
-{resumo_colunas}
-
-📈 ESTATÍSTICAS:
-{estatisticas}
-
-📄 REGISTROS COMPLETOS (JSON):
-{dados_json}
-
-─────────────────────────
-🔍 PERGUNTA DO USUÁRIO: {pergunta}
+        
+        if tem_nfe:
+            contexto_estrutural += "🔵 **Contém NF-e (Nota Fiscal Eletrônica)**\n"
+        
+        if tem_nfse:
+            contexto_estrutural += "🟣 **Contém NFS-e (Nota Fiscal de Serviço)**\n"
+        
+        return {
+            "contexto_estrutural": contexto_estrutural,
+            "estatisticas": estatisticas if estatisticas else "Nenhuma coluna numérica de valor encontrada",
+            "dados_tabela": dados_tabela,
+            "pergunta": pergunta
+        }
 
-─────────────────────────
-INSTRUÇÕES CRÍTICAS:
-1. Use APENAS os dados JSON acima para responder
-2. Cite valores EXATOS dos registros JSON
-3. Se a pergunta menciona "prestador", "tomador", "emitente", "destinatário": busque nos campos correspondentes do JSON
-4. Para perguntas sobre valores: use as estatísticas e dados JSON
-5. Para perguntas sobre quantidade: use total_registros
-6. Responda de forma direta e natural
-7. NÃO invente dados - use apenas o que está no JSON
-8. Se não encontrar no JSON, diga claramente que o dado não está disponível
-"""
-            
-            human_prompt = HumanMessagePromptTemplate.from_template(template_usuario)
-            chat_prompt = ChatPromptTemplate.from_messages([sistema_prompt, human_prompt])
-
-            chain = (
-                RunnablePassthrough.assign(
-                    contexto_estrutural=lambda x: contexto_estrutural,
-                    resumo_colunas=lambda x: resumo_colunas,
-                    estatisticas=lambda x: estatisticas if estatisticas else "Nenhuma coluna numérica de valor encontrada",
-                    dados_json=lambda x: dados_json,
-                    pergunta=lambda x: x["pergunta"]
-                )
-                | chat_prompt
-                | self.llm
-                | StrOutputParser()
-            )
+    def _responder_csv(self, pergunta, df, chave=None, chave_dados=None):
+        """Responde usando APENAS dados estruturados - VERSÃO CORRIGIDA"""
+        logger.info("📊 Modo: Dados Estruturados")
+        
+        try:
+            entradas = self._entradas_csv(pergunta, df, chave_dados)
 
-            resposta = chain.invoke({"pergunta": pergunta})
+            resposta = self.cliente_llm.executar(self.cadeias["csv"], entradas, chave, modo="csv")
             resposta = re.sub(r'<[^>]+>', '', resposta)
             resposta = resposta.strip()
             
@@ -328,41 +676,18 @@ INSTRUÇÕES CRÍTICAS:
             logger.error(f"Erro ao responder: {e}")
             return f"Erro ao processar consulta: {str(e)}"
 
-    def _responder_pdf(self, pergunta, contexto_pdf, sistema_prompt):
+    def _entradas_pdf(self, pergunta, contexto_pdf):
+        """Entradas do modo PDF"""
+        return {"contexto_pdf": contexto_pdf, "pergunta": pergunta}
+
+    def _responder_pdf(self, pergunta, contexto_pdf, chave=None):
         """Responde usando APENAS documentos PDF"""
         logger.info("📄 Modo: PDF")
         
         try:
-            template_usuario = """
-📄 CONTEXTO DO DOCUMENTO PDF
-─────────────────────────
-{contexto_pdf}
+            entradas = self._entradas_pdf(pergunta, contexto_pdf)
 
-─────────────────────────
-PERGUNTA: {pergunta}
-
-INSTRUÇÕES:
-- Use APENAS as informações do documento acima
-- Responda de forma direta
-- Não mencione "segundo o PDF" ou "no documento"
-- Se não encontrar, diga claramente
-- Sem tags HTML
-"""
-            
-            human_prompt = HumanMessagePromptTemplate.from_template(template_usuario)
-            chat_prompt = ChatPromptTemplate.from_messages([sistema_prompt, human_prompt])
-
-            chain = (
-                RunnablePassthrough.assign(
-                    contexto_pdf=lambda x: contexto_pdf,
-                    pergunta=lambda x: x["pergunta"]
-                )
-                | chat_prompt
-                | self.llm
-                | StrOutputParser()
-            )
-
-            resposta = chain.invoke({"pergunta": pergunta})
+            resposta = self.cliente_llm.executar(self.cadeias["pdf"], entradas, chave, modo="pdf")
             resposta = re.sub(r'<[^>]+>', '', resposta)
             resposta = resposta.strip()
             
@@ -373,67 +698,36 @@ INSTRUÇÕES:
             logger.error(f"Erro ao responder PDF: {e}")
             return f"Erro ao analisar documento: {str(e)}"
 
-    def _responder_consolidado(self, pergunta, df, contexto_pdf, sistema_prompt):
+    def _entradas_consolidado(self, pergunta, df, contexto_pdf, chave_dados=None):
+        """Entradas do modo consolidado (dados + PDFs)"""
+        tem_nfe = any(col.startswith('emit_') for col in df.columns)
+        tem_nfse = any(col.startswith('prestador_') for col in df.columns)
+        
+        contexto_estrutural = f"Total de registros: {len(df)}\n"
+        if tem_nfe:
+            contexto_estrutural += "🔵 Contém NF-e\n"
+        if tem_nfse:
+            contexto_estrutural += "🟣 Contém NFS-e\n"
+        
+        # Metade do orçamento: o contexto dos PDFs divide o mesmo prompt
+        dados_tabela = self._tabela_para_pergunta(pergunta, df, ORCAMENTO_TABELA // 2, max_linhas=30,
+                                                  chave_dados=chave_dados)
+        
+        return {
+            "contexto_estrutural": contexto_estrutural,
+            "dados_tabela": dados_tabela,
+            "contexto_pdf": contexto_pdf[:1500],
+            "pergunta": pergunta
+        }
+
+    def _responder_consolidado(self, pergunta, df, contexto_pdf, chave=None, chave_dados=None):
         """Responde usando DADOS + PDFs juntos"""
         logger.info("🔀 Modo: Consolidado")
         
         try:
-            tem_nfe = any(col.startswith('emit_') for col in df.columns)
-            tem_nfse = any(col.startswith('prestador_') for col in df.columns)
-            
-            contexto_estrutural = f"Total de registros: {len(df)}\n"
-            if tem_nfe:
-                contexto_estrutural += "🔵 Contém NF-e\n"
-            if tem_nfse:
-                contexto_estrutural += "🟣 Contém NFS-e\n"
-            
-            colunas_originais = df.columns.tolist()
-            colunas_formatadas = [self._formatar_nome_campo(col) for col in colunas_originais[:30]]
-            
-            dados_json = df.head(30).to_json(orient='records', force_ascii=False, indent=2)
-            
-            template_usuario = """
-📊 REGISTROS FISCAIS ELETRÔNICOS
-─────────────────────────
-{contexto_estrutural}
-
-Campos: {colunas}
-
-Dados JSON:
-{dados_json}
-
-───────────────────────────
-📄 DOCUMENTOS FISCAIS (PDF)
-─────────────────────────
-{contexto_pdf}
+            entradas = self._entradas_consolidado(pergunta, df, contexto_pdf, chave_dados)
 
-───────────────────────────
-PERGUNTA: {pergunta}
-
-INSTRUÇÕES:
-- Analise ambas as fontes
-- Responda de forma integrada
-- Cite origem apenas se houver discrepância
-- Sem tags HTML
-"""
-            
-            human_prompt = HumanMessagePromptTemplate.from_template(template_usuario)
-            chat_prompt = ChatPromptTemplate.from_messages([sistema_prompt, human_prompt])
-
-            chain = (
-                RunnablePassthrough.assign(
-                    contexto_estrutural=lambda x: contexto_estrutural,
-                    colunas=lambda x: ", ".join(colunas_formatadas),
-                    dados_json=lambda x: dados_json,
-                    contexto_pdf=lambda x: contexto_pdf[:1500],
-                    pergunta=lambda x: x["pergunta"]
-                )
-                | chat_prompt
-                | self.llm
-                | StrOutputParser()
-            )
-
-            resposta = chain.invoke({"pergunta": pergunta})
+            resposta = self.cliente_llm.executar(self.cadeias["consolidada"], entradas, chave, modo="consolidada")
             resposta = re.sub(r'<[^>]+>', '', resposta)
             resposta = resposta.strip()
             
@@ -445,22 +739,279 @@ INSTRUÇÕES:
             return f"Erro ao analisar dados consolidados: {str(e)}"
 
 
-# ✨ INSTÂNCIA GLOBAL COM MEMÓRIA
-try:
-    llm_inteligente = LLMInteligente()
-    logger.info("✅ Instância LLMInteligente criada com memória")
-except Exception as e:
-    logger.error(f"❌ Falha ao inicializar LLM: {e}")
-    llm_inteligente = None
+# ✨ INSTÂNCIA ÚNICA COM MEMÓRIA, CRIADA NO PRIMEIRO USO
+# Importar llm_utils não cria o cliente Gemini nem abre a MemoriaInteligente
+_llm_inteligente: Optional[LLMInteligente] = None
+_falha_inicializacao: Optional[str] = None
+_lock_llm = threading.Lock()
 
 
-def gerar_resposta_llm(pergunta, df=None, contexto_pdf=None, historico=None):
+def obter_llm_inteligente() -> Optional[LLMInteligente]:
+    """
+    Retorna o LLMInteligente único do processo, criando-o no primeiro uso.
+    
+    Thread-safe: sessões simultâneas do Streamlit esperam a mesma inicialização.
+    Se ela falhar (ex.: sem chave da API), retorna None sem tentar de novo a cada pergunta.
+    """
+    global _llm_inteligente, _falha_inicializacao
+    if _llm_inteligente is not None:
+        return _llm_inteligente
+    
+    with _lock_llm:
+        if _llm_inteligente is None and _falha_inicializacao is None:
+            try:
+                _llm_inteligente = LLMInteligente()
+                logger.info("✅ Instância LLMInteligente criada com memória")
+            except Exception as e:
+                logger.error(f"❌ Falha ao inicializar LLM: {e}")
+                _falha_inicializacao = str(e)
+        return _llm_inteligente
+
+
+def aquecer(em_segundo_plano: bool = False) -> bool:
+    """
+    Cria o LLMInteligente (cliente Gemini, memória e modelo de embeddings) antes
+    da primeira pergunta.
+    
+    Args:
+        em_segundo_plano: Aquece numa thread daemon e retorna na hora
+    
+    Returns:
+        True se o LLM está (ou ficará, em segundo plano) disponível
+    """
+    if em_segundo_plano:
+        threading.Thread(target=aquecer, name="chatfiscal-aquecimento", daemon=True).start()
+        return _falha_inicializacao is None
+    
+    llm = obter_llm_inteligente()
+    if llm is None:
+        return False
+    
+    # Carrega o modelo de embeddings fora do caminho da pergunta; se caiu no
+    # fallback, a memória reindexa agora e não na primeira consulta
+    embeddings = llm.memoria.embeddings
+    carregar = getattr(embeddings, "carregar", None)
+    if carregar is not None:
+        carregar()
+    else:
+        embeddings.embed_query("aquecimento")
+    llm.memoria.verificar_modelo()
+    logger.info("🔥 LLMInteligente aquecido")
+    return True
+
+
+def __getattr__(nome):
+    """Compatibilidade: `llm_utils.llm_inteligente` cria a instância no primeiro acesso"""
+    if nome == "llm_inteligente":
+        return obter_llm_inteligente()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+
+def gerar_resposta_llm(pergunta, df=None, contexto_pdf=None, historico=None, prazo=None, fingerprint=None):
     """
     Wrapper compatível - 🧠 AGORA COM MEMÓRIA AUTOMÁTICA
     O parâmetro 'historico' não é mais necessário (mantido por compatibilidade)
     """
+    llm_inteligente = obter_llm_inteligente()
     if llm_inteligente is None:
         return "Erro: LLM não foi inicializado"
 
     # O histórico agora é gerenciado automaticamente pela MemoriaInteligente
-    return llm_inteligente.gerar_resposta_llm(pergunta, df, contexto_pdf)
+    return llm_inteligente.gerar_resposta_llm(pergunta, df, contexto_pdf, prazo=prazo, fingerprint=fingerprint)
+
+
+def gerar_resposta_llm_stream(pergunta, df=None, contexto_pdf=None, prazo=None, fingerprint=None):
+    """
+    Wrapper em streaming - gera os pedaços da resposta (o primeiro pode ser uma RespostaRapida)
+    """
+    llm_inteligente = obter_llm_inteligente()
+    if llm_inteligente is None:
+        yield "Erro: LLM não foi inicializado"
+        return
+
+    yield from llm_inteligente.gerar_resposta_llm_stream(pergunta, df, contexto_pdf, prazo=prazo, fingerprint=fingerprint)
+
+
+def _descartar_pendente(futuro):
+    with _lock_pendentes:
+        _respostas_pendentes.discard(futuro)
+
+
+def aguardar_respostas_pendentes(timeout: Optional[float] = None) -> bool:
+    """
+    Espera as respostas completas que seguiram em segundo plano após uma
+    resposta rápida (ex.: antes de fechar a memória ou encerrar o processo).
+    
+    Returns:
+        True se todas terminaram dentro do timeout
+    """
+    with _lock_pendentes:
+        pendentes = list(_respostas_pendentes)
+    _, nao_concluidas = wait(pendentes, timeout=timeout)
+    return not nao_concluidas
+
+
+def obter_estatisticas_cache():
+    """Retorna contadores de acertos/falhas do cache de respostas (None antes do primeiro uso do LLM)"""
+    if _llm_inteligente is None:
+        return None
+    return _llm_inteligente.cache_respostas.estatisticas()
+
+
+# ══════════════════════════════════════════════════════════════════
+# ⏱️ MICROBENCHMARK DAS CADEIAS (linha de comando)
+# ══════════════════════════════════════════════════════════════════
+def medir_cadeias(repeticoes: int = 300) -> Dict[str, Dict[str, float]]:
+    """
+    Overhead por chamada (ms) de montar prompt + cadeia a cada pergunta, como era
+    feito antes, contra reutilizar a cadeia pronta do modo. Usa um LLM falso:
+    mede só o LangChain, sem rede.
+    """
+    import time
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    llm = object.__new__(LLMInteligente)
+    llm.llm = FakeListChatModel(responses=["Resposta de teste do modelo."])
+    llm._criar_cadeias()
+
+    entradas_por_tipo = {
+        "csv": {"contexto_estrutural": "Total de registros: 2", "estatisticas": "valor: Soma=30.00",
+                "dados_tabela": "numero;valor\n1;10\n2;20", "pergunta": "Qual o valor total?"},
+        "pdf": {"contexto_pdf": "Cláusula 1: pagamento mensal de R$ 1.000,00.", "pergunta": "Qual o valor?"},
+        "consolidada": {"contexto_estrutural": "Total de registros: 2", "dados_tabela": "numero;valor\n1;10",
+                        "contexto_pdf": "Cláusula 1: R$ 1.000,00.", "pergunta": "Os valores batem?"}
+    }
+
+    def montar_por_chamada(tipo, entradas):
+        """Como _responder_* faziam: templates, ChatPromptTemplate e assign de lambdas a cada pergunta"""
+        chat_prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(llm._criar_sistema_prompt(tipo)),
+            HumanMessagePromptTemplate.from_template(TEMPLATES_USUARIO[tipo])
+        ])
+        fixas = {k: (lambda x, v=v: v) for k, v in entradas.items() if k != "pergunta"}
+        return (
+            RunnablePassthrough.assign(**fixas, pergunta=lambda x: x["pergunta"])
+            | chat_prompt
+            | llm.llm
+            | StrOutputParser()
+        )
+
+    def cronometrar(funcao):
+        funcao()  # aquecimento
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        return (time.perf_counter() - inicio) / repeticoes * 1000
+
+    resultados = {}
+    for tipo, entradas in entradas_por_tipo.items():
+        por_chamada = cronometrar(lambda: montar_por_chamada(tipo, entradas).invoke({"pergunta": entradas["pergunta"]}))
+        reutilizada = cronometrar(lambda: llm.cadeias[tipo].invoke(entradas))
+        resultados[tipo] = {
+            "montagem_por_chamada_ms": por_chamada,
+            "cadeia_reutilizada_ms": reutilizada,
+            "economia_ms": por_chamada - reutilizada
+        }
+    return resultados
+
+
+# ══════════════════════════════════════════════════════════════════
+# 🚚 VAZÃO PONTA A PONTA SEM REDE (linha de comando)
+# ══════════════════════════════════════════════════════════════════
+def medir_vazao(perguntas: int = 200, concorrencia: int = 8, latencia: float = 0.2,
+                linhas: int = 500, persist_dir: Optional[str] = None, prazo: float = 0.0,
+                fracao_lenta: float = 0.0, latencia_lenta: float = 0.0) -> Dict[str, float]:
+    """
+    Vazão de gerar_resposta_llm com backends locais: LLM falso (latência fixa)
+    e embeddings por hashing. Passa por cache, memória, seleção de registros,
+    codificação da tabela e cliente assíncrono (CHATFISCAL_LLM_CONCORRENCIA),
+    sem rede nem download de modelos: a mesma carga dá o mesmo tempo.
+    
+    Cada pergunta é diferente e o cache semântico fica desligado: todas chegam ao LLM.
+    As latências (p50/p95/p99) são o tempo até o usuário ver uma resposta: com
+    prazo, as chamadas lentas (fracao_lenta) viram respostas rápidas.
+    
+    Args:
+        perguntas: Total de perguntas
+        concorrencia: Sessões simultâneas (threads) fazendo perguntas
+        latencia: Segundos de cada chamada ao LLM falso
+        linhas: Registros do DataFrame sintético
+        persist_dir: Diretório da memória (padrão: temporário)
+        prazo: Prazo da resposta em segundos (0: sem prazo nem resposta rápida)
+        fracao_lenta: Fração das chamadas ao LLM falso que demoram latencia_lenta
+        latencia_lenta: Segundos das chamadas lentas
+    """
+    import time
+    import tempfile
+    from llm_falso import LLMFalso
+    from quick_answer import RespostaRapida
+    
+    persist_dir = persist_dir or tempfile.mkdtemp(prefix="chatfiscal-vazao-")
+    llm = LLMInteligente(persist_dir=persist_dir, backend_embeddings="hashing",
+                         modelo=LLMFalso(latencia=latencia, fracao_lenta=fracao_lenta,
+                                         latencia_lenta=latencia_lenta))
+    llm.memoria.limiar_cache_semantico = 1.01
+    
+    df = pd.DataFrame({
+        "ide_nNF": range(1, linhas + 1),
+        "emit_xNome": [f"FORNECEDOR {i % 37}" for i in range(linhas)],
+        "ide_CFOP": [5102 if i % 3 else 6108 for i in range(linhas)],
+        "valor_total": [round(10 + i * 1.5, 2) for i in range(linhas)]
+    })
+    chamadas_antes = llm.cliente_llm.chamadas
+    
+    def perguntar(i):
+        inicio = time.perf_counter()
+        resposta = llm.gerar_resposta_llm(f"Qual o valor e o fornecedor da nota {i % linhas + 1}? (consulta {i})",
+                                          df=df, prazo=prazo)
+        return time.perf_counter() - inicio, isinstance(resposta, RespostaRapida)
+    
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        medicoes = list(executor.map(perguntar, range(perguntas)))
+    duracao = time.perf_counter() - inicio
+    aguardar_respostas_pendentes()
+    llm.memoria.fechar()
+    latencias = sorted(segundos for segundos, _ in medicoes)
+    
+    def percentil(q):
+        return latencias[min(len(latencias) - 1, int(q * len(latencias)))]
+    
+    return {
+        "perguntas": perguntas,
+        "chamadas_llm": llm.cliente_llm.chamadas - chamadas_antes,
+        "respostas_rapidas": sum(rapida for _, rapida in medicoes),
+        "duracao_s": duracao,
+        "respostas_por_s": perguntas / duracao,
+        "p50_s": percentil(0.5),
+        "p95_s": percentil(0.95),
+        "p99_s": percentil(0.99),
+        "limite_teorico_por_s": llm.cliente_llm.max_concorrentes / latencia if latencia else float("inf")
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Ferramentas do LLMInteligente")
+    parser.add_argument("comando", choices=["medir-cadeias", "medir-vazao"],
+                        help="medir-cadeias: overhead por chamada de montar a cadeia vs. reutilizá-la | "
+                             "medir-vazao: respostas/s ponta a ponta com LLM falso e embeddings locais")
+    parser.add_argument("--repeticoes", type=int, default=300, help="Chamadas cronometradas por modo")
+    parser.add_argument("--perguntas", type=int, default=200, help="medir-vazao: total de perguntas")
+    parser.add_argument("--concorrencia", type=int, default=8, help="medir-vazao: sessões simultâneas")
+    parser.add_argument("--latencia", type=float, default=0.2, help="medir-vazao: segundos por chamada ao LLM falso")
+    parser.add_argument("--prazo", type=float, default=0.0, help="medir-vazao: prazo da resposta (0: sem resposta rápida)")
+    parser.add_argument("--fracao-lenta", type=float, default=0.0, help="medir-vazao: fração de chamadas lentas")
+    parser.add_argument("--latencia-lenta", type=float, default=0.0, help="medir-vazao: segundos das chamadas lentas")
+    args = parser.parse_args()
+    
+    if args.comando == "medir-vazao":
+        import json
+        print(json.dumps(medir_vazao(args.perguntas, args.concorrencia, args.latencia, prazo=args.prazo,
+                                     fracao_lenta=args.fracao_lenta, latencia_lenta=args.latencia_lenta), indent=2))
+    else:
+        for tipo, medicao in medir_cadeias(args.repeticoes).items():
+            print(f"{tipo:12s} montada por chamada: {medicao['montagem_por_chamada_ms']:.3f} ms | "
+                  f"reutilizada: {medicao['cadeia_reutilizada_ms']:.3f} ms | "
+                  f"economia: {medicao['economia_ms']:.3f} ms/chamada")
@@ -0,0 +1,235 @@
+# memory_log.py - PERSISTÊNCIA EM LOG APPEND-ONLY DA MEMÓRIA
+"""
+Log append-only + snapshots da MemoriaInteligente
+
+Cada `salvar_contexto` acrescenta UMA linha (registro + vetores em base64)
+ao log da geração atual: custo O(1), independente do tamanho do histórico.
+Usos de registros (último acesso, para a retenção por LRU) também viram
+linhas curtas do log, então sobrevivem a reinícios sem esperar a compactação.
+De tempos em tempos a memória é compactada em um snapshot:
+
+    memoria_chatfiscal/
+        ATUAL                     # geração do snapshot vigente
+        snapshot_000003/          # registros.jsonl + índices/vetores + info.json
+        log_000003.jsonl          # entradas posteriores ao snapshot 3
+        log_000004.jsonl          # (aberto se uma compactação estiver em andamento)
+
+A compactação rotaciona o log (g → g+1), grava o snapshot g+1 e só então
+aponta ATUAL para ele. Na carga, lê-se o snapshot de ATUAL e reaplicam-se
+os logs de geração ≥ ATUAL — uma compactação interrompida não perde nada.
+"""
+
+import os
+import re
+import json
+import base64
+import shutil
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_ATUAL = "ATUAL"
+_PADRAO_LOG = re.compile(r"^log_(\d{6})\.jsonl$")
+_PADRAO_SNAPSHOT = re.compile(r"^snapshot_(\d{6})$")
+
+
+def _vetor_para_texto(vetor) -> str:
+    return base64.b64encode(np.asarray(vetor, dtype="float32").tobytes()).decode("ascii")
+
+
+def _texto_para_vetor(texto: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(texto), dtype="float32")
+
+
+class LogMemoria:
+    """
+    📝 Log de registros/vetores por geração, compactado em snapshots.
+    """
+
+    def __init__(self, diretorio: str):
+        """
+        Args:
+            diretorio: Diretório de persistência da memória
+        """
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+
+        self.geracao_snapshot = self._ler_atual()
+        self.geracao = max([self.geracao_snapshot] + self._geracoes(_PADRAO_LOG))
+        self.entradas_no_log = 0
+        self._arquivo = None
+
+    # ──────────────────────────────────────────────────────────────
+    # Escrita
+    # ──────────────────────────────────────────────────────────────
+    def anexar(self, registro: Dict[str, Any], vetores: Dict[str, Any]) -> None:
+        """Acrescenta um registro e seus vetores ao log da geração atual (O(1))."""
+        entrada = {"registro": registro, "vetores": {nome: _vetor_para_texto(v) for nome, v in vetores.items()}}
+        self._escrever(entrada)
+
+    def anexar_acesso(self, chaves: List[str], quando: str) -> None:
+        """
+        Registra o uso dos registros `chaves` em `quando` (O(1)).
+
+        Chaves estáveis, não posições: a compactação renumera os registros, e o
+        log pode sobreviver a ela (snapshot que falhou depois da rotação).
+        """
+        self._escrever({"acesso": {"chaves": chaves, "quando": quando}})
+
+    def _escrever(self, entrada: Dict[str, Any]) -> None:
+        if self._arquivo is None:
+            self._arquivo = open(self._caminho_log(self.geracao), "a", encoding="utf-8")
+
+        self._arquivo.write(json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+        self._arquivo.flush()
+        self.entradas_no_log += 1
+
+    def rotacionar(self) -> int:
+        """Fecha o log atual e passa a escrever na próxima geração. Retorna a nova geração."""
+        self.fechar()
+        self.geracao += 1
+        self.entradas_no_log = 0
+        return self.geracao
+
+    def gravar_snapshot(self, geracao: int, registros: List[Dict[str, Any]],
+                        indices: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                        info: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Grava o snapshot da geração e o torna o vigente.
+
+        Args:
+            geracao: Geração retornada por `rotacionar`
+            registros: Todos os registros até a rotação
+            indices: nome → (índice FAISS serializado, vetores), de `IndiceVetorialAdaptativo.serializar`
+            info: Metadados do snapshot (ex.: modelo que gerou os vetores)
+        """
+        destino = self._caminho_snapshot(geracao)
+        temporario = destino + ".tmp"
+        shutil.rmtree(temporario, ignore_errors=True)
+        os.makedirs(temporario)
+
+        with open(os.path.join(temporario, "registros.jsonl"), "w", encoding="utf-8") as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+
+        with open(os.path.join(temporario, "info.json"), "w", encoding="utf-8") as f:
+            json.dump(info or {}, f, ensure_ascii=False)
+
+        for nome, (indice_serializado, vetores) in indices.items():
+            np.asarray(indice_serializado).tofile(os.path.join(temporario, f"{nome}.faiss"))
+            np.save(os.path.join(temporario, f"{nome}.npy"), vetores)
+
+        shutil.rmtree(destino, ignore_errors=True)
+        os.replace(temporario, destino)
+
+        caminho_atual = os.path.join(self.diretorio, ARQUIVO_ATUAL)
+        with open(caminho_atual + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(geracao))
+        os.replace(caminho_atual + ".tmp", caminho_atual)
+        self.geracao_snapshot = geracao
+
+        self._remover_anteriores(geracao)
+        logger.info(f"🗜️ Snapshot {geracao} gravado: {len(registros)} registros")
+
+    # ──────────────────────────────────────────────────────────────
+    # Leitura
+    # ──────────────────────────────────────────────────────────────
+    def snapshot_atual(self) -> Optional[str]:
+        """Diretório do snapshot vigente, ou None."""
+        caminho = self._caminho_snapshot(self.geracao_snapshot)
+        return caminho if self.geracao_snapshot and os.path.isdir(caminho) else None
+
+    @staticmethod
+    def ler_registros(snapshot: str) -> List[Dict[str, Any]]:
+        """Registros gravados em um snapshot."""
+        with open(os.path.join(snapshot, "registros.jsonl"), "r", encoding="utf-8") as f:
+            return [json.loads(linha) for linha in f if linha.strip()]
+
+    @staticmethod
+    def ler_info(snapshot: str) -> Dict[str, Any]:
+        """Metadados gravados com o snapshot ({} em snapshots sem info.json)."""
+        caminho = os.path.join(snapshot, "info.json")
+        if not os.path.exists(caminho):
+            return {}
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def reler(self, ao_acessar: Optional[Callable[[List[str], str], None]] = None
+              ) -> Iterator[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+        """
+        Entradas (registro, vetores) dos logs posteriores ao snapshot vigente, em ordem.
+
+        Args:
+            ao_acessar: Chamado com (chaves, quando) para cada uso registrado, na
+                ordem do log (acessos por posição, de versões antigas, são descartados)
+        """
+        for geracao in sorted(g for g in self._geracoes(_PADRAO_LOG) if g >= self.geracao_snapshot):
+            with open(self._caminho_log(geracao), "r", encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        entrada = json.loads(linha)
+                    except json.JSONDecodeError:
+                        # Última linha truncada por uma queda no meio da escrita
+                        logger.warning(f"⚠️ Linha inválida ignorada no log {geracao}")
+                        continue
+                    self.entradas_no_log += 1
+                    if "acesso" in entrada:
+                        if ao_acessar is not None and "chaves" in entrada["acesso"]:
+                            ao_acessar(entrada["acesso"]["chaves"], entrada["acesso"]["quando"])
+                        continue
+                    yield entrada["registro"], {nome: _texto_para_vetor(v) for nome, v in entrada["vetores"].items()}
+
+    def tamanho_bytes(self) -> int:
+        """Espaço ocupado em disco pela memória."""
+        total = 0
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            total += sum(os.path.getsize(os.path.join(raiz, nome)) for nome in arquivos)
+        return total
+
+    # ──────────────────────────────────────────────────────────────
+    # Manutenção
+    # ──────────────────────────────────────────────────────────────
+    def fechar(self) -> None:
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def limpar(self) -> None:
+        """Remove logs, snapshots e o ponteiro ATUAL."""
+        self.fechar()
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            if _PADRAO_LOG.match(nome) or nome == ARQUIVO_ATUAL:
+                os.remove(caminho)
+            elif _PADRAO_SNAPSHOT.match(nome.replace(".tmp", "")):
+                shutil.rmtree(caminho, ignore_errors=True)
+        self.geracao_snapshot = self.geracao = 0
+        self.entradas_no_log = 0
+
+    def _remover_anteriores(self, geracao: int) -> None:
+        """Apaga snapshots e logs já incorporados ao snapshot `geracao`."""
+        for g in self._geracoes(_PADRAO_LOG):
+            if g < geracao:
+                os.remove(self._caminho_log(g))
+        for g in self._geracoes(_PADRAO_SNAPSHOT):
+            if g < geracao:
+                shutil.rmtree(self._caminho_snapshot(g), ignore_errors=True)
+
+    def _ler_atual(self) -> int:
+        caminho = os.path.join(self.diretorio, ARQUIVO_ATUAL)
+        if not os.path.exists(caminho):
+            return 0
+        with open(caminho, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+
+    def _geracoes(self, padrao) -> List[int]:
+        return [int(m.group(1)) for m in map(padrao.match, os.listdir(self.diretorio)) if m]
+
+    def _caminho_log(self, geracao: int) -> str:
+        return os.path.join(self.diretorio, f"log_{geracao:06d}.jsonl")
+
+    def _caminho_snapshot(self, geracao: int) -> str:
+        return os.path.join(self.diretorio, f"snapshot_{geracao:06d}")
@@ -5,20 +5,27 @@
 Combina:
 - Memória Compartilhada (thread-safe)
 - Memória Dedicada (por módulo)
-- Memória Inteligente com FAISS (busca semântica)
+- Memória Inteligente com FAISS ou NumPy (busca semântica)
 - Persistência local em disco
 """
 
 import os
+import re
 import pickle
+import hashlib
 import json
+import queue
+import atexit
 import threading
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from langchain_core.documents import Document
 import numpy as np
-from difflib import SequenceMatcher
+from embedding_registry import obter_embeddings, EmbeddingsHashing
+from memory_log import LogMemoria
+from telemetry import obter_telemetria
 
 # Configuração de logging
 logging.basicConfig(
@@ -31,15 +38,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Tenta importar FAISS e HuggingFace, mas oferece fallback se não disponível
-try:
-    import faiss
-    from langchain_community.embeddings import HuggingFaceEmbeddings
-    HAVE_FAISS = True
+# FAISS é opcional: sem ele, a memória usa a matriz NumPy de vector_index
+from vector_index import HAVE_FAISS, IndiceMemoria
+if HAVE_FAISS:
     logger.info("✅ FAISS disponível - usando busca vetorial")
-except ImportError:
-    HAVE_FAISS = False
-    logger.warning("⚠️ FAISS não disponível - usando fallback com busca por similaridade de string")
+else:
+    logger.warning("⚠️ FAISS não disponível - usando busca exata vetorizada (NumPy)")
 
 # Configuração de logging
 logging.basicConfig(
@@ -53,54 +57,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class SimpleStringEmbeddings:
-    """Fallback simples quando HuggingFace/FAISS não estão disponíveis."""
-    
-    def embed_query(self, text: str) -> List[float]:
-        """Retorna uma representação simples do texto como vetor."""
-        # Usa um hash do texto normalizado como embedding
-        # Não é semântico, mas permite matching básico
-        norm_text = text.lower().strip()
-        hash_val = hash(norm_text)
-        # Converte o hash em uma lista de 10 números
-        return [(hash_val >> i) & 0xFF for i in range(0, 80, 8)]
-    
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embeddings para múltiplos textos."""
-        return [self.embed_query(text) for text in texts]
-
-
-class SimpleVectorStore:
-    """Armazenamento vetorial simples usando similaridade de string."""
-    
-    def __init__(self, dimension: int = 10):
-        self.texts = []  # armazena textos originais
-        self.vectors = []  # armazena vetores (hashes)
-    
-    def add(self, vectors: np.ndarray):
-        """Adiciona vetores ao store."""
-        if isinstance(vectors, np.ndarray):
-            vectors = vectors.tolist()
-        if not isinstance(vectors, list):
-            vectors = [vectors]
-        self.vectors.extend(vectors)
-    
-    def search(self, query_vector: np.ndarray, k: int = 4) -> tuple:
-        """Busca os k vetores mais similares."""
-        if isinstance(query_vector, np.ndarray):
-            query_vector = query_vector.tolist()
-        
-        # Usa SequenceMatcher para comparar strings
-        scores = []
-        for vec in self.vectors:
-            score = SequenceMatcher(None, str(query_vector), str(vec)).ratio()
-            scores.append(score)
-        
-        # Retorna os k índices mais similares
-        indices = np.argsort(scores)[-k:][::-1]
-        return indices, [scores[i] for i in indices]
-
-
 # ══════════════════════════════════════════════════════════════════
 # 1️⃣ MEMÓRIA COMPARTILHADA (Thread-Safe)
 # ══════════════════════════════════════════════════════════════════
@@ -197,41 +153,86 @@ class MemoriaInteligente:
     
     Funcionalidades:
     - Armazena histórico de perguntas e respostas
-    - Indexa conversas com embeddings vetoriais
+    - Indexa as perguntas: um embedding por turno, reusado na busca e na gravação
     - Busca contexto relevante por similaridade semântica
-    - Persistência local em disco
+    - Persistência local em disco (log append-only + snapshots compactados)
+    - Gravação write-behind: salvar_contexto só enfileira; um worker embute e grava em lote
+    - Retenção (máx. registros, idade, bytes) com despejo por LRU/idade na compactação
     - Integração com Streamlit Session State
+    - Cache semântico: reaproveita respostas de perguntas quase idênticas
+    - Índices por produto interno (cosseno) que migram para ANN conforme o histórico cresce
     """
     
-    def __init__(self, persist_dir: str = "memory_store", model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, persist_dir: str = "memory_store", model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 limiar_cache_semantico: Optional[float] = None, compactar_a_cada: Optional[int] = None,
+                 tamanho_fila: Optional[int] = None, tamanho_lote: int = 32,
+                 max_registros: Optional[int] = None, max_idade_dias: Optional[float] = None,
+                 max_mb: Optional[float] = None, backend_embeddings: Optional[str] = None):
         """
         Inicializa a memória inteligente.
         
         Args:
             persist_dir: Diretório para persistência dos dados
-            model_name: Modelo de embeddings HuggingFace
+            model_name: Modelo HuggingFace (sem ele, ou com o backend "hashing": EmbeddingsHashing determinístico)
+            limiar_cache_semantico: Similaridade de cosseno mínima (0-1) para reaproveitar
+                uma resposta anterior. Padrão: CHATFISCAL_LIMIAR_CACHE_SEMANTICO ou 0.92
+            compactar_a_cada: Entradas no log que disparam a compactação em segundo plano.
+                Padrão: CHATFISCAL_MEMORIA_COMPACTAR ou 500
+            tamanho_fila: Máximo de gravações pendentes; cheia, salvar_contexto espera (backpressure).
+                Padrão: CHATFISCAL_MEMORIA_FILA ou 256
+            tamanho_lote: Máximo de registros embutidos/gravados de uma vez pelo worker
+            max_registros: Registros mantidos (despejo dos menos usados recentemente).
+                Padrão: CHATFISCAL_MEMORIA_MAX_REGISTROS ou 50000; 0 = sem limite
+            max_idade_dias: Registros sem uso há mais que isso são despejados.
+                Padrão: CHATFISCAL_MEMORIA_MAX_DIAS ou 365; 0 = sem limite
+            max_mb: Tamanho estimado máximo da memória em disco.
+                Padrão: CHATFISCAL_MEMORIA_MAX_MB ou 512; 0 = sem limite
+            backend_embeddings: Backend do embedding_registry ("huggingface", "hashing"...).
+                Padrão: CHATFISCAL_BACKEND_EMBEDDINGS ou "huggingface"
         """
         self.persist_dir = persist_dir
         self.model_name = model_name
         os.makedirs(persist_dir, exist_ok=True)
         
-        # Caminhos de persistência
+        if limiar_cache_semantico is None:
+            limiar_cache_semantico = float(os.getenv("CHATFISCAL_LIMIAR_CACHE_SEMANTICO", "0.92"))
+        self.limiar_cache_semantico = limiar_cache_semantico
+        
+        if compactar_a_cada is None:
+            compactar_a_cada = int(os.getenv("CHATFISCAL_MEMORIA_COMPACTAR", "500"))
+        self.compactar_a_cada = compactar_a_cada
+        
+        if tamanho_fila is None:
+            tamanho_fila = int(os.getenv("CHATFISCAL_MEMORIA_FILA", "256"))
+        self.tamanho_lote = tamanho_lote
+        
+        # Política de retenção (aplicada na compactação)
+        self.max_registros = int(os.getenv("CHATFISCAL_MEMORIA_MAX_REGISTROS", "50000")) if max_registros is None else max_registros
+        self.max_idade_dias = float(os.getenv("CHATFISCAL_MEMORIA_MAX_DIAS", "365")) if max_idade_dias is None else max_idade_dias
+        self.max_mb = float(os.getenv("CHATFISCAL_MEMORIA_MAX_MB", "512")) if max_mb is None else max_mb
+        self.ultima_compactacao: Dict[str, Any] = {}
+        # Estimativas para a verificação barata da retenção (recalculadas na carga e na compactação)
+        self._bytes_estimados = 0
+        self._vencimento: Optional[str] = None
+        
+        # Persistência: log append-only + snapshots
+        self.log = LogMemoria(persist_dir)
+        # Formato antigo (IndexFlatL2 + pickle + JSON reescritos a cada save) — migrado na primeira carga
         self.index_path = os.path.join(persist_dir, "faiss.index")
         self.meta_path = os.path.join(persist_dir, "metadados.pkl")
         self.historico_path = os.path.join(persist_dir, "historico.json")
         
-        # Inicialização de embeddings
+        # Inicialização de embeddings (modelo compartilhado pelo processo)
         try:
-            if HAVE_FAISS:
-                self.embeddings = HuggingFaceEmbeddings(model_name=model_name)
-                logger.info(f"✅ Embeddings HuggingFace carregados: {model_name}")
-            else:
-                self.embeddings = SimpleStringEmbeddings()
-                logger.info("✅ Usando embeddings simples (fallback)")
+            self.embeddings = obter_embeddings(model_name, backend=backend_embeddings)
+            # Nome do backend efetivo (ex.: "hashing-256"): trocar de backend reindexa a memória
+            self.modelo_vetores = getattr(self.embeddings, "nome", model_name)
+            logger.info(f"✅ Embeddings configurados: {self.modelo_vetores} (modelos carregados na primeira embedding)")
         except Exception as e:
             logger.error(f"❌ Erro ao carregar embeddings: {e}")
-            self.embeddings = SimpleStringEmbeddings()
-            logger.warning("⚠️ Fallback para embeddings simples após erro")
+            self.embeddings = EmbeddingsHashing()
+            self.modelo_vetores = self.embeddings.nome
+            logger.warning("⚠️ Fallback para embeddings por hashing de n-gramas")
         
         # Estruturas de dados
         self.historico: List[Dict[str, Any]] = []
@@ -239,83 +240,258 @@ class MemoriaInteligente:
         self.index = None
         self.dimension: Optional[int] = None
         
+        self.cache_semantico_hits = 0
+        self.cache_semantico_misses = 0
+        
+        # Últimos vetores de consulta (evita embutir a mesma pergunta duas vezes)
+        self._vetores_consulta: "OrderedDict[str, List[float]]" = OrderedDict()
+        
         # Thread-safety
         self.lock = threading.Lock()
+        self._lock_compactacao = threading.Lock()
+        self._thread_compactacao: Optional[threading.Thread] = None
+        
+        # Fila write-behind (worker iniciado na primeira gravação)
+        self._fila: "queue.Queue[Optional[Tuple[Dict[str, Any], Optional[List[float]]]]]" = queue.Queue(maxsize=tamanho_fila)
+        self._worker: Optional[threading.Thread] = None
+        self._lock_worker = threading.Lock()
+        atexit.register(self.fechar)
         
         # Carrega dados persistentes (se existirem)
         self._carregar_memoria()
         
         logger.info(f"✅ MemoriaInteligente inicializada | Registros: {len(self.historico)}")
     
-    def salvar_contexto(self, pergunta: str, resposta: str, metadados_extras: Optional[Dict] = None) -> None:
-        """Armazena par pergunta-resposta + embedding FAISS."""
-        with self.lock:
+    def salvar_contexto(self, pergunta: str, resposta: str, metadados_extras: Optional[Dict] = None,
+                        vetor: Optional[List[float]] = None) -> None:
+        """
+        Enfileira o par pergunta-resposta para gravação (embedding + log) pelo worker.
+        
+        Retorna imediatamente; só espera se a fila estiver cheia (backpressure).
+        Use `flush()` quando precisar do registro já indexado.
+        
+        Args:
+            vetor: Embedding da pergunta já calculado em `consultar` (evita embutir de novo)
+        """
+        registro = {
+            "pergunta": pergunta,
+            "resposta": resposta,
+            "timestamp": datetime.now().isoformat()
+        }
+        if metadados_extras:
+            registro.update(metadados_extras)
+        
+        self._iniciar_worker()
+        try:
+            self._fila.put((registro, vetor), timeout=30)
+        except queue.Full:
+            logger.warning("⚠️ Fila de gravação cheia há 30s - gravando de forma síncrona")
+            self._gravar_lote([(registro, vetor)])
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera todas as gravações pendentes. Retorna False se o timeout expirar."""
+        if self._worker is None:
+            return True
+        if timeout is None:
+            self._fila.join()
+            return True
+        
+        evento = threading.Event()
+        threading.Thread(target=lambda: (self._fila.join(), evento.set()), daemon=True).start()
+        return evento.wait(timeout)
+    
+    def fechar(self) -> None:
+        """Grava o que estiver na fila, encerra o worker e fecha o log (chamado no atexit)."""
+        with self._lock_worker:
+            if self._worker is not None and self._worker.is_alive():
+                self._fila.put(None)
+                self._worker.join()
+            self._worker = None
+        self.log.fechar()
+    
+    def _iniciar_worker(self) -> None:
+        with self._lock_worker:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._executar_worker, name="gravacao-memoria", daemon=True)
+                self._worker.start()
+    
+    def _executar_worker(self) -> None:
+        """Consome a fila: junta até `tamanho_lote` registros e grava o lote de uma vez."""
+        encerrar = False
+        while not encerrar:
+            lote = [self._fila.get()]
+            while len(lote) < self.tamanho_lote:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            
+            itens = [item for item in lote if item is not None]
+            encerrar = len(itens) < len(lote)
             try:
-                texto_completo = f"Pergunta: {pergunta}\nResposta: {resposta}"
-                vetor = self.embeddings.embed_query(texto_completo)
-                vetor_np = np.array([vetor], dtype="float32")
-                
-                if self.index is None:
-                    self.dimension = len(vetor)
-                    if HAVE_FAISS:
-                        self.index = faiss.IndexFlatL2(self.dimension)
-                    else:
-                        self.index = SimpleVectorStore(dimension=self.dimension)
-                    logger.info(f"🔧 Índice FAISS criado | Dimensão: {self.dimension}")
-                
-                self.index.add(vetor_np)
-                
-                registro = {
-                    "pergunta": pergunta,
-                    "resposta": resposta,
-                    "timestamp": datetime.now().isoformat(),
-                    "id": len(self.metadados)
-                }
-                
-                if metadados_extras:
-                    registro.update(metadados_extras)
-                
-                self.metadados.append(registro)
-                self.historico.append(registro)
-                self._salvar_memoria()
-                
-                logger.info(f"💾 Contexto salvo | Total: {len(self.historico)}")
-                
-            except Exception as e:
-                logger.error(f"❌ Erro ao salvar contexto: {e}")
+                if itens:
+                    self._gravar_lote(itens)
+            finally:
+                for _ in lote:
+                    self._fila.task_done()
     
-    def buscar_contexto_relevante(self, consulta: str, k: int = 3, threshold: float = 1.5) -> str:
-        """Retorna contexto mais relevante semanticamente."""
-        with self.lock:
-            if not self.index or self.index.ntotal == 0:
-                logger.warning("⚠️ Índice FAISS vazio")
-                return ""
+    def _gravar_lote(self, itens: List[Tuple[Dict[str, Any], Optional[List[float]]]]) -> None:
+        """Grava (registro, vetor da pergunta) no índice e no log; embute em lote só o que faltar."""
+        try:
+            registros = [registro for registro, _ in itens]
+            vetores = [vetor for _, vetor in itens]
+            
+            with self.lock:
+                for i, registro in enumerate(registros):
+                    if vetores[i] is None:
+                        vetores[i] = self._vetores_consulta.get(registro["pergunta"])
+            faltando = [i for i, v in enumerate(vetores) if v is None]
+            if faltando:
+                novos = self.embeddings.embed_documents([registros[i]["pergunta"] for i in faltando])
+                for i, vetor in zip(faltando, novos):
+                    vetores[i] = vetor
+            trocou = self.verificar_modelo()
+            if trocou or (self.dimension and any(len(v) != self.dimension for v in vetores)):
+                # Vetores calculados antes da troca de modelo (ex.: fallback para hashing)
+                vetores = self.embeddings.embed_documents([registro["pergunta"] for registro in registros])
+            
+            with self.lock:
+                for registro, vetor in zip(registros, vetores):
+                    self._indexar(vetor)
+                    registro["id"] = len(self.metadados)
+                    self.metadados.append(registro)
+                    self.historico.append(registro)
+                    self.log.anexar(registro, {"perguntas": vetor})
+                    self._bytes_estimados += self._bytes_registro(registro)
             
+            logger.info(f"💾 {len(registros)} contexto(s) salvo(s) | Total: {len(self.historico)}")
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao salvar contexto: {e}")
+            return
+        
+        if self.log.entradas_no_log >= self.compactar_a_cada or self._excede_retencao():
+            self._agendar_compactacao()
+    
+    def consultar(self, consulta: str, fingerprint: Optional[str] = None, k: int = 3,
+                  threshold: float = 0.25, limiar: Optional[float] = None) -> Dict[str, Any]:
+        """
+        🔎 Busca única do turno: embute a pergunta uma vez e, do mesmo resultado,
+        tira o contexto relevante e (com fingerprint) a resposta reaproveitável.
+        
+        Args:
+            consulta: Pergunta atual
+            fingerprint: Fingerprint dos dados; sem ele o cache semântico não é consultado
+            k: Máximo de conversas no contexto
+            threshold: Similaridade de cosseno mínima para o contexto (0.25 ≈ antigo L2² ≤ 1.5)
+            limiar: Similaridade mínima do cache semântico (padrão: limiar_cache_semantico)
+        
+        Returns:
+            {"vetor": embedding da pergunta (repasse a salvar_contexto),
+             "resposta_semelhante": registro reaproveitável ou None,
+             "contexto": conversas relevantes formatadas ou ""}
+        """
+        limiar = self.limiar_cache_semantico if limiar is None else limiar
+        telemetria = obter_telemetria()
+        
+        with telemetria.medir("busca_memoria"):
+            resultado = {"vetor": None, "resposta_semelhante": None, "contexto": ""}
             try:
-                vetor = self.embeddings.embed_query(consulta)
-                vetor_np = np.array([vetor], dtype="float32")
-                distancias, indices = self.index.search(vetor_np, min(k, self.index.ntotal))
-                
-                contexto_partes = []
-                for dist, idx in zip(distancias[0], indices[0]):
-                    if idx < len(self.metadados) and dist <= threshold:
-                        meta = self.metadados[idx]
-                        contexto_partes.append(
-                            f"🔹 Pergunta: {meta['pergunta']}\n"
-                            f"   Resposta: {meta['resposta'][:200]}...\n"
-                            f"   [Similaridade: {dist:.3f}]"
-                        )
-                
-                if contexto_partes:
-                    logger.info(f"🔍 Encontrados {len(contexto_partes)} contextos relevantes")
-                    return "\n\n".join(contexto_partes)
-                else:
-                    logger.info("🔍 Nenhum contexto relevante encontrado")
-                    return ""
+                # Embedding fora do lock: sessões e o worker de gravação não esperam o modelo
+                resultado["vetor"] = self._embed_consulta(consulta)
+                self.verificar_modelo()
                 
+                with self.lock:
+                    if not self.index or self.index.ntotal == 0:
+                        logger.warning("⚠️ Índice FAISS vazio")
+                        return resultado
+                    
+                    vetor_np = np.array([resultado["vetor"]], dtype="float32")
+                    with telemetria.medir("faiss", indice="memoria"):
+                        similaridades, indices = self.index.search(vetor_np, min(max(k, 5), self.index.ntotal))
+                    vizinhos = [(float(sim), int(idx)) for sim, idx in zip(similaridades[0], indices[0])
+                                if 0 <= idx < len(self.metadados)]
+                    agora = datetime.now().isoformat()
+                    
+                    usados = []
+                    if fingerprint:
+                        resultado["resposta_semelhante"] = self._resposta_semelhante(consulta, fingerprint, vizinhos, limiar)
+                        if resultado["resposta_semelhante"]:
+                            usados.append(resultado["resposta_semelhante"]["id"])
+                    
+                    contexto_partes = []
+                    for sim, idx in vizinhos[:k]:
+                        if sim >= threshold:
+                            meta = self.metadados[idx]
+                            meta["ultimo_acesso"] = agora
+                            usados.append(idx)
+                            contexto_partes.append(
+                                f"🔹 Pergunta: {meta['pergunta']}\n"
+                                f"   Resposta: {meta['resposta'][:200]}...\n"
+                                f"   [Similaridade: {sim:.3f}]"
+                            )
+                    
+                    if usados:
+                        # Último acesso no log: a retenção por LRU vale também após reiniciar
+                        self.log.anexar_acesso(
+                            sorted({self._chave_registro(self.metadados[i]) for i in usados}), agora)
+                    
+                    if contexto_partes:
+                        logger.info(f"🔍 Encontrados {len(contexto_partes)} contextos relevantes")
+                        resultado["contexto"] = "\n\n".join(contexto_partes)
+                    else:
+                        logger.info("🔍 Nenhum contexto relevante encontrado")
+                    
             except Exception as e:
                 logger.error(f"❌ Erro na busca: {e}")
-                return ""
+                telemetria.contar("erros", etapa="busca_memoria")
+            return resultado
+    
+    def buscar_contexto_relevante(self, consulta: str, k: int = 3, threshold: float = 0.25) -> str:
+        """Retorna contexto mais relevante semanticamente (ver `consultar`)."""
+        return self.consultar(consulta, k=k, threshold=threshold)["contexto"]
+    
+    def buscar_resposta_semelhante(self, consulta: str, fingerprint: str,
+                                   limiar: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Cache semântico isolado (ver `consultar`)."""
+        if not fingerprint:
+            return None
+        return self.consultar(consulta, fingerprint, limiar=limiar)["resposta_semelhante"]
+    
+    def _resposta_semelhante(self, consulta: str, fingerprint: str, vizinhos: List[Tuple[float, int]],
+                             limiar: float) -> Optional[Dict[str, Any]]:
+        """
+        🎯 Cache semântico: registro de uma pergunta anterior quase idêntica feita
+        sobre o MESMO conjunto de dados (mesmo fingerprint), ou None.
+        
+        Exige também que os números citados sejam os mesmos ("total de 2023" ≠ "total de 2024").
+        """
+        encontrado = None
+        for similaridade, idx in vizinhos:
+            if similaridade < limiar:
+                break
+            
+            meta = self.metadados[idx]
+            if meta.get("fingerprint") != fingerprint or meta["resposta"].startswith("Erro"):
+                continue
+            if self._numeros(meta["pergunta"]) != self._numeros(consulta):
+                continue
+            
+            meta["ultimo_acesso"] = datetime.now().isoformat()
+            encontrado = dict(meta, similaridade=similaridade, id=idx)
+            break
+        
+        if encontrado:
+            self.cache_semantico_hits += 1
+        else:
+            self.cache_semantico_misses += 1
+        
+        total = self.cache_semantico_hits + self.cache_semantico_misses
+        logger.info(
+            f"🎯 Cache semântico: {'HIT' if encontrado else 'MISS'} | "
+            f"Taxa de acerto: {self.cache_semantico_hits / total:.1%} ({self.cache_semantico_hits}/{total})"
+        )
+        return encontrado
     
     def obter_historico(self, ultimos_n: Optional[int] = None) -> List[Dict[str, Any]]:
         """Retorna histórico completo ou últimos N registros."""
@@ -341,13 +517,15 @@ class MemoriaInteligente:
     
     def limpar(self, limpar_disco: bool = True) -> None:
         """Limpa memória e opcionalmente remove arquivos persistentes."""
-        with self.lock:
+        self.flush()
+        with self._lock_compactacao, self.lock:
             self.historico.clear()
             self.metadados.clear()
             self.index = None
             self.dimension = None
             
             if limpar_disco:
+                self.log.limpar()
                 for caminho in [self.index_path, self.meta_path, self.historico_path]:
                     if os.path.exists(caminho):
                         try:
@@ -358,41 +536,265 @@ class MemoriaInteligente:
             
             logger.info("🗑️ Memória inteligente limpa")
     
-    def _salvar_memoria(self) -> None:
-        """Persiste FAISS + metadados + histórico no disco."""
-        try:
-            if self.index and self.index.ntotal > 0:
-                faiss.write_index(self.index, self.index_path)
+    def compactar(self) -> None:
+        """
+        🗜️ Aplica a política de retenção e compacta o log em um novo snapshot.
+        
+        Se houver despejo, os índices são reconstruídos fora do lock a partir dos
+        vetores mantidos; registros gravados nesse meio tempo são reaplicados na troca.
+        Sob o lock só há cópias em memória; a gravação em disco acontece fora dele.
+        """
+        with self._lock_compactacao:
+            with self.lock:
+                if self.index is None:
+                    return
+                antes = {"registros": len(self.metadados), "bytes": self.log.tamanho_bytes()}
+                total = len(self.metadados)
+                manter = self._selecionar_retencao(total)
+                if manter is not None:
+                    vetores = self.index.vetores[manter]
             
-            with open(self.meta_path, "wb") as f:
-                pickle.dump({"metadados": self.metadados, "dimension": self.dimension}, f)
+            if manter is not None:
+                novo_index = IndiceMemoria.a_partir_de_vetores(vetores)
             
-            with open(self.historico_path, "w", encoding="utf-8") as f:
-                json.dump(self.historico, f, ensure_ascii=False, indent=2)
+            with self.lock:
+                if manter is not None:
+                    # Registros gravados durante a reconstrução
+                    if len(self.metadados) > total:
+                        novo_index.add(self.index.vetores[total:])
+                    self.metadados = [self.metadados[i] for i in manter] + self.metadados[total:]
+                    for posicao, registro in enumerate(self.metadados):
+                        registro["id"] = posicao
+                    self.historico = list(self.metadados)
+                    self.index = novo_index
+                    logger.info(f"🧹 Retenção: {total - len(manter)} registros despejados")
+                self._atualizar_estimativas()
                 
-        except Exception as e:
-            logger.error(f"❌ Erro ao salvar memória: {e}")
+                geracao = self.log.rotacionar()
+                registros = list(self.metadados)
+                indices = {"perguntas": self.index.serializar()}
+            
+            try:
+                self.log.gravar_snapshot(geracao, registros, indices, {"modelo": self.modelo_vetores})
+                self.ultima_compactacao = {
+                    "registros_antes": antes["registros"],
+                    "registros_depois": len(registros),
+                    "tamanho_antes_mb": antes["bytes"] / (1024*1024),
+                    "tamanho_depois_mb": self.log.tamanho_bytes() / (1024*1024),
+                    "quando": datetime.now().isoformat()
+                }
+            except Exception as e:
+                logger.error(f"❌ Erro ao compactar memória: {e}")
+    
+    def _selecionar_retencao(self, total: int) -> Optional[List[int]]:
+        """
+        Posições (em ordem) dos registros que a política de retenção mantém,
+        ou None se nenhum precisa ser despejado.
+        
+        Primeiro descarta os sem uso há mais de `max_idade_dias`; depois mantém os
+        usados mais recentemente até `max_registros` e até o tamanho estimado `max_mb`.
+        """
+        def ultimo_uso(posicao: int) -> str:
+            registro = self.metadados[posicao]
+            return registro.get("ultimo_acesso") or registro.get("timestamp") or ""
+        
+        candidatos = range(total)
+        if self.max_idade_dias:
+            limite = (datetime.now() - timedelta(days=self.max_idade_dias)).isoformat()
+            candidatos = [i for i in candidatos if ultimo_uso(i) >= limite]
+        
+        if self.max_registros or self.max_mb:
+            mantidos, usados = [], 0
+            orcamento = self.max_mb * 1024 * 1024
+            for posicao in sorted(candidatos, key=ultimo_uso, reverse=True):
+                if self.max_registros and len(mantidos) >= self.max_registros:
+                    break
+                if self.max_mb:
+                    usados += self._bytes_registro(self.metadados[posicao])
+                    if usados > orcamento:
+                        break
+                mantidos.append(posicao)
+            candidatos = sorted(mantidos)
+        
+        candidatos = list(candidatos)
+        return None if len(candidatos) == total else candidatos
+    
+    def _bytes_registro(self, registro: Dict[str, Any]) -> int:
+        """Estimativa barata do espaço em disco de um registro (textos + campos + vetor no índice e na matriz)."""
+        return len(registro.get("pergunta", "")) + len(registro.get("resposta", "")) + 256 + 8 * (self.dimension or 0)
+    
+    def _excede_retencao(self) -> bool:
+        """Verificação barata (contagem, bytes estimados, vencimento do uso mais antigo) para antecipar a compactação."""
+        if self.max_registros and len(self.metadados) > self.max_registros:
+            return True
+        if self.max_mb and self._bytes_estimados > self.max_mb * 1024 * 1024:
+            return True
+        return self._vencimento is not None and datetime.now().isoformat() >= self._vencimento
+    
+    def _atualizar_estimativas(self) -> None:
+        """
+        Recalcula (O(n), só na carga e na compactação) os bytes estimados e quando
+        vence o registro usado há mais tempo. Acessos só adiam o vencimento: o valor
+        guardado nunca chega depois do real.
+        """
+        self._bytes_estimados = sum(self._bytes_registro(registro) for registro in self.metadados)
+        self._vencimento = None
+        if self.max_idade_dias and self.metadados:
+            mais_antigo = min(r.get("ultimo_acesso") or r.get("timestamp") or "" for r in self.metadados)
+            try:
+                self._vencimento = (datetime.fromisoformat(mais_antigo) + timedelta(days=self.max_idade_dias)).isoformat()
+            except ValueError:
+                self._vencimento = ""  # sem data: já vencido
+    
+    def _agendar_compactacao(self) -> None:
+        """Dispara a compactação em segundo plano (uma por vez)."""
+        if self._thread_compactacao is not None and self._thread_compactacao.is_alive():
+            return
+        self._thread_compactacao = threading.Thread(target=self.compactar, name="compactacao-memoria", daemon=True)
+        self._thread_compactacao.start()
+    
+    def _indexar(self, vetor) -> None:
+        """Adiciona o vetor da pergunta ao índice (criando-o se preciso)."""
+        if self.index is None:
+            self.dimension = len(vetor)
+            self.index = IndiceMemoria(self.dimension)
+            logger.info(f"🔧 Índice {self.index.tipo.upper()} criado | Dimensão: {self.dimension}")
+        
+        self.index.add(np.array([vetor], dtype="float32"))
     
     def _carregar_memoria(self) -> None:
-        """Carrega FAISS + metadados + histórico do disco."""
+        """Carrega o snapshot vigente e reaplica o log (ou migra o formato antigo)."""
         try:
-            if os.path.exists(self.index_path):
-                self.index = faiss.read_index(self.index_path)
-                logger.info(f"✅ Índice FAISS carregado: {self.index.ntotal} vetores")
-            
-            if os.path.exists(self.meta_path):
+            reindexar = False
+            snapshot = self.log.snapshot_atual()
+            if snapshot:
+                self.metadados = self.log.ler_registros(snapshot)
+                self.index = IndiceMemoria.carregar(
+                    os.path.join(snapshot, "perguntas.faiss"), os.path.join(snapshot, "perguntas.npy"))
+                self.dimension = self.index.dimensao
+                # Vetores de outro modelo (ex.: HuggingFace ↔ hashing) não são comparáveis
+                reindexar = self.log.ler_info(snapshot).get("modelo") != self.modelo_vetores
+                logger.info(f"✅ Snapshot carregado: {len(self.metadados)} registros | Índice {self.index.tipo.upper()}")
+            elif os.path.exists(self.meta_path):
                 with open(self.meta_path, "rb") as f:
-                    dados = pickle.load(f)
-                    self.metadados = dados.get("metadados", [])
-                    self.dimension = dados.get("dimension")
+                    self.metadados = pickle.load(f).get("metadados", [])
+                reindexar = True
+                logger.info(f"🔄 Migrando memória antiga (metadados.pkl): {len(self.metadados)} registros")
+            
+            por_chave = {self._chave_registro(registro): registro for registro in self.metadados}
+            
+            def registrar_acesso(chaves: List[str], quando: str) -> None:
+                for chave in chaves:
+                    registro = por_chave.get(chave)
+                    if registro is not None:
+                        registro["ultimo_acesso"] = quando
             
-            if os.path.exists(self.historico_path):
-                with open(self.historico_path, "r", encoding="utf-8") as f:
-                    self.historico = json.load(f)
+            for registro, vetores in self.log.reler(registrar_acesso):
+                por_chave[self._chave_registro(registro)] = registro
+                vetor = vetores["perguntas"]
+                if reindexar or (self.index is not None and len(vetor) != self.index.dimensao):
+                    reindexar = True
+                else:
+                    self._indexar(vetor)
+                self.metadados.append(registro)
+            if self.log.entradas_no_log:
+                logger.info(f"📝 {self.log.entradas_no_log} registros reaplicados do log")
+            
+            self.historico = list(self.metadados)
+            self._atualizar_estimativas()
+            
+            if reindexar:
+                self._reindexar()
+                self.compactar()
+            elif self.metadados and self._selecionar_retencao(len(self.metadados)) is not None:
+                self._agendar_compactacao()
                     
         except Exception as e:
             logger.warning(f"⚠️ Erro ao carregar memória: {e}")
     
+    def verificar_modelo(self) -> bool:
+        """
+        Acompanha o modelo efetivo dos embeddings: se o handle caiu no fallback
+        (modelo não carregou na primeira embedding), reindexa a memória com ele,
+        como na carga de vetores de outro modelo. Retorna True se reindexou.
+        """
+        nome = getattr(self.embeddings, "nome", self.modelo_vetores)
+        if nome == self.modelo_vetores:
+            return False
+        with self.lock:
+            if nome == self.modelo_vetores:
+                return False
+            logger.warning(f"⚠️ Embeddings trocados de {self.modelo_vetores} para {nome}: reindexando a memória")
+            self.modelo_vetores = nome
+            self._vetores_consulta.clear()
+            self._reindexar()
+        self._agendar_compactacao()
+        return True
+    
+    def _reindexar(self) -> None:
+        """Recalcula (em lote) os vetores de todas as perguntas com o modelo atual."""
+        perguntas = [meta["pergunta"] for meta in self.metadados]
+        self.index = IndiceMemoria.a_partir_de_vetores(self.embeddings.embed_documents(perguntas)) if perguntas else None
+        self.dimension = self.index.dimensao if self.index else None
+        logger.info(f"🔄 {len(perguntas)} perguntas reindexadas com {self.modelo_vetores}")
+    
+    def _embed_consulta(self, texto: str) -> List[float]:
+        """
+        Embedding de consulta com memo das últimas perguntas (busca + cache + save).
+        
+        Chamar SEM self.lock: o lock protege só o memo, nunca o modelo de embeddings.
+        """
+        with self.lock:
+            vetor = self._vetores_consulta.get(texto)
+            if vetor is not None:
+                self._vetores_consulta.move_to_end(texto)
+                return vetor
+        
+        vetor = self.embeddings.embed_query(texto)
+        with self.lock:
+            self._vetores_consulta[texto] = vetor
+            while len(self._vetores_consulta) > 32:
+                self._vetores_consulta.popitem(last=False)
+        return vetor
+    
+    @staticmethod
+    def _chave_registro(registro: Dict[str, Any]) -> str:
+        """Identificador estável do registro (não muda quando a compactação o renumera)."""
+        texto = f"{registro.get('timestamp', '')}\x1f{registro.get('pergunta', '')}"
+        return hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16]
+    
+    @staticmethod
+    def _numeros(texto: str) -> List[str]:
+        """Números citados no texto (ordenados) — devem coincidir no cache semântico."""
+        return sorted(re.findall(r"\d+(?:[.,]\d+)?", texto))
+    
+    def reconstruir_indices(self, tipo: Optional[str] = None) -> Dict[str, Any]:
+        """
+        🔧 Reconstrói o índice e persiste o resultado.
+        
+        Args:
+            tipo: "flat", "hnsw" ou "ivfpq". Padrão: o configurado (auto → conforme o tamanho)
+        
+        Returns:
+            Medições de recall/latência do índice após a reconstrução
+        """
+        with self.lock:
+            if not self.index or self.index.ntotal == 0:
+                return {}
+            
+            self.index.reconstruir(tipo)
+            medicao = self.index.medir()
+        
+        self.compactar()
+        return medicao
+    
+    def medir_indices(self, amostras: int = 200, k: int = 10) -> Dict[str, Any]:
+        """Recall@k e latência do índice atual contra a busca exata."""
+        with self.lock:
+            if not self.index:
+                return {}
+            return self.index.medir(amostras, k)
+    
     def __len__(self) -> int:
         return len(self.historico)
     
@@ -402,8 +804,69 @@ class MemoriaInteligente:
             return {
                 "total_registros": len(self.historico),
                 "total_vetores_faiss": self.index.ntotal if self.index else 0,
+                "tipo_indice": getattr(self.index, "tipo", None),
                 "dimensao_vetor": self.dimension,
-                "tamanho_indice_mb": os.path.getsize(self.index_path) / (1024*1024) if os.path.exists(self.index_path) else 0,
-                "modelo_embeddings": self.model_name,
+                "tamanho_disco_mb": self.log.tamanho_bytes() / (1024*1024),
+                "entradas_no_log": self.log.entradas_no_log,
+                "geracao_snapshot": self.log.geracao_snapshot,
+                "retencao": {
+                    "max_registros": self.max_registros,
+                    "max_idade_dias": self.max_idade_dias,
+                    "max_mb": self.max_mb
+                },
+                "ultima_compactacao": dict(self.ultima_compactacao),
+                "modelo_embeddings": self.modelo_vetores,
+                "limiar_cache_semantico": self.limiar_cache_semantico,
+                "cache_semantico_hits": self.cache_semantico_hits,
+                "cache_semantico_misses": self.cache_semantico_misses,
                 "diretorio_persistencia": self.persist_dir
             }
+
+
+# ══════════════════════════════════════════════════════════════════
+# 4️⃣ SERVIÇO DE MEMÓRIA DO PROCESSO
+# ══════════════════════════════════════════════════════════════════
+_memorias: Dict[str, MemoriaInteligente] = {}
+_lock_memorias = threading.Lock()
+
+
+def obter_memoria(persist_dir: str = "memoria_chatfiscal",
+                  backend_embeddings: Optional[str] = None) -> MemoriaInteligente:
+    """
+    Retorna a MemoriaInteligente única do processo para o diretório.
+    
+    Duas instâncias no mesmo diretório disputariam o log e os snapshots;
+    AgentManager e LLMInteligente devem sempre obter a memória por aqui.
+    O backend de embeddings só vale para a criação (primeira chamada do diretório).
+    """
+    chave = os.path.abspath(persist_dir)
+    with _lock_memorias:
+        if chave not in _memorias:
+            _memorias[chave] = MemoriaInteligente(persist_dir=persist_dir, backend_embeddings=backend_embeddings)
+        return _memorias[chave]
+
+
+# ══════════════════════════════════════════════════════════════════
+# 🔧 MANUTENÇÃO DO ÍNDICE (linha de comando)
+# ══════════════════════════════════════════════════════════════════
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Manutenção do índice da MemoriaInteligente")
+    parser.add_argument("comando", choices=["reconstruir", "medir"],
+                        help="reconstruir: recria e persiste os índices | medir: recall/latência vs busca exata")
+    parser.add_argument("--dir", default="memoria_chatfiscal", help="Diretório de persistência da memória")
+    parser.add_argument("--tipo", choices=["flat", "hnsw", "ivfpq"], help="Tipo de índice (padrão: automático)")
+    parser.add_argument("--amostras", type=int, default=200, help="Consultas usadas na medição")
+    parser.add_argument("-k", type=int, default=10, help="k do recall@k")
+    args = parser.parse_args()
+    
+    memoria = MemoriaInteligente(persist_dir=args.dir)
+    if args.comando == "reconstruir":
+        memoria.reconstruir_indices(args.tipo)
+    elif args.tipo:
+        # Mede um tipo sem persistir: reconstrói só em memória
+        if memoria.index is not None:
+            memoria.index.reconstruir(args.tipo)
+    
+    print(json.dumps(memoria.medir_indices(args.amostras, args.k), indent=2, ensure_ascii=False))
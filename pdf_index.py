@@ -0,0 +1,332 @@
+# pdf_index.py - ÍNDICE VETORIAL ÚNICO DOS PDFs
+"""
+Índice vetorial único dos PDFs do ChatFiscal
+
+Todos os PDFs da sessão ficam em UM índice FAISS. Cada chunk carrega
+`doc_id` (hash do conteúdo do arquivo) e `arquivo` nos metadados, o que
+permite filtrar a busca por documento. Várias consultas são resolvidas
+com uma única chamada em lote ao FAISS, independente do número de PDFs.
+
+A busca é híbrida: o ranking vetorial é combinado ao de um índice léxico
+BM25 (códigos fiscais exatos) por Reciprocal Rank Fusion.
+
+Na indexação, os chunks mais próximos das sondas de "tabela de produtos"
+são marcados (`tabela_produtos`), então perguntas sobre produtos viram uma
+consulta de metadados + uma busca pela pergunta.
+
+Com `persist_dir`, cada PDF indexado é salvo em disco sob o hash do seu
+conteúdo (índice FAISS + chunks) e reanexado sem reprocessamento quando o
+mesmo arquivo é enviado de novo, em qualquer sessão. Vetores salvos por
+outro modelo de embeddings (ex.: backend "hashing" ↔ "huggingface") são
+recalculados na reanexação.
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from lexical_index import IndiceBM25
+from telemetry import obter_telemetria
+
+logger = logging.getLogger(__name__)
+
+# Constante do Reciprocal Rank Fusion: score = Σ 1 / (RRF_K + posição)
+RRF_K = 60
+
+# Sondas que localizam a tabela de produtos/serviços em DANFEs e notas em PDF
+TERMOS_PRODUTO = [
+    "DADOS DOS PRODUTOS SERVIÇOS",
+    "DESCRIÇÃO DOS PRODUTOS",
+    "VALOR UNIT",
+    "QUANTIDADE VALOR"
+]
+
+
+class IndicePDF:
+    """
+    📚 Índice FAISS compartilhado por todos os PDFs carregados.
+    """
+
+    def __init__(self, embeddings_documentos: Embeddings, embeddings_consulta: Optional[Embeddings] = None,
+                 k_produtos: int = 5, persist_dir: Optional[str] = None):
+        """
+        Inicializa o índice vazio.
+
+        Args:
+            embeddings_documentos: Embeddings dos chunks (ex: EmbeddingsComCache)
+            embeddings_consulta: Embeddings das perguntas (padrão: o mesmo dos chunks)
+            k_produtos: Chunks marcados como tabela de produtos, por sonda e por documento
+            persist_dir: Diretório dos índices por documento (None desativa a persistência)
+        """
+        self.embeddings_documentos = embeddings_documentos
+        self.embeddings_consulta = embeddings_consulta or embeddings_documentos
+        self.k_produtos = k_produtos
+        self.persist_dir = persist_dir
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+        self.vetorstore: Optional[FAISS] = None
+        self.bm25 = IndiceBM25()
+        self.documentos: Dict[str, Dict] = {}
+        self._vetores_sondas: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.documentos)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.documentos
+
+    @property
+    def modelo_vetores(self) -> str:
+        """Modelo efetivo dos embeddings (muda se o modelo não carregar e cair no fallback)."""
+        return getattr(self.embeddings_documentos, "nome", type(self.embeddings_documentos).__name__)
+
+    @property
+    def total_chunks(self) -> int:
+        return self.vetorstore.index.ntotal if self.vetorstore else 0
+
+    def adicionar_documento(self, doc_id: str, nome: str, chunks: List[Document]) -> int:
+        """Indexa os chunks de um PDF (ignora documentos já indexados). Retorna nº de chunks."""
+        if doc_id in self.documentos:
+            logger.info(f"PDF '{nome}' ja indexado (doc_id={doc_id})")
+            return self.documentos[doc_id]["chunks"]
+
+        textos = [chunk.page_content for chunk in chunks]
+        vetores = np.asarray(self.embeddings_documentos.embed_documents(textos), dtype="float32")
+
+        posicoes_produtos = self._marcar_tabela_produtos(vetores)
+        for i, chunk in enumerate(chunks):
+            chunk.metadata["doc_id"] = doc_id
+            chunk.metadata["arquivo"] = nome
+            chunk.metadata["tabela_produtos"] = i in posicoes_produtos
+
+        metadados = [chunk.metadata for chunk in chunks]
+        self._anexar(doc_id, nome, textos, vetores, metadados, posicoes_produtos)
+        self._salvar_documento(doc_id, nome, textos, vetores, metadados, posicoes_produtos)
+        return len(chunks)
+
+    def carregar_documento(self, doc_id: str, nome: str) -> bool:
+        """Reanexa um PDF já indexado em disco (sem ler, dividir ou embutir). Retorna True se achou."""
+        if doc_id in self.documentos:
+            return True
+
+        pasta = self._pasta_documento(doc_id)
+        if not pasta or not os.path.exists(os.path.join(pasta, "chunks.json")):
+            return False
+
+        try:
+            with open(os.path.join(pasta, "chunks.json"), "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            textos = [c["texto"] for c in dados["chunks"]]
+            metadados = [dict(c["metadata"], arquivo=nome) for c in dados["chunks"]]
+            produtos = dados["produtos"]
+
+            # Resolve o modelo (ou o fallback) antes de comparar com o do disco
+            carregar = getattr(self.embeddings_documentos, "carregar", None)
+            if carregar is not None:
+                carregar()
+            dimensao_atual = self.vetorstore.index.d if self.vetorstore else dados.get("dimensao")
+            if dados.get("modelo") == self.modelo_vetores and dados.get("dimensao") == dimensao_atual:
+                index = faiss.read_index(os.path.join(pasta, "index.faiss"))
+                vetores = index.reconstruct_n(0, index.ntotal)
+            else:
+                # Vetores de outro modelo não são comparáveis: só o texto dos chunks é reaproveitado
+                logger.info(f"🔄 PDF '{nome}' salvo com {dados.get('modelo')}: recalculando com {self.modelo_vetores}")
+                vetores = np.asarray(self.embeddings_documentos.embed_documents(textos), dtype="float32")
+                produtos = self._marcar_tabela_produtos(vetores)
+                for i, meta in enumerate(metadados):
+                    meta["tabela_produtos"] = i in produtos
+                self._salvar_documento(doc_id, dados.get("nome", nome), textos, vetores, metadados, produtos)
+
+            self._anexar(doc_id, nome, textos, vetores, metadados, produtos)
+            logger.info(f"PDF '{nome}' reanexado do disco (doc_id={doc_id})")
+            return True
+
+        except Exception as e:
+            logger.warning(f"Falha ao reanexar PDF '{nome}' do disco: {e}")
+            return False
+
+    def texto_documento(self, doc_id: str) -> str:
+        """Texto do documento reconstruído a partir dos chunks indexados."""
+        return "\n".join(
+            self.vetorstore.docstore.search(id_chunk).page_content
+            for id_chunk in self.documentos[doc_id]["ids"]
+        )
+
+    def _anexar(self, doc_id: str, nome: str, textos: List[str], vetores: np.ndarray,
+                metadados: List[Dict], posicoes_produtos: List[int]) -> None:
+        """Adiciona chunks já embutidos ao índice único."""
+        pares = list(zip(textos, np.asarray(vetores, dtype="float32").tolist()))
+        inicio = self.total_chunks
+        if self.vetorstore is None:
+            self.vetorstore = FAISS.from_embeddings(pares, self.embeddings_documentos, metadatas=metadados)
+            ids = list(self.vetorstore.index_to_docstore_id.values())
+        else:
+            ids = self.vetorstore.add_embeddings(pares, metadatas=metadados)
+        self.bm25.adicionar(ids, textos, doc_id)
+
+        self.documentos[doc_id] = {
+            "nome": nome,
+            "chunks": len(textos),
+            "ids": ids,
+            # Posições no índice FAISS: a busca filtrada percorre só estas linhas
+            "posicoes": list(range(inicio, inicio + len(textos))),
+            "chunks_produtos": [ids[i] for i in posicoes_produtos]
+        }
+        logger.info(f"PDF '{nome}' adicionado ao indice unico | Total: {self.total_chunks} chunks")
+
+    def _pasta_documento(self, doc_id: str) -> Optional[str]:
+        return os.path.join(self.persist_dir, doc_id) if self.persist_dir else None
+
+    def _salvar_documento(self, doc_id: str, nome: str, textos: List[str], vetores: np.ndarray,
+                          metadados: List[Dict], posicoes_produtos: List[int]) -> None:
+        """Persiste índice FAISS + chunks do documento em <persist_dir>/<doc_id>/."""
+        pasta = self._pasta_documento(doc_id)
+        if not pasta:
+            return
+
+        try:
+            os.makedirs(pasta, exist_ok=True)
+            index = faiss.IndexFlatL2(vetores.shape[1])
+            index.add(np.ascontiguousarray(vetores, dtype="float32"))
+            faiss.write_index(index, os.path.join(pasta, "index.faiss"))
+
+            # chunks.json por último: sua presença marca o documento como completo
+            temp_path = os.path.join(pasta, "chunks.json.tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "nome": nome,
+                    "modelo": self.modelo_vetores,
+                    "dimensao": int(vetores.shape[1]),
+                    "produtos": posicoes_produtos,
+                    "chunks": [{"texto": t, "metadata": m} for t, m in zip(textos, metadados)]
+                }, f, ensure_ascii=False, default=str)
+            os.replace(temp_path, os.path.join(pasta, "chunks.json"))
+
+        except Exception as e:
+            logger.error(f"Erro ao persistir PDF '{nome}': {e}")
+
+    def _marcar_tabela_produtos(self, vetores: np.ndarray) -> List[int]:
+        """Posições dos chunks mais próximos das sondas de produto, da mais à menos próxima."""
+        if self._vetores_sondas is None:
+            self._vetores_sondas = np.asarray(self.embeddings_consulta.embed_documents(TERMOS_PRODUTO), dtype="float32")
+
+        # Distância L2² de cada sonda para cada chunk (sondas × chunks)
+        sondas = self._vetores_sondas
+        distancias = (
+            (sondas ** 2).sum(axis=1)[:, None]
+            + (vetores ** 2).sum(axis=1)[None, :]
+            - 2.0 * sondas @ vetores.T
+        )
+        k = min(self.k_produtos, vetores.shape[0])
+        melhores = np.argsort(distancias, axis=1)[:, :k]
+
+        menor_distancia: Dict[int, float] = {}
+        for sonda, linha in enumerate(melhores):
+            for pos in linha:
+                d = float(distancias[sonda, pos])
+                menor_distancia[int(pos)] = min(d, menor_distancia.get(int(pos), d))
+        return sorted(menor_distancia, key=menor_distancia.get)
+
+    def trechos_produtos(self, doc_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, Document]]:
+        """Chunks marcados como tabela de produtos na indexação (sem nenhuma busca vetorial)."""
+        if self.vetorstore is None:
+            return []
+        alvo = doc_ids or self.documentos.keys()
+        return [
+            (id_chunk, self.vetorstore.docstore.search(id_chunk))
+            for doc_id in alvo if doc_id in self.documentos
+            for id_chunk in self.documentos[doc_id]["chunks_produtos"]
+        ]
+
+    def documentos_citados(self, texto: str) -> List[str]:
+        """doc_ids dos PDFs cujo nome (sem extensão) aparece no texto."""
+        texto_lower = texto.lower()
+        citados = []
+        for doc_id, info in self.documentos.items():
+            nome = info["nome"].lower().rsplit(".", 1)[0]
+            if nome and nome in texto_lower:
+                citados.append(doc_id)
+        return citados
+
+    def buscar(self, consultas: List[str], k: int = 5,
+               doc_ids: Optional[Iterable[str]] = None) -> List[List[Tuple[str, Document, float]]]:
+        """
+        Busca híbrida em lote: embute todas as consultas e faz UMA chamada ao FAISS;
+        cada ranking vetorial é fundido ao ranking BM25 da mesma consulta (RRF).
+
+        Com `doc_ids`, o FAISS só compara as linhas desses documentos (IDSelectorBatch):
+        o documento pedido tem seus k chunks mais próximos mesmo que outros PDFs
+        estejam mais perto da consulta.
+
+        Returns:
+            Para cada consulta, lista de (id_chunk, documento, score RRF) em ordem
+            decrescente de score, restrita a `doc_ids` quando informado.
+        """
+        if self.vetorstore is None or not consultas:
+            return [[] for _ in consultas]
+
+        filtro = set(doc_ids) if doc_ids else None
+        parametros = None
+        if filtro is not None:
+            posicoes = [p for doc_id in filtro if doc_id in self.documentos for p in self.documentos[doc_id]["posicoes"]]
+            parametros = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.asarray(posicoes, dtype="int64")))
+        fetch_k = min(k, self.total_chunks)
+
+        telemetria = obter_telemetria()
+        with telemetria.medir("embedding_consulta", indice="pdf"):
+            vetores = np.asarray(self.embeddings_consulta.embed_documents(consultas), dtype="float32")
+        with telemetria.medir("faiss", indice="pdf"):
+            _, indices = self.vetorstore.index.search(vetores, fetch_k, params=parametros)
+
+        resultados = []
+        for consulta, linha_idx in zip(consultas, indices):
+            ranking_vetorial = [self.vetorstore.index_to_docstore_id[idx] for idx in linha_idx if idx != -1]
+
+            ranking_lexico = [id_chunk for id_chunk, _ in self.bm25.buscar(consulta, k=k, doc_ids=filtro)]
+
+            scores: Dict[str, float] = {}
+            for ranking in (ranking_vetorial, ranking_lexico):
+                for posicao, id_chunk in enumerate(ranking, 1):
+                    scores[id_chunk] = scores.get(id_chunk, 0.0) + 1.0 / (RRF_K + posicao)
+
+            melhores = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            resultados.append([
+                (id_chunk, self.vetorstore.docstore.search(id_chunk), score)
+                for id_chunk, score in melhores
+            ])
+        return resultados
+
+    def buscar_trechos(self, consultas: List[str], k: int = 5,
+                       doc_ids: Optional[Iterable[str]] = None,
+                       incluir_produtos: bool = False) -> List[Document]:
+        """
+        Resultados de várias consultas mesclados, sem chunks repetidos, do mais ao menos
+        relevante. Com `incluir_produtos`, os chunks da tabela de produtos vêm primeiro.
+        """
+        with obter_telemetria().medir("recuperacao_pdf"):
+            produtos = self.trechos_produtos(doc_ids) if incluir_produtos else []
+            vistos = {id_chunk for id_chunk, _ in produtos}
+
+            melhores: Dict[str, Tuple[Document, float]] = {}
+            for encontrados in self.buscar(consultas, k=k, doc_ids=doc_ids):
+                for id_chunk, doc, score in encontrados:
+                    if id_chunk in vistos:
+                        continue
+                    if id_chunk not in melhores or score > melhores[id_chunk][1]:
+                        melhores[id_chunk] = (doc, score)
+
+        ordenados = [doc for doc, _ in sorted(melhores.values(), key=lambda item: item[1], reverse=True)]
+        return [doc for _, doc in produtos] + ordenados
+
+    def limpar(self) -> None:
+        """Remove todos os documentos do índice."""
+        self.vetorstore = None
+        self.bm25.limpar()
+        self.documentos.clear()
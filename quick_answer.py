@@ -0,0 +1,115 @@
+# quick_answer.py - RESPOSTA RÁPIDA LOCAL (PRAZO DO LLM ESGOTADO)
+"""
+Resposta rápida do ChatFiscal, calculada sem LLM
+
+Quando o Gemini não responde dentro do prazo da pergunta, o usuário vê na
+hora o que já dá para calcular localmente, marcado como resposta rápida:
+- Quantos registros a pergunta cita (índice de registros do row_selector)
+- Quantidade, soma, mínimo e máximo das colunas de valor desses registros
+- Os N registros mais relevantes
+- Sem tabela (só PDFs): o início do trecho mais relevante recuperado
+
+A resposta completa substitui esta quando chega.
+"""
+
+import os
+import logging
+from concurrent.futures import Future, TimeoutError as PrazoEsgotado
+from typing import Optional
+
+import pandas as pd
+
+from row_selector import obter_indice_linhas, selecionar_linhas, resumir_agregados
+from table_encoder import formatar_valor
+
+logger = logging.getLogger(__name__)
+
+# Segundos de espera pelo LLM antes da resposta rápida (0: sem prazo)
+PRAZO_RESPOSTA = float(os.getenv("CHATFISCAL_PRAZO_RESPOSTA", "8"))
+
+TOP_REGISTROS = 5
+MAX_COLUNAS_REGISTRO = 6
+MAX_CARACTERES_TRECHO = 600
+
+AVISO = "⚡ **Resposta rápida** (calculada localmente; a análise completa ainda está a caminho)"
+
+
+class RespostaRapida(str):
+    """
+    Texto de resposta rápida: a interface o mostra e o substitui pela resposta completa.
+
+    Na API sem streaming, `completa` é o Future da resposta completa que segue
+    em segundo plano (None se o LLM já estava saturado e ela não foi pedida).
+    """
+
+    completa: Optional[Future] = None
+
+    def aguardar_completa(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Resposta completa, esperando até `timeout` segundos (None se não houver ou não chegar)."""
+        if self.completa is None:
+            return None
+        try:
+            return self.completa.result(timeout=timeout)
+        except PrazoEsgotado:
+            return None
+
+
+def gerar_resposta_rapida(pergunta: str, df: Optional[pd.DataFrame] = None,
+                          contexto_pdf: Optional[str] = None, top: int = TOP_REGISTROS,
+                          chave: Optional[str] = None) -> RespostaRapida:
+    """
+    Resumo local da pergunta a partir dos dados carregados.
+
+    Args:
+        pergunta: Pergunta do usuário
+        df: Dados tabulares (CSV/XML), se houver
+        contexto_pdf: Trechos dos PDFs já recuperados para a pergunta, se houver
+        top: Registros listados
+        chave: Identificador dos dados (padrão: fingerprint do DataFrame)
+    """
+    partes = [AVISO]
+
+    if df is not None and not df.empty:
+        scores, _ = obter_indice_linhas(df, chave).pontuar(pergunta)
+        if scores.any():
+            selecionados, descricao = selecionar_linhas(df, pergunta, max_linhas=top, chave=chave)
+            citados, agregados = descricao.splitlines()
+            partes += [f"**{citados}**", agregados]
+            titulo = f"{len(selecionados)} registro(s) mais relevante(s)"
+        else:
+            partes.append(f"**Todos os registros:** {resumir_agregados(df)}")
+            coluna = _coluna_valor(df)
+            if coluna is not None:
+                selecionados = df.nlargest(top, coluna)
+                titulo = f"{len(selecionados)} maiores valores de {coluna}"
+            else:
+                selecionados = df.head(top)
+                titulo = f"Primeiros {len(selecionados)} registros"
+
+        colunas = [c for c in selecionados.columns if selecionados[c].notna().any()][:MAX_COLUNAS_REGISTRO]
+        linhas = [
+            "- " + "; ".join(f"{c}={formatar_valor(registro[c])}" for c in colunas if formatar_valor(registro[c]))
+            for _, registro in selecionados.iterrows()
+        ]
+        partes.append(f"**{titulo}:**\n" + "\n".join(linhas))
+
+    elif contexto_pdf and contexto_pdf.strip():
+        trecho = " ".join(contexto_pdf.split())[:MAX_CARACTERES_TRECHO]
+        partes.append(f"**Trecho mais relevante dos documentos:**\n> {trecho}...")
+
+    else:
+        partes.append("Nenhum dado carregado para um resumo local.")
+
+    logger.info("⚡ Resposta rápida gerada (prazo do LLM esgotado)")
+    return RespostaRapida("\n\n".join(partes))
+
+
+def _coluna_valor(df: pd.DataFrame) -> Optional[str]:
+    """Primeira coluna numérica de valor/total (critério do resumir_agregados)."""
+    for coluna in df.columns:
+        nome = str(coluna).lower()
+        serie = df[coluna]
+        if ("valor" in nome or "total" in nome) and pd.api.types.is_numeric_dtype(serie) \
+                and not pd.api.types.is_bool_dtype(serie) and serie.notna().any():
+            return coluna
+    return None
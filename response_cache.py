@@ -0,0 +1,282 @@
+# response_cache.py - CACHE DE RESPOSTAS DA LLM
+"""
+Cache de respostas do ChatFiscal
+
+Evita chamadas repetidas ao Gemini para a mesma pergunta sobre os mesmos
+arquivos. A chave combina:
+- Pergunta normalizada (minúsculas, sem acentos/pontuação)
+- Fingerprint dos dados carregados (DataFrame + PDFs da sessão)
+
+Características:
+- Despejo LRU (limite de itens)
+- Expiração por TTL
+- Persistência em disco (sobrevive a reinícios): cada resposta nova é UMA
+  linha acrescentada a um log; o JSON completo só é regravado na compactação
+- Contadores de acertos/falhas
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """Normaliza a pergunta: minúsculas, sem acentos, sem pontuação, espaços únicos."""
+    texto = unicodedata.normalize("NFKD", pergunta or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto.lower())
+    return " ".join(texto.split())
+
+
+def calcular_fingerprint(df: Optional[pd.DataFrame] = None, contexto_pdf: Optional[str] = None,
+                         doc_ids: Optional[Iterable[str]] = None) -> str:
+    """
+    Gera um hash estável do conteúdo carregado (DataFrame + PDFs).
+
+    Os PDFs entram pelos doc_ids (hash do conteúdo de cada arquivo): o trecho
+    recuperado muda com a redação da pergunta, os arquivos carregados não.
+    contexto_pdf fica para quem não tem os doc_ids.
+    """
+    h = hashlib.sha256()
+
+    if df is not None and not df.empty:
+        h.update("|".join(map(str, df.columns)).encode("utf-8"))
+        try:
+            h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        except TypeError:
+            # Células com tipos não-hasheáveis (listas, dicts) → usa CSV
+            h.update(df.to_csv(index=False).encode("utf-8"))
+
+    h.update(b"\x00")
+
+    if doc_ids:
+        h.update("\x1f".join(sorted(set(doc_ids))).encode("utf-8"))
+    elif contexto_pdf:
+        h.update(contexto_pdf.encode("utf-8"))
+
+    return h.hexdigest()[:32]
+
+
+_ultima_tabela: Tuple[Optional[pd.DataFrame], str] = (None, "")
+_lock_tabela = threading.Lock()
+
+
+def fingerprint_tabela(df: pd.DataFrame) -> str:
+    """
+    Fingerprint só do DataFrame (chave do índice de registros do row_selector).
+
+    Calculado uma vez por conjunto de dados: o DataFrame da sessão é trocado,
+    não alterado, a cada upload, então o mesmo objeto reaproveita o hash.
+    """
+    global _ultima_tabela
+    with _lock_tabela:
+        anterior, chave = _ultima_tabela
+    if anterior is df:
+        return chave
+    chave = calcular_fingerprint(df)
+    with _lock_tabela:
+        _ultima_tabela = (df, chave)
+    return chave
+
+
+class CacheRespostas:
+    """
+    ⚡ Cache LRU + TTL de respostas da LLM com persistência em disco.
+    """
+
+    def __init__(self, persist_path: str = "memoria_chatfiscal/cache_respostas.json",
+                 max_itens: int = 500, ttl_segundos: int = 24 * 3600):
+        """
+        Inicializa o cache.
+
+        Args:
+            persist_path: Arquivo JSON de persistência (None desativa o disco)
+            max_itens: Quantidade máxima de respostas (despejo LRU)
+            ttl_segundos: Tempo de vida de cada resposta
+        """
+        self.persist_path = persist_path
+        self.max_itens = max_itens
+        self.ttl_segundos = ttl_segundos
+
+        self.itens: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        # Log append-only ao lado do JSON: compactado depois de max_itens entradas
+        self.log_path = f"{persist_path}.log" if persist_path else None
+        self.entradas_no_log = 0
+        self._arquivo_log = None
+
+        if self.persist_path:
+            diretorio = os.path.dirname(self.persist_path)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            self._carregar()
+
+        logger.info(f"✅ CacheRespostas inicializado | Itens: {len(self.itens)}")
+
+    @staticmethod
+    def gerar_chave(pergunta: str, fingerprint: str) -> str:
+        """Chave do cache: hash da pergunta normalizada + fingerprint dos dados."""
+        base = f"{normalizar_pergunta(pergunta)}\x00{fingerprint}"
+        return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+    def obter(self, pergunta: str, fingerprint: str) -> Optional[str]:
+        """Retorna a resposta em cache (ou None) e atualiza os contadores."""
+        chave = self.gerar_chave(pergunta, fingerprint)
+
+        with self.lock:
+            item = self.itens.get(chave)
+
+            if item is not None and self._expirado(item):
+                del self.itens[chave]
+                item = None
+
+            if item is None:
+                self.misses += 1
+                return None
+
+            self.itens.move_to_end(chave)
+            self.hits += 1
+            return item["resposta"]
+
+    def salvar(self, pergunta: str, fingerprint: str, resposta: str) -> None:
+        """Armazena uma resposta, aplicando o limite LRU, e a acrescenta ao log em disco (O(1))."""
+        chave = self.gerar_chave(pergunta, fingerprint)
+
+        with self.lock:
+            item = {
+                "pergunta": normalizar_pergunta(pergunta),
+                "fingerprint": fingerprint,
+                "resposta": resposta,
+                "criado_em": time.time()
+            }
+            self.itens[chave] = item
+            self.itens.move_to_end(chave)
+
+            while len(self.itens) > self.max_itens:
+                self.itens.popitem(last=False)
+
+            self._anexar(chave, item)
+
+    def limpar(self, limpar_disco: bool = True) -> None:
+        """Esvazia o cache e opcionalmente remove o arquivo persistente."""
+        with self.lock:
+            self.itens.clear()
+            self.hits = 0
+            self.misses = 0
+
+            if limpar_disco and self.persist_path:
+                self._fechar_log()
+                self.entradas_no_log = 0
+                for caminho in (self.persist_path, self.log_path):
+                    if not os.path.exists(caminho):
+                        continue
+                    try:
+                        os.remove(caminho)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Erro ao remover {caminho}: {e}")
+
+        logger.info("🗑️ Cache de respostas limpo")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna contadores de acertos/falhas do cache."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self.itens),
+                "max_itens": self.max_itens,
+                "ttl_segundos": self.ttl_segundos,
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0
+            }
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.itens)
+
+    def _expirado(self, item: Dict[str, Any]) -> bool:
+        return time.time() - item["criado_em"] > self.ttl_segundos
+
+    def _anexar(self, chave: str, item: Dict[str, Any]) -> None:
+        """Acrescenta uma linha ao log; passadas max_itens entradas, compacta no JSON."""
+        if not self.persist_path:
+            return
+
+        try:
+            if self._arquivo_log is None:
+                self._arquivo_log = open(self.log_path, "a", encoding="utf-8")
+            self._arquivo_log.write(json.dumps([chave, item], ensure_ascii=False) + "\n")
+            self._arquivo_log.flush()
+            self.entradas_no_log += 1
+        except Exception as e:
+            logger.error(f"❌ Erro ao salvar cache de respostas: {e}")
+            return
+
+        if self.entradas_no_log >= self.max_itens:
+            self._salvar()
+
+    def _salvar(self) -> None:
+        """Compacta: grava o cache inteiro de forma atômica (temporário + replace) e esvazia o log."""
+        if not self.persist_path:
+            return
+
+        try:
+            temp_path = f"{self.persist_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(list(self.itens.items()), f, ensure_ascii=False)
+            os.replace(temp_path, self.persist_path)
+
+            self._fechar_log()
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self.entradas_no_log = 0
+        except Exception as e:
+            logger.error(f"❌ Erro ao salvar cache de respostas: {e}")
+
+    def _fechar_log(self) -> None:
+        if self._arquivo_log is not None:
+            self._arquivo_log.close()
+            self._arquivo_log = None
+
+    def _carregar(self) -> None:
+        """Carrega o JSON compactado e reaplica o log, descartando itens expirados."""
+        try:
+            if os.path.exists(self.persist_path):
+                with open(self.persist_path, "r", encoding="utf-8") as f:
+                    for chave, item in json.load(f):
+                        self.itens[chave] = item
+
+            if os.path.exists(self.log_path):
+                with open(self.log_path, "r", encoding="utf-8") as f:
+                    for linha in f:
+                        try:
+                            chave, item = json.loads(linha)
+                        except (json.JSONDecodeError, ValueError):
+                            # Última linha truncada por uma queda no meio da escrita
+                            continue
+                        self.itens[chave] = item
+                        self.itens.move_to_end(chave)
+                        self.entradas_no_log += 1
+
+            for chave in [c for c, item in self.itens.items() if self._expirado(item)]:
+                del self.itens[chave]
+
+            while len(self.itens) > self.max_itens:
+                self.itens.popitem(last=False)
+
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao carregar cache de respostas: {e}")
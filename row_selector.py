@@ -0,0 +1,208 @@
+# row_selector.py - SELEÇÃO DE REGISTROS PELA PERGUNTA
+"""
+Seleção de registros relevantes à pergunta no ChatFiscal
+
+O prompt só comporta algumas dezenas de registros; mandar sempre os
+primeiros (df.head) faz perguntas sobre um fornecedor, CNPJ ou número de
+nota mais abaixo no arquivo caírem em "dado não disponível". Aqui:
+- Um índice invertido sobre o DataFrame INTEIRO (termo → registros),
+  montado uma vez por conjunto de dados a partir dos valores distintos de
+  cada coluna (nomes, UFs e códigos se repetem muito em notas fiscais)
+- CNPJ, CPF e chaves de acesso casam com ou sem pontuação (tokenizar do
+  índice léxico); números curtos só em colunas de identificação
+- Registros ranqueados pelos termos da pergunta (peso IDF: termos
+  presentes em quase todos os registros não discriminam nada)
+- Agregados (quantidade, soma, mínimo, máximo) dos registros encontrados
+"""
+
+import re
+import math
+import threading
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from lexical_index import tokenizar
+from response_cache import fingerprint_tabela
+
+logger = logging.getLogger(__name__)
+
+# Colunas numéricas indexadas como identificadores (número da nota, CNPJ, CFOP...).
+# Comparadas com as palavras inteiras do nome: "total_vNF" (valor da nota) não é identificador
+DICAS_IDENTIFICADOR = frozenset({"cnpj", "cpf", "numero", "num", "nnf", "chave", "chnfe", "cod", "codigo",
+                                 "cfop", "ncm", "serie", "nf", "nfe", "nfse"})
+
+# Palavras de pergunta que não identificam registro algum
+PALAVRAS_VAZIAS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "e", "em", "no", "na",
+    "nos", "nas", "ao", "aos", "para", "por", "com", "sem", "que", "qual", "quais", "quem",
+    "quanto", "quantos", "quantas", "como", "onde", "quando", "foi", "foram", "e", "sao",
+    "ser", "tem", "ha", "me", "mais", "menos", "sobre", "entre"
+}
+
+# Termo presente em mais que esta fração dos registros é ignorado
+FRACAO_MAX_TERMO = 0.5
+
+# Peso extra de códigos longos (CNPJ, CPF, chave de acesso) sobre palavras
+PESO_CODIGO = 3.0
+
+MAX_INDICES = 4
+
+
+class IndiceLinhas:
+    """
+    🔎 Índice invertido termo → registros de um DataFrame.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.total = len(df)
+        # termo → lista de (posição da coluna, código do valor distinto)
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._codigos: List[np.ndarray] = []
+
+        for coluna in df.columns:
+            serie = df[coluna]
+            if pd.api.types.is_numeric_dtype(serie) and not self._eh_identificador(coluna, serie):
+                continue
+
+            codigos, distintos = pd.factorize(serie)
+            posicao = len(self._codigos)
+            self._codigos.append(codigos)
+            for i, valor in enumerate(distintos):
+                for termo in set(tokenizar(_texto(valor))):
+                    self._postings[termo].append((posicao, i))
+
+        logger.info(f"🔎 Índice de registros: {self.total} registros, {len(self._postings)} termos, "
+                    f"{len(self._codigos)} colunas")
+
+    @staticmethod
+    def _eh_identificador(coluna, serie: pd.Series) -> bool:
+        """Coluna numérica de valores inteiros com nome de identificador."""
+        if DICAS_IDENTIFICADOR.isdisjoint(re.split(r"[^a-z0-9]+", str(coluna).lower())):
+            return False
+        valores = serie.dropna()
+        if pd.api.types.is_bool_dtype(serie):
+            return False
+        return pd.api.types.is_integer_dtype(serie) or bool((valores == np.floor(valores)).all())
+
+    def registros_com(self, termo: str) -> np.ndarray:
+        """Máscara booleana dos registros que contêm o termo em alguma coluna."""
+        mascara = np.zeros(self.total, dtype=bool)
+        por_coluna: Dict[int, List[int]] = defaultdict(list)
+        for posicao, codigo in self._postings.get(termo, ()):
+            por_coluna[posicao].append(codigo)
+        for posicao, codigos in por_coluna.items():
+            mascara |= np.isin(self._codigos[posicao], codigos)
+        return mascara
+
+    def pontuar(self, pergunta: str) -> Tuple[np.ndarray, List[str]]:
+        """
+        Score de cada registro para a pergunta.
+
+        Returns:
+            (scores, termos que discriminaram algum registro)
+        """
+        scores = np.zeros(self.total, dtype="float64")
+        usados = []
+        termos = list(dict.fromkeys(tokenizar(pergunta)))
+        codigos = [t for t in termos if t.isdigit() and len(t) >= 8]
+        for termo in termos:
+            if termo in PALAVRAS_VAZIAS or termo not in self._postings:
+                continue
+            # Pedaços de um código pontuado ("12.345.678/0001-90" → "12", "345"...) não contam
+            if termo.isdigit() and len(termo) < 8 and any(termo in codigo for codigo in codigos):
+                continue
+            mascara = self.registros_com(termo)
+            frequencia = int(mascara.sum())
+            if frequencia == 0 or (self.total >= 4 and frequencia > FRACAO_MAX_TERMO * self.total):
+                continue
+            peso = math.log(1 + self.total / frequencia)
+            if termo.isdigit() and len(termo) >= 8:
+                peso *= PESO_CODIGO
+            scores[mascara] += peso
+            usados.append(termo)
+        return scores, usados
+
+
+def _texto(valor) -> str:
+    """Valor distinto → texto indexado (inteiros em float, como CNPJ lido do CSV, sem ".0")."""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+_indices: "OrderedDict[str, IndiceLinhas]" = OrderedDict()
+_lock_indices = threading.Lock()
+
+
+def obter_indice_linhas(df: pd.DataFrame, chave: Optional[str] = None) -> IndiceLinhas:
+    """Índice do DataFrame, reaproveitado entre perguntas sobre os mesmos dados (LRU pequeno)."""
+    chave = chave or fingerprint_tabela(df)
+    with _lock_indices:
+        if chave in _indices:
+            _indices.move_to_end(chave)
+            return _indices[chave]
+
+    indice = IndiceLinhas(df)
+    with _lock_indices:
+        _indices[chave] = indice
+        while len(_indices) > MAX_INDICES:
+            _indices.popitem(last=False)
+    return indice
+
+
+def resumir_agregados(df: pd.DataFrame) -> str:
+    """Quantidade de registros e soma/mín/máx das colunas de valor."""
+    partes = [f"{len(df)} registro(s)"]
+    for coluna in df.columns:
+        nome = str(coluna).lower()
+        if ("valor" in nome or "total" in nome) and pd.api.types.is_numeric_dtype(df[coluna]):
+            serie = df[coluna].dropna()
+            if pd.api.types.is_bool_dtype(serie) or serie.empty:
+                continue
+            partes.append(f"{coluna}: Soma={serie.sum():.2f}, Min={serie.min():.2f}, Max={serie.max():.2f}")
+    return "; ".join(partes)
+
+
+def selecionar_linhas(df: pd.DataFrame, pergunta: str, max_linhas: int = 50,
+                      chave: Optional[str] = None) -> Tuple[pd.DataFrame, str]:
+    """
+    Registros a enviar ao LLM para a pergunta.
+
+    Args:
+        df: DataFrame completo
+        pergunta: Pergunta do usuário
+        max_linhas: Máximo de registros devolvidos
+        chave: Identificador dos dados (padrão: fingerprint do DataFrame)
+
+    Returns:
+        (registros, descrição da seleção para o prompt). Sem registros
+        correspondentes, devolve os primeiros `max_linhas`.
+    """
+    if df is None or df.empty:
+        return df, ""
+
+    scores, termos = obter_indice_linhas(df, chave).pontuar(pergunta)
+    if not scores.any():
+        amostra = df.head(max_linhas)
+        if len(amostra) == len(df):
+            return amostra, ""
+        return amostra, f"Nenhum registro específico citado na pergunta: primeiros {len(amostra)} de {len(df)} registros"
+
+    # Correspondem: ao menos metade do melhor score (casamentos só de termos secundários ficam de fora)
+    encontrados = np.flatnonzero(scores >= scores.max() / 2)
+
+    # Maior score primeiro; empate mantém a ordem do arquivo
+    ordem = encontrados[np.argsort(-scores[encontrados], kind="stable")]
+    selecionados = df.iloc[ordem[:max_linhas]]
+
+    descricao = (
+        f"{len(encontrados)} de {len(df)} registros correspondem a: {', '.join(termos)}"
+        f" (exibindo {len(selecionados)}, mais relevantes primeiro)\n"
+        f"Agregados dos registros correspondentes: {resumir_agregados(df.iloc[encontrados])}"
+    )
+    logger.info(f"🎯 {len(encontrados)} registros selecionados pela pergunta ({', '.join(termos)})")
+    return selecionados, descricao
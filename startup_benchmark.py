@@ -0,0 +1,221 @@
+# startup_benchmark.py - MEDIÇÃO DA ABERTURA DO APP
+"""
+Benchmark de inicialização do ChatFiscal
+
+Mede, sempre em um processo Python novo (imports frios):
+- Tempo até a primeira renderização do app.py (streamlit AppTest: imports +
+  primeira execução completa do script)
+- Custo de importar cada módulo do topo do app.py (python -X importtime)
+- Se algum módulo pesado que deveria ser importado só no uso (relatório PDF,
+  OCR, gráficos, leitores de PDF, modelo de embeddings) entrou na abertura
+
+Com --referencia, compara com uma medição salva e sai com código 1 quando a
+abertura piora além da tolerância.
+
+Uso:
+    python startup_benchmark.py --saida startup.json
+    python startup_benchmark.py --referencia startup.json --tolerancia 0.25
+"""
+
+import os
+import re
+import ast
+import sys
+import json
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_APP = os.path.join(DIRETORIO_APP, "app.py")
+
+# Importados só nos pontos de uso; não devem aparecer na abertura
+MODULOS_ADIADOS = (
+    "gerar_pdf", "reportlab",                                   # relatório PDF
+    "pytesseract", "PIL",                                       # OCR
+    "visualizacao.interface", "plotly", "matplotlib", "seaborn",  # gráficos
+    "PyPDF2", "langchain_text_splitters", "pdf_index",          # leitura/índice de PDF
+    "langchain_huggingface", "sentence_transformers", "torch",  # modelo de embeddings
+)
+
+_LINHA_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def modulos_do_app(script: str = SCRIPT_APP) -> List[str]:
+    """Módulos importados no nível do módulo do script (inclusive dentro de try/if do topo)."""
+    with open(script, encoding="utf-8") as f:
+        arvore = ast.parse(f.read(), filename=script)
+
+    modulos: List[str] = []
+    pendentes = list(arvore.body)
+    while pendentes:
+        no = pendentes.pop(0)
+        if isinstance(no, ast.Import):
+            modulos.extend(alias.name for alias in no.names)
+        elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+            modulos.append(no.module)
+        elif isinstance(no, (ast.Try, ast.If)):
+            pendentes.extend(no.body)
+    return list(dict.fromkeys(modulos))
+
+
+def interpretar_importtime(saida: str) -> List[Dict]:
+    """
+    Linhas do `python -X importtime` → registros por módulo.
+
+    Returns:
+        Lista de {modulo, proprio_ms, cumulativo_ms, nivel} na ordem da saída
+        (nível 0: importado diretamente pelo código medido)
+    """
+    registros = []
+    for linha in saida.splitlines():
+        casamento = _LINHA_IMPORTTIME.match(linha)
+        if not casamento:
+            continue
+        proprio, cumulativo, recuo, modulo = casamento.groups()
+        registros.append({
+            "modulo": modulo,
+            "proprio_ms": int(proprio) / 1000,
+            "cumulativo_ms": int(cumulativo) / 1000,
+            "nivel": max(0, (len(recuo) - 1) // 2)
+        })
+    return registros
+
+
+def medir_importacoes(modulos: Optional[List[str]] = None, top: int = 15, repeticoes: int = 3) -> Dict:
+    """
+    Custo de importar os módulos (padrão: os do topo do app.py) em processos novos.
+
+    Returns:
+        Medição de total mediano entre as repetições:
+        {total_ms, por_modulo: {modulo: ms}, mais_pesados: [...], adiados_carregados: [...]}
+    """
+    modulos = modulos if modulos is not None else modulos_do_app()
+    medicoes = sorted((_medir_importacoes_uma_vez(modulos, top) for _ in range(max(1, repeticoes))),
+                      key=lambda m: m["total_ms"])
+    return medicoes[len(medicoes) // 2]
+
+
+def _medir_importacoes_uma_vez(modulos: List[str], top: int) -> Dict:
+    codigo = "\n".join(f"try:\n    import {m}\nexcept Exception:\n    pass" for m in modulos)
+    # sys.modules, não o importtime: este também lista imports que falharam
+    codigo += f"\nimport sys, json\nprint(json.dumps([m for m in {MODULOS_ADIADOS!r} if m in sys.modules]))"
+    with tempfile.TemporaryDirectory() as cwd:
+        processo = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", codigo],
+            capture_output=True, text=True, cwd=cwd, env=_ambiente()
+        )
+    registros = interpretar_importtime(processo.stderr)
+    linhas = processo.stdout.strip().splitlines()
+
+    raiz = [r for r in registros if r["nivel"] == 0]
+    pedidos = set(modulos)
+    return {
+        "total_ms": sum(r["cumulativo_ms"] for r in raiz),
+        "por_modulo": {r["modulo"]: r["cumulativo_ms"] for r in raiz if r["modulo"] in pedidos},
+        "mais_pesados": sorted(
+            ({"modulo": r["modulo"], "cumulativo_ms": r["cumulativo_ms"]} for r in registros),
+            key=lambda r: -r["cumulativo_ms"]
+        )[:top],
+        "adiados_carregados": json.loads(linhas[-1]) if linhas else []
+    }
+
+
+def medir_primeira_renderizacao(script: str = SCRIPT_APP, timeout: float = 120, repeticoes: int = 3) -> Dict:
+    """
+    Tempo do início do processo até o fim da primeira execução do script no AppTest.
+
+    Cada repetição roda em um processo novo e em um diretório temporário:
+    memória, índices e logs criados pelo app não tocam os dados do projeto.
+
+    Returns:
+        {primeira_renderizacao_s (mediana), amostras_s, excecoes: [...], adiados_carregados: [...]}
+    """
+    codigo = f"""
+import sys, json, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+teste = AppTest.from_file({script!r}, default_timeout={timeout!r})
+teste.run()
+duracao = time.perf_counter() - inicio
+print(json.dumps({{
+    "primeira_renderizacao_s": duracao,
+    "excecoes": [str(e.value) for e in teste.exception],
+    "adiados_carregados": [m for m in {MODULOS_ADIADOS!r} if m in sys.modules]
+}}))
+"""
+    execucoes = []
+    for _ in range(max(1, repeticoes)):
+        with tempfile.TemporaryDirectory() as cwd:
+            processo = subprocess.run(
+                [sys.executable, "-c", codigo],
+                capture_output=True, text=True, cwd=cwd, env=_ambiente(), timeout=timeout + 60
+            )
+        linhas = processo.stdout.strip().splitlines()
+        if processo.returncode != 0 or not linhas:
+            raise RuntimeError(f"Falha ao executar {script}: {processo.stderr[-2000:]}")
+        execucoes.append(json.loads(linhas[-1]))
+
+    amostras = sorted(e["primeira_renderizacao_s"] for e in execucoes)
+    return {
+        "primeira_renderizacao_s": amostras[len(amostras) // 2],
+        "amostras_s": amostras,
+        "excecoes": execucoes[-1]["excecoes"],
+        "adiados_carregados": sorted({m for e in execucoes for m in e["adiados_carregados"]})
+    }
+
+
+def comparar(atual: Dict, referencia: Dict, tolerancia: float = 0.25) -> List[str]:
+    """Regressões da medição atual frente à referência (lista vazia: nenhuma)."""
+    regressoes = []
+    pares = [
+        ("primeira renderização", atual["renderizacao"]["primeira_renderizacao_s"],
+         referencia["renderizacao"]["primeira_renderizacao_s"], "s"),
+        ("importações do app.py", atual["importacoes"]["total_ms"], referencia["importacoes"]["total_ms"], "ms"),
+    ]
+    for nome, valor, base, unidade in pares:
+        if base and valor > base * (1 + tolerancia):
+            regressoes.append(f"{nome}: {valor:.2f} {unidade} (referência {base:.2f} {unidade}, "
+                              f"+{(valor / base - 1) * 100:.0f}%)")
+
+    novos = (set(atual["importacoes"]["adiados_carregados"]) | set(atual["renderizacao"]["adiados_carregados"])) - (
+        set(referencia["importacoes"]["adiados_carregados"]) | set(referencia["renderizacao"]["adiados_carregados"]))
+    if novos:
+        regressoes.append(f"módulos adiados voltaram à abertura: {', '.join(sorted(novos))}")
+    return regressoes
+
+
+def _ambiente() -> Dict[str, str]:
+    """Ambiente do processo medido: módulos do projeto no PYTHONPATH."""
+    caminhos = [DIRETORIO_APP] + [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p]
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(caminhos))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização do ChatFiscal")
+    parser.add_argument("--script", default=SCRIPT_APP, help="Script Streamlit medido")
+    parser.add_argument("--timeout", type=float, default=120, help="Segundos para a primeira execução do script")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Processos medidos (vale a mediana)")
+    parser.add_argument("--saida", help="Grava a medição em JSON (referência para comparações futuras)")
+    parser.add_argument("--referencia", help="Medição anterior (JSON) para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Piora relativa aceita frente à referência")
+    args = parser.parse_args()
+
+    medicao = {
+        "renderizacao": medir_primeira_renderizacao(args.script, args.timeout, args.repeticoes),
+        "importacoes": medir_importacoes(modulos_do_app(args.script), repeticoes=args.repeticoes)
+    }
+    print(json.dumps(medicao, indent=2, ensure_ascii=False))
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(medicao, f, indent=2, ensure_ascii=False)
+
+    if args.referencia:
+        with open(args.referencia, encoding="utf-8") as f:
+            regressoes = comparar(medicao, json.load(f), args.tolerancia)
+        for regressao in regressoes:
+            print(f"⚠️ Regressão: {regressao}", file=sys.stderr)
+        sys.exit(1 if regressoes else 0)
@@ -0,0 +1,120 @@
+# table_encoder.py - CODIFICAÇÃO COMPACTA DE TABELAS PARA O PROMPT
+"""
+Codificador compacto de DataFrames fiscais para o ChatFiscal
+
+Substitui o df.head(n).to_json(orient='records', indent=2), que repete o
+nome de TODAS as colunas (inclusive as vazias) em cada registro:
+- Remove colunas sempre vazias (comuns em NF-e largas)
+- Valores iguais em todos os registros recebidos (emitente, UF, data...)
+  saem uma única vez, antes da tabela, rotulados como comuns aos registros
+  listados: quem chama costuma passar só uma seleção do DataFrame, e o
+  valor pode variar no restante dos dados
+- Layout colunar tipo CSV: cabeçalho uma vez, uma linha por registro
+- Números sem zeros supérfluos e células longas encurtadas
+- Linhas entram até o orçamento de tokens; as demais são contadas no rodapé
+"""
+
+import os
+import logging
+from typing import List, Optional
+
+import pandas as pd
+
+from context_packer import estimar_tokens
+
+logger = logging.getLogger(__name__)
+
+ORCAMENTO_TABELA = int(os.getenv("CHATFISCAL_ORCAMENTO_TABELA", "3000"))
+
+SEPARADOR = ";"
+MAX_CARACTERES_CELULA = 120
+
+# Constantes só na seleção enviada, não necessariamente no conjunto de dados inteiro
+ROTULO_COMUNS = "Valores comuns a todos os registros listados (não necessariamente aos demais): "
+
+
+def formatar_valor(valor) -> str:
+    """Valor de célula em texto curto (vazio para nulos)."""
+    if valor is None:
+        return ""
+    try:
+        if pd.isna(valor):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    if isinstance(valor, bool):
+        return "sim" if valor else "não"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    if isinstance(valor, pd.Timestamp):
+        return valor.strftime("%Y-%m-%d") if valor == valor.normalize() else valor.isoformat(sep=" ")
+
+    texto = " ".join(str(valor).split())
+    if len(texto) > MAX_CARACTERES_CELULA:
+        texto = texto[:MAX_CARACTERES_CELULA - 3] + "..."
+    # Separador/aspas dentro do valor: aspas como no CSV
+    if SEPARADOR in texto or '"' in texto:
+        texto = '"' + texto.replace('"', '""') + '"'
+    return texto
+
+
+def codificar_tabela(df: pd.DataFrame, orcamento_tokens: int = ORCAMENTO_TABELA,
+                     max_linhas: Optional[int] = None) -> str:
+    """
+    Codifica o DataFrame em texto compacto para o prompt.
+
+    Args:
+        df: Registros a enviar (na ordem desejada)
+        orcamento_tokens: Máximo de tokens (estimados) do texto final
+        max_linhas: Limite de linhas além do orçamento (None: só o orçamento)
+
+    Returns:
+        Bloco "valores comuns" + tabela separada por ";" + rodapé de linhas omitidas
+    """
+    if df is None or df.empty:
+        return "(nenhum registro)"
+
+    celulas = df.map(formatar_valor) if hasattr(df, "map") else df.applymap(formatar_valor)
+
+    # Colunas sempre vazias
+    preenchidas = [col for col in celulas.columns if (celulas[col] != "").any()]
+    removidas = len(celulas.columns) - len(preenchidas)
+    celulas = celulas[preenchidas]
+
+    # Colunas com o mesmo valor em todos os registros recebidos: uma vez, no cabeçalho
+    comuns: List[str] = []
+    if len(celulas) > 1:
+        constantes = [col for col in celulas.columns if celulas[col].nunique() == 1]
+        comuns = [f"{col}={celulas[col].iloc[0]}" for col in constantes]
+        celulas = celulas.drop(columns=constantes)
+
+    partes = []
+    if comuns:
+        partes.append(ROTULO_COMUNS + SEPARADOR.join(comuns))
+    if len(celulas.columns):
+        partes.append(SEPARADOR.join(str(col) for col in celulas.columns))
+    usados = sum(estimar_tokens(p) + 1 for p in partes)
+
+    limite = len(celulas) if max_linhas is None else min(max_linhas, len(celulas))
+    incluidas = 0
+    if len(celulas.columns):
+        for linha in celulas.head(limite).itertuples(index=False):
+            texto = SEPARADOR.join(linha)
+            custo = estimar_tokens(texto) + 1
+            if usados + custo > orcamento_tokens and incluidas:
+                break
+            partes.append(texto)
+            usados += custo
+            incluidas += 1
+    else:
+        incluidas = len(celulas)
+
+    omitidas = len(df) - incluidas
+    if omitidas:
+        partes.append(f"[... +{omitidas} registro(s) não exibido(s)]")
+
+    logger.info(
+        f"📦 Tabela codificada: ~{usados} tokens, {incluidas}/{len(df)} registros, "
+        f"{len(celulas.columns)} colunas (+{len(comuns)} comuns, {removidas} vazias removidas)"
+    )
+    return "\n".join(partes)
@@ -0,0 +1,256 @@
+# telemetry.py - TELEMETRIA DE LATÊNCIA, TOKENS, CACHE E ERROS
+"""
+Telemetria do ChatFiscal
+
+Mostra onde cada resposta gasta o tempo (memória, busca FAISS, recuperação
+nos PDFs, chamada ao LLM) sem depender de um servidor de métricas:
+- Histogramas de latência por etapa, com rótulos (ex.: modo csv/pdf/consolidada)
+- Contadores de tokens do prompt e da resposta, acertos de cache e erros
+- Exportação em texto do Prometheus (node_exporter textfile collector) ou JSON,
+  gravada em arquivo local (CHATFISCAL_METRICAS=caminho.prom ou .json)
+
+Uso:
+    with obter_telemetria().medir("resposta", modo="csv"):
+        ...
+    obter_telemetria().contar("cache", cache="exato", resultado="acerto")
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = "chatfiscal"
+
+# Limites superiores (segundos) dos baldes de latência: de buscas locais a respostas do Gemini
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60)
+
+ARQUIVO_METRICAS = os.getenv("CHATFISCAL_METRICAS", "")
+INTERVALO_EXPORTACAO = float(os.getenv("CHATFISCAL_METRICAS_INTERVALO", "15"))
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+class Histograma:
+    """Contagens cumulativas por balde, soma e total (formato do Prometheus)."""
+
+    def __init__(self, baldes: Tuple[float, ...] = BALDES_SEGUNDOS):
+        self.baldes = baldes
+        self.contagens = [0] * (len(baldes) + 1)  # último: +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        self.contagens[bisect.bisect_left(self.baldes, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def quantil(self, q: float) -> Optional[float]:
+        """Estimativa do quantil por interpolação linear dentro do balde (como histogram_quantile)."""
+        if not self.total:
+            return None
+        alvo = q * self.total
+        acumulado = 0
+        for i, contagem in enumerate(self.contagens):
+            if acumulado + contagem >= alvo and contagem:
+                if i == len(self.baldes):
+                    return self.baldes[-1]
+                inicio = self.baldes[i - 1] if i else 0.0
+                return inicio + (self.baldes[i] - inicio) * (alvo - acumulado) / contagem
+            acumulado += contagem
+        return self.baldes[-1]
+
+
+class Telemetria:
+    """
+    📈 Registro de métricas do processo (thread-safe).
+
+    Histogramas ficam em `<prefixo>_<nome>_segundos`, contadores em
+    `<prefixo>_<nome>_total`; cada combinação de rótulos é uma série.
+    """
+
+    def __init__(self, arquivo: Optional[str] = None, intervalo: Optional[float] = None):
+        """
+        Args:
+            arquivo: Exportação periódica (.json: JSON; outra extensão: texto Prometheus).
+                     Padrão: CHATFISCAL_METRICAS (vazio: sem exportação)
+            intervalo: Segundos mínimos entre gravações (padrão: CHATFISCAL_METRICAS_INTERVALO)
+        """
+        self.arquivo = ARQUIVO_METRICAS if arquivo is None else arquivo
+        self.intervalo = INTERVALO_EXPORTACAO if intervalo is None else intervalo
+        self._histogramas: Dict[str, Dict[Rotulos, Histograma]] = {}
+        self._contadores: Dict[str, Dict[Rotulos, float]] = {}
+        self._lock = threading.Lock()
+        self._ultima_gravacao = 0.0
+
+    # ═══════════════════════════════════════════════════════════
+    # REGISTRO
+    # ═══════════════════════════════════════════════════════════
+
+    def observar(self, nome: str, segundos: float, **rotulos) -> None:
+        """Registra uma latência no histograma `nome`."""
+        chave = _rotulos(rotulos)
+        with self._lock:
+            series = self._histogramas.setdefault(nome, {})
+            if chave not in series:
+                series[chave] = Histograma()
+            series[chave].observar(segundos)
+
+    def contar(self, nome: str, valor: float = 1, **rotulos) -> None:
+        """Soma `valor` ao contador `nome`."""
+        chave = _rotulos(rotulos)
+        with self._lock:
+            series = self._contadores.setdefault(nome, {})
+            series[chave] = series.get(chave, 0) + valor
+
+    @contextmanager
+    def medir(self, nome: str, **rotulos) -> Iterator[Dict[str, Any]]:
+        """
+        Cronometra o bloco no histograma `nome`; exceções contam em `erros` (etapa=nome).
+
+        O dicionário entregue são os rótulos da medição: o bloco pode completá-los
+        (ex.: o modo da resposta só é conhecido no meio do caminho).
+        """
+        inicio = time.perf_counter()
+        try:
+            yield rotulos
+        except Exception:
+            self.contar("erros", etapa=nome)
+            raise
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def resetar(self) -> None:
+        with self._lock:
+            self._histogramas.clear()
+            self._contadores.clear()
+
+    # ═══════════════════════════════════════════════════════════
+    # EXPORTAÇÃO
+    # ═══════════════════════════════════════════════════════════
+
+    def exportar_json(self) -> Dict[str, Any]:
+        """Métricas em dicionário serializável, com p50/p95/p99 estimados por série."""
+        with self._lock:
+            histogramas = {
+                nome: [
+                    {
+                        "rotulos": dict(chave),
+                        "total": h.total,
+                        "soma_segundos": h.soma,
+                        "media_segundos": h.soma / h.total if h.total else None,
+                        "p50_segundos": h.quantil(0.5),
+                        "p95_segundos": h.quantil(0.95),
+                        "p99_segundos": h.quantil(0.99),
+                        "baldes": {_limite(b): c for b, c in zip(list(h.baldes) + [float("inf")], _cumulativas(h))}
+                    }
+                    for chave, h in series.items()
+                ]
+                for nome, series in self._histogramas.items()
+            }
+            contadores = {
+                nome: [{"rotulos": dict(chave), "valor": valor} for chave, valor in series.items()]
+                for nome, series in self._contadores.items()
+            }
+        return {"gerado_em": time.time(), "histogramas": histogramas, "contadores": contadores}
+
+    def exportar_prometheus(self) -> str:
+        """Métricas no formato de texto do Prometheus (exposition format 0.0.4)."""
+        linhas: List[str] = []
+        with self._lock:
+            for nome, series in sorted(self._histogramas.items()):
+                metrica = f"{PREFIXO}_{nome}_segundos"
+                linhas.append(f"# HELP {metrica} Latência de {nome} em segundos")
+                linhas.append(f"# TYPE {metrica} histogram")
+                for chave, h in sorted(series.items()):
+                    for limite, cumulativa in zip(list(h.baldes) + [float("inf")], _cumulativas(h)):
+                        linhas.append(f"{metrica}_bucket{_formatar(chave + (('le', _limite(limite)),))} {cumulativa}")
+                    linhas.append(f"{metrica}_sum{_formatar(chave)} {h.soma:.6f}")
+                    linhas.append(f"{metrica}_count{_formatar(chave)} {h.total}")
+            for nome, series in sorted(self._contadores.items()):
+                metrica = f"{PREFIXO}_{nome}_total"
+                linhas.append(f"# TYPE {metrica} counter")
+                for chave, valor in sorted(series.items()):
+                    linhas.append(f"{metrica}{_formatar(chave)} {valor:g}")
+        return "\n".join(linhas) + "\n"
+
+    def gravar(self, caminho: Optional[str] = None) -> Optional[str]:
+        """
+        Grava as métricas em arquivo (escrita atômica: coletores nunca leem arquivo pela metade).
+
+        Returns:
+            Caminho gravado, ou None sem arquivo configurado
+        """
+        caminho = caminho or self.arquivo
+        if not caminho:
+            return None
+        if caminho.endswith(".json"):
+            conteudo = json.dumps(self.exportar_json(), indent=2, ensure_ascii=False)
+        else:
+            conteudo = self.exportar_prometheus()
+
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+        os.replace(temporario, caminho)
+        self._ultima_gravacao = time.monotonic()
+        return caminho
+
+    def gravar_periodicamente(self) -> None:
+        """Grava se houver arquivo configurado e o intervalo mínimo tiver passado (chamar após cada resposta)."""
+        if not self.arquivo or time.monotonic() - self._ultima_gravacao < self.intervalo:
+            return
+        try:
+            self.gravar()
+        except OSError as e:
+            logger.warning(f"⚠️ Falha ao gravar métricas em {self.arquivo}: {e}")
+
+
+def _rotulos(rotulos: Dict[str, Any]) -> Rotulos:
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def _cumulativas(h: Histograma) -> List[int]:
+    acumulado, saida = 0, []
+    for contagem in h.contagens:
+        acumulado += contagem
+        saida.append(acumulado)
+    return saida
+
+
+def _limite(limite: float) -> str:
+    return "+Inf" if limite == float("inf") else f"{limite:g}"
+
+
+def _formatar(chave: Rotulos) -> str:
+    if not chave:
+        return ""
+    pares = ",".join(f'{k}="{_escapar(v)}"' for k, v in chave)
+    return "{" + pares + "}"
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ══════════════════════════════════════════════════════════════════
+# 🔒 TELEMETRIA ÚNICA POR PROCESSO
+# ══════════════════════════════════════════════════════════════════
+_telemetria: Optional[Telemetria] = None
+_lock_telemetria = threading.Lock()
+
+
+def obter_telemetria() -> Telemetria:
+    """Retorna o registro de métricas único do processo (todas as sessões do Streamlit)."""
+    global _telemetria
+    with _lock_telemetria:
+        if _telemetria is None:
+            _telemetria = Telemetria()
+        return _telemetria
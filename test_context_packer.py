@@ -0,0 +1,54 @@
+# test_context_packer.py
+
+from context_packer import empacotar_contexto, estimar_tokens, dividir_passagens
+
+
+def test_remove_duplicatas_e_sobreposicao():
+    base = "Cláusula primeira: o contratante pagará o valor mensal de R$ 1.000,00 até o dia 10. "
+    sobreposicao = "Pagamento via boleto bancário registrado em nome da empresa contratada."
+    chunk1 = base + sobreposicao
+    chunk2 = sobreposicao + " Cláusula segunda: multa de 2% por atraso."
+
+    contexto = empacotar_contexto([
+        {"texto": chunk1, "origem": "contrato.pdf"},
+        {"texto": chunk2, "origem": "contrato.pdf"},
+        {"texto": chunk1, "origem": "contrato.pdf"},
+    ], orcamento_tokens=1000)
+
+    assert contexto.count(sobreposicao) == 1
+    assert contexto.count("Cláusula primeira") == 1
+    assert "multa de 2%" in contexto
+    assert contexto.startswith("[contrato.pdf]")
+
+
+def test_respeita_orcamento_e_relevancia():
+    passagens = [{"texto": f"trecho irrelevante numero {i} " * 20, "origem": "a.pdf"} for i in range(50)]
+    passagens.append({"texto": "A alíquota de ISS aplicada é 5%.", "origem": "b.pdf"})
+
+    contexto = empacotar_contexto(passagens, orcamento_tokens=200, pergunta="qual a alíquota de ISS?")
+
+    assert estimar_tokens(contexto) <= 220
+    assert "[b.pdf]\n\nA alíquota de ISS" in contexto
+
+
+def test_dividir_passagens():
+    texto = "\n".join(f"linha {i} " + "x" * 90 for i in range(30))
+    passagens = dividir_passagens(texto, origem="nota.pdf", tamanho=500)
+    assert len(passagens) > 1
+    assert all(len(p["texto"]) <= 600 for p in passagens)
+    assert "\n".join(p["texto"] for p in passagens) == texto
+
+
+def test_trecho_truncado_cabe_no_orcamento_com_cabecalhos_e_separadores():
+    from context_packer import empacotar_memoria
+
+    passagens = [{"texto": f"cláusula {i} " + "valor devido pelo contratante " * 30, "origem": f"contrato_{i % 3}.pdf"}
+                 for i in range(12)]
+    for orcamento in (60, 137, 250, 1001):
+        contexto = empacotar_contexto(passagens, orcamento_tokens=orcamento)
+        assert estimar_tokens(contexto) <= orcamento
+        if orcamento != 250:  # com 250 sobram menos de 50 tokens após o 1º trecho: sem truncar
+            assert contexto.endswith("[...]")
+
+    memoria = "\n\n".join(f"🔹 Pergunta: {i}\n   Resposta: " + "x " * 300 for i in range(5))
+    assert estimar_tokens(empacotar_memoria(memoria, orcamento_tokens=400)) <= 400
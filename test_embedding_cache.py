@@ -0,0 +1,93 @@
+# test_embedding_cache.py
+
+import os
+from langchain_core.embeddings import Embeddings
+from embedding_cache import EmbeddingsComCache
+
+
+class EmbeddingsContador(Embeddings):
+    """Embeddings falsos que contam quantos textos foram codificados."""
+
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.codificados = 0
+
+    def embed_documents(self, texts):
+        self.codificados += len(texts)
+        return [[float(len(t)), float(t.count("a")), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_reaproveita_chunks_ja_vistos(tmp_path):
+    base = EmbeddingsContador()
+    cache = EmbeddingsComCache(base, cache_dir=str(tmp_path), tamanho_lote=2)
+
+    primeiro = cache.embed_documents(["abc", "banana", "abc", "xyz"])
+    assert base.codificados == 3
+    assert primeiro[0] == primeiro[2] == [3.0, 1.0, 1.0]
+
+    segundo = cache.embed_documents(["banana", "abc", "novo"])
+    assert base.codificados == 4
+    assert segundo[0] == primeiro[1]
+
+
+def test_cache_persiste_entre_instancias(tmp_path):
+    base = EmbeddingsContador()
+    EmbeddingsComCache(base, cache_dir=str(tmp_path)).embed_documents(["contrato", "clausula"])
+
+    outra_base = EmbeddingsContador()
+    recarregado = EmbeddingsComCache(outra_base, cache_dir=str(tmp_path))
+    vetores = recarregado.embed_documents(["clausula", "contrato"])
+
+    assert outra_base.codificados == 0
+    assert vetores[1] == [8.0, 1.0, 1.0]
+    assert len(recarregado) == 2
+
+
+def test_base_em_fallback_nao_grava_no_cache_do_modelo(tmp_path):
+    base = EmbeddingsContador()
+    cache = EmbeddingsComCache(base, cache_dir=str(tmp_path))
+    base.nome = "hashing-256"  # o modelo não carregou e o handle caiu no fallback
+
+    cache.embed_documents(["contrato", "clausula"])
+    assert cache.nome == "hashing-256"
+    assert len(cache) == 0
+    assert base.codificados == 2
+
+
+def test_codifica_fora_do_lock_e_indice_em_log(tmp_path, monkeypatch):
+    import threading
+    import embedding_cache
+
+    barreira = threading.Barrier(2, timeout=5)
+
+    class EmbeddingsEmParalelo(EmbeddingsContador):
+        def embed_documents(self, texts):
+            barreira.wait()  # só passa se as duas sessões codificam ao mesmo tempo
+            return super().embed_documents(texts)
+
+    base = EmbeddingsEmParalelo()
+    cache = EmbeddingsComCache(base, cache_dir=str(tmp_path))
+    resultados = {}
+    sessoes = [threading.Thread(target=lambda t=t: resultados.update({t: cache.embed_documents([t, "comum"])}))
+               for t in ("contrato", "aditivo")]
+    for sessao in sessoes:
+        sessao.start()
+    for sessao in sessoes:
+        sessao.join()
+
+    assert resultados["contrato"][1] == resultados["aditivo"][1] == [5.0, 0.0, 1.0]
+    assert len(cache) == 3  # "comum", codificado pelas duas, entra uma vez
+
+    # Cada lote é uma linha do log; o indice.json só é regravado na compactação
+    assert not os.path.exists(cache.indice_path)
+    with open(cache.log_path, "a", encoding="utf-8") as f:
+        f.write('{"dimensao": 3, "lin')  # queda no meio da escrita
+    monkeypatch.setattr(embedding_cache, "LOTES_POR_COMPACTACAO", 1)
+    recarregado = EmbeddingsComCache(EmbeddingsContador(), cache_dir=str(tmp_path))
+    assert len(recarregado) == 3
+    assert os.path.exists(recarregado.indice_path) and not os.path.exists(recarregado.log_path)
+    assert recarregado.embed_documents(["aditivo", "comum"]) == [resultados["aditivo"][0], [5.0, 0.0, 1.0]]
@@ -0,0 +1,22 @@
+# test_lexical_index.py
+
+from lexical_index import IndiceBM25, tokenizar
+
+
+def test_tokenizar_compacta_codigos():
+    tokens = tokenizar("CNPJ: 12.345.678/0001-90 Operação")
+    assert "12345678000190" in tokens
+    assert "operacao" in tokens
+
+
+def test_busca_exata_por_codigo_com_ou_sem_pontuacao():
+    indice = IndiceBM25()
+    indice.adicionar(
+        ["c1", "c2", "c3"],
+        ["Emitente CNPJ 12.345.678/0001-90", "CFOP 5102 venda de mercadoria", "Outro CNPJ 98.765.432/0001-10"],
+        doc_id="d1"
+    )
+
+    assert indice.buscar("qual o emitente do cnpj 12345678000190?", k=1)[0][0] == "c1"
+    assert indice.buscar("notas com CFOP 5102", k=1)[0][0] == "c2"
+    assert indice.buscar("CNPJ 12.345.678/0001-90", k=1, doc_ids=["outro"]) == []
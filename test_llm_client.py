@@ -0,0 +1,76 @@
+# test_llm_client.py
+
+import time
+import asyncio
+import threading
+import pytest
+from llm_client import ClienteLLMAssincrono
+
+
+class CadeiaLenta:
+    """Cadeia falsa: demora `atraso` segundos e conta as chamadas."""
+
+    def __init__(self, atraso=0.2):
+        self.atraso = atraso
+        self.chamadas = 0
+
+    async def ainvoke(self, entradas, config=None):
+        self.chamadas += 1
+        await asyncio.sleep(self.atraso)
+        return f"resposta: {entradas['pergunta']}"
+
+    async def astream(self, entradas, config=None):
+        for palavra in ("O", " total", " é", " 10"):
+            await asyncio.sleep(self.atraso / 4)
+            yield palavra
+
+
+def em_paralelo(funcoes):
+    resultados = [None] * len(funcoes)
+
+    def rodar(i, funcao):
+        resultados[i] = funcao()
+
+    threads = [threading.Thread(target=rodar, args=(i, f)) for i, f in enumerate(funcoes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados
+
+
+def test_prompts_identicos_compartilham_uma_chamada():
+    cliente = ClienteLLMAssincrono(max_concorrentes=4, timeout=5)
+    cadeia = CadeiaLenta()
+
+    resultados = em_paralelo([lambda: cliente.executar(cadeia, {"pergunta": "total?"}, chave="p1")] * 5)
+    assert resultados == ["resposta: total?"] * 5
+    assert cadeia.chamadas == 1
+    assert cliente.estatisticas()["coalescidas"] == 4
+
+    # Terminada a chamada, a mesma chave volta a chamar o LLM
+    cliente.executar(cadeia, {"pergunta": "total?"}, chave="p1")
+    assert cadeia.chamadas == 2
+
+
+def test_semaforo_limita_concorrencia():
+    cliente = ClienteLLMAssincrono(max_concorrentes=2, timeout=5)
+    cadeia = CadeiaLenta(atraso=0.1)
+
+    inicio = time.perf_counter()
+    em_paralelo([lambda i=i: cliente.executar(cadeia, {"pergunta": str(i)}) for i in range(6)])
+    assert cliente.estatisticas()["pico_ativas"] == 2
+    assert time.perf_counter() - inicio >= 0.3
+
+
+def test_timeout_e_streaming():
+    cliente = ClienteLLMAssincrono(max_concorrentes=1, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        cliente.executar(CadeiaLenta(atraso=1.0), {"pergunta": "x"})
+    with pytest.raises(TimeoutError):
+        list(cliente.transmitir(CadeiaLenta(atraso=1.0), {"pergunta": "x"}))
+    assert cliente.estatisticas()["timeouts"] == 2
+
+    cliente.timeout = 5
+    assert list(cliente.transmitir(CadeiaLenta(atraso=0.04), {"pergunta": "x"})) == ["O", " total", " é", " 10"]
+    assert cliente.estatisticas()["ativas"] == 0
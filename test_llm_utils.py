@@ -0,0 +1,220 @@
+# test_llm_utils.py
+
+import re
+import time
+import threading
+import pytest
+import pandas as pd
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import llm_utils
+import memory_module
+from response_cache import CacheRespostas
+from llm_client import ClienteLLMAssincrono
+
+
+def criar_llm(tmp_path, monkeypatch, resposta):
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: memory_module.EmbeddingsHashing())
+    llm = object.__new__(llm_utils.LLMInteligente)
+    llm.llm = GenericFakeChatModel(messages=iter([AIMessage(content=resposta)]))
+    llm._criar_cadeias()
+    llm.memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path / "memoria"))
+    llm.cache_respostas = CacheRespostas(persist_path=None)
+    llm.cliente_llm = ClienteLLMAssincrono(max_concorrentes=2, timeout=5)
+    return llm
+
+
+def test_remover_html_incremental_equivale_ao_texto_completo():
+    pedacos = ["  \n", "O total", " é <", "b class='x'", ">R$ 10", "</b>,", " 5 < 7 ", "e fim", "  \n"]
+    saida = list(llm_utils.remover_html_incremental(pedacos))
+
+    assert "".join(saida) == re.sub(r'<[^>]+>', '', "".join(pedacos)).strip()
+    assert saida[0] == "O total"
+    assert all("<b" not in p for p in saida)
+
+
+def test_stream_grava_memoria_com_texto_final(tmp_path, monkeypatch):
+    llm = criar_llm(tmp_path, monkeypatch, "O <b>valor total</b> das notas é R$ 30,00")
+    df = pd.DataFrame({"valor_total": [10.0, 20.0]})
+
+    pedacos = list(llm.gerar_resposta_llm_stream("Qual o valor total?", df=df))
+    assert len(pedacos) > 1
+    assert "".join(pedacos) == "O valor total das notas é R$ 30,00"
+
+    # Memória e cache só recebem o texto final
+    llm.memoria.flush()
+    assert llm.memoria.metadados[-1]["resposta"] == "O valor total das notas é R$ 30,00"
+    assert list(llm.gerar_resposta_llm_stream("qual o valor total", df=df)) == ["O valor total das notas é R$ 30,00"]
+    llm.memoria.fechar()
+
+
+def test_cadeias_montadas_uma_vez_e_entradas_por_pergunta(tmp_path, monkeypatch):
+    llm = criar_llm(tmp_path, monkeypatch, "A nota 7 é da ACME, no valor de R$ 70,00.")
+    df = pd.DataFrame({"ide_nNF": range(1, 101), "emit_xNome": [f"LOJA {i}" for i in range(100)],
+                       "valor_total": [float(i * 10) for i in range(1, 101)]})
+    df.loc[6, "emit_xNome"] = "ACME"
+    cadeia = llm.cadeias["csv"]
+
+    entradas = llm._entradas_csv("qual o valor da ACME?", df)
+    mensagens = llm.prompts["csv"].format_messages(**entradas)
+    assert "registros correspondem a: acme" in mensagens[1].content
+    assert "7;ACME;70" in mensagens[1].content
+
+    assert llm._responder_csv("qual o valor da ACME?", df) == "A nota 7 é da ACME, no valor de R$ 70,00."
+    assert llm.cadeias["csv"] is cadeia
+    llm.memoria.fechar()
+
+
+def test_instancia_criada_uma_vez_no_primeiro_uso(monkeypatch):
+    criadas = []
+
+    class LLMFalso:
+        def __init__(self):
+            time.sleep(0.05)  # inicialização lenta: as outras threads chegam antes de terminar
+            criadas.append(self)
+
+    monkeypatch.setattr(llm_utils, "LLMInteligente", LLMFalso)
+    monkeypatch.setattr(llm_utils, "_llm_inteligente", None)
+    monkeypatch.setattr(llm_utils, "_falha_inicializacao", None)
+    assert llm_utils.obter_estatisticas_cache() is None
+
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(llm_utils.obter_llm_inteligente()))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(criadas) == 1
+    assert all(r is criadas[0] for r in resultados)
+    assert llm_utils.llm_inteligente is criadas[0]
+
+
+def test_backends_locais_respostas_prontas_e_latencia_reprodutivel(tmp_path):
+    from llm_falso import LLMFalso, RESPOSTA_PADRAO
+
+    modelo = LLMFalso(respostas={"cfop": "O CFOP predominante é 5102."}, latencia=0.05, variacao=0.5, semente=7)
+    llm = llm_utils.LLMInteligente(persist_dir=str(tmp_path / "memoria"), backend_embeddings="hashing", modelo=modelo)
+    assert llm.memoria.modelo_vetores == "hashing-256"
+
+    df = pd.DataFrame({"ide_CFOP": [5102, 5102, 6108], "emit_xNome": ["A", "B", "C"]})
+    # A palavra-chave casa com a pergunta, não com a coluna ide_CFOP dos dados
+    assert llm.gerar_resposta_llm("Qual o CFOP mais usado?", df=df) == "O CFOP predominante é 5102."
+    assert llm.gerar_resposta_llm("Quem é o emitente A?", df=df) == RESPOSTA_PADRAO
+
+    mensagens = llm.prompts["csv"].format_messages(**llm._entradas_csv("Qual o CFOP?", df))
+    assert modelo._atraso_inicial(mensagens) == LLMFalso(latencia=0.05, variacao=0.5, semente=7)._atraso_inicial(mensagens)
+    assert 0.025 <= modelo._atraso_inicial(mensagens) <= 0.075
+    llm.memoria.fechar()
+
+    with pytest.raises(ValueError):
+        llm_utils.criar_modelo_llm("inexistente")
+
+
+def test_vazao_ponta_a_ponta_sem_rede(tmp_path):
+    medicao = llm_utils.medir_vazao(perguntas=12, concorrencia=6, latencia=0.05, linhas=40,
+                                    persist_dir=str(tmp_path / "vazao"))
+
+    # Todas as perguntas chegam ao LLM; o semáforo do cliente limita a vazão
+    assert medicao["chamadas_llm"] == 12
+    assert medicao["respostas_por_s"] <= medicao["limite_teorico_por_s"] * 1.05
+    assert medicao["p50_s"] >= 0.05
+
+
+def test_prazo_esgotado_entrega_resposta_rapida_e_completa_depois(tmp_path):
+    from llm_falso import LLMFalso
+    from quick_answer import RespostaRapida
+
+    modelo = LLMFalso(respostas={"nota 2": "A nota 2 vale R$ 20,00."}, latencia=0.5)
+    llm = llm_utils.LLMInteligente(persist_dir=str(tmp_path / "memoria"), backend_embeddings="hashing", modelo=modelo)
+    llm.memoria.limiar_cache_semantico = 1.01
+    df = pd.DataFrame({"ide_nNF": [1, 2, 3], "valor_total": [10.0, 20.0, 30.0]})
+
+    inicio = time.perf_counter()
+    rapida = llm.gerar_resposta_llm("Qual o valor da nota 2?", df=df, prazo=0.1)
+    assert time.perf_counter() - inicio < 0.4
+    assert isinstance(rapida, RespostaRapida) and "valor_total=20" in rapida
+
+    # A resposta completa segue em segundo plano, chega ao chamador e vai para o cache
+    assert rapida.aguardar_completa(timeout=5) == "A nota 2 vale R$ 20,00."
+    assert llm_utils.aguardar_respostas_pendentes(timeout=5)
+    assert llm.gerar_resposta_llm("Qual o valor da nota 2?", df=df, prazo=0.1) == "A nota 2 vale R$ 20,00."
+
+    # Streaming: resposta rápida primeiro, depois os pedaços que a substituem
+    pedacos = list(llm.gerar_resposta_llm_stream("E o valor da nota 2 em reais?", df=df, prazo=0.1))
+    assert isinstance(pedacos[0], RespostaRapida)
+    assert "".join(pedacos[1:]) == "A nota 2 vale R$ 20,00."
+    llm.memoria.flush()
+    assert llm.memoria.metadados[-1]["resposta"] == "A nota 2 vale R$ 20,00."
+    llm.memoria.fechar()
+
+
+def test_llm_saturado_responde_so_a_resposta_rapida(tmp_path, monkeypatch):
+    import threading
+    from llm_falso import LLMFalso
+    from quick_answer import RespostaRapida
+
+    monkeypatch.setattr(llm_utils, "_vagas_respostas", threading.BoundedSemaphore(1))
+    modelo = LLMFalso(respostas={"nota": "A nota vale R$ 20,00."}, latencia=0.5)
+    llm = llm_utils.LLMInteligente(persist_dir=str(tmp_path / "memoria"), backend_embeddings="hashing", modelo=modelo)
+    llm.memoria.limiar_cache_semantico = 1.01
+    df = pd.DataFrame({"ide_nNF": [1, 2, 3], "valor_total": [10.0, 20.0, 30.0]})
+
+    primeira = llm.gerar_resposta_llm("Qual o valor da nota 2?", df=df, prazo=0.1)
+    assert primeira.completa is not None
+
+    # Sem vaga: resposta rápida na hora, sem enfileirar outra chamada ao LLM
+    inicio = time.perf_counter()
+    segunda = llm.gerar_resposta_llm("Qual o valor da nota 3?", df=df, prazo=0.1)
+    assert time.perf_counter() - inicio < 0.1
+    assert isinstance(segunda, RespostaRapida) and segunda.completa is None
+    assert segunda.aguardar_completa(timeout=0) is None
+
+    assert primeira.aguardar_completa(timeout=5) == "A nota vale R$ 20,00."
+    assert llm_utils.aguardar_respostas_pendentes(timeout=5)
+    llm.memoria.fechar()
+
+
+def test_reformulacao_sobre_o_mesmo_pdf_usa_o_cache_semantico(tmp_path):
+    from llm_falso import LLMFalso
+    from response_cache import calcular_fingerprint
+
+    # Se a pergunta chegasse ao LLM, a reformulação teria outra resposta
+    modelo = LLMFalso(respostas={"vigência": "A vigência é de 12 meses.", "vigencia": "Outra resposta."}, latencia=0)
+    llm = llm_utils.LLMInteligente(persist_dir=str(tmp_path / "memoria"), backend_embeddings="hashing", modelo=modelo)
+    llm.memoria.limiar_cache_semantico = 0.8
+    fingerprint = calcular_fingerprint(doc_ids=["b1c2", "a0f3"])
+    assert fingerprint == calcular_fingerprint(doc_ids=["a0f3", "b1c2"])
+
+    # Cada redação recupera trechos diferentes do mesmo PDF
+    primeira = llm.gerar_resposta_llm("Qual a vigência do contrato?", contexto_pdf="[contrato.pdf]\nCláusula 3: vigência de 12 meses.",
+                                      prazo=0, fingerprint=fingerprint)
+    llm.memoria.flush()
+    segunda = llm.gerar_resposta_llm("Qual é a vigencia do contrato", contexto_pdf="[contrato.pdf]\nCláusula 1: objeto do contrato.",
+                                     prazo=0, fingerprint=fingerprint)
+    assert primeira == segunda == "A vigência é de 12 meses."
+    llm.memoria.fechar()
+
+
+def test_indice_de_registros_chaveado_so_pelo_dataframe(tmp_path, monkeypatch):
+    import row_selector
+    from llm_falso import LLMFalso
+
+    criados = []
+    original = row_selector.IndiceLinhas
+    monkeypatch.setattr(row_selector, "IndiceLinhas", lambda df: criados.append(df) or original(df))
+    monkeypatch.setattr(row_selector, "_indices", type(row_selector._indices)())
+
+    llm = llm_utils.LLMInteligente(persist_dir=str(tmp_path / "memoria"), backend_embeddings="hashing",
+                                   modelo=LLMFalso(latencia=0))
+    llm.memoria.limiar_cache_semantico = 1.01
+    df = pd.DataFrame({"ide_nNF": [1, 2, 3], "valor_total": [10.0, 20.0, 30.0]})
+
+    # Consolidado: o contexto PDF (e o fingerprint do cache) muda a cada pergunta, o índice não
+    llm.gerar_resposta_llm("Qual o valor da nota 1?", df=df, contexto_pdf="[a.pdf]\nCláusula 1", prazo=0)
+    llm.gerar_resposta_llm("E o emitente da nota 3?", df=df, contexto_pdf="[a.pdf]\nCláusula 7", prazo=0)
+    assert len(criados) == 1
+    assert len(row_selector._indices) == 1
+    llm.memoria.fechar()
@@ -0,0 +1,167 @@
+# test_memory_log.py
+
+import os
+import time
+import threading
+import numpy as np
+import memory_module
+from memory_log import LogMemoria
+
+
+class EmbeddingsLetras:
+    """Embeddings falsos: contagem de algumas letras."""
+
+    def embed_query(self, text):
+        return [float(text.count(c)) + 0.1 for c in "abcdefgh"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def test_log_reaplicado_apos_compactacao_interrompida(tmp_path):
+    log = LogMemoria(str(tmp_path))
+    log.anexar({"id": 0}, {"conversas": [1.0, 2.0]})
+    log.rotacionar()  # compactação começou mas o snapshot nunca foi gravado
+    log.anexar({"id": 1}, {"conversas": [3.0, 4.0]})
+    log.fechar()
+
+    with open(tmp_path / "log_000001.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"registro": {"id": 2}, "vet')  # queda no meio da escrita
+
+    reaberto = LogMemoria(str(tmp_path))
+    assert reaberto.snapshot_atual() is None
+    entradas = list(reaberto.reler())
+    assert [r["id"] for r, _ in entradas] == [0, 1]
+    np.testing.assert_array_equal(entradas[1][1]["conversas"], [3.0, 4.0])
+
+
+def test_memoria_persistida_em_log_e_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: EmbeddingsLetras())
+    diretorio = str(tmp_path / "memoria")
+
+    memoria = memory_module.MemoriaInteligente(persist_dir=diretorio, compactar_a_cada=3)
+    for i, pergunta in enumerate(["abc", "bbb", "ccc", "ddd", "eee"]):
+        memoria.salvar_contexto(pergunta, f"resposta {i}")
+        memoria.flush()
+    if memoria._thread_compactacao:
+        memoria._thread_compactacao.join()
+
+    assert memoria.log.geracao_snapshot == 1
+    assert os.path.exists(os.path.join(diretorio, "snapshot_000001", "registros.jsonl"))
+    assert not os.path.exists(os.path.join(diretorio, "log_000000.jsonl"))
+    memoria.fechar()
+
+    reaberta = memory_module.MemoriaInteligente(persist_dir=diretorio)
+    assert [r["pergunta"] for r in reaberta.obter_historico()] == ["abc", "bbb", "ccc", "ddd", "eee"]
+    assert reaberta.index.ntotal == 5
+    assert "eee" in reaberta.buscar_contexto_relevante("eee", k=1)
+
+
+def test_gravacao_write_behind_em_lote_com_backpressure(tmp_path, monkeypatch):
+    liberar = threading.Event()
+    chamadas = []
+
+    class EmbeddingsLentos(EmbeddingsLetras):
+        def embed_documents(self, texts):
+            liberar.wait(5)
+            chamadas.append(len(texts))
+            return super().embed_documents(texts)
+
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: EmbeddingsLentos())
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path), tamanho_fila=3, tamanho_lote=8)
+
+    memoria.salvar_contexto("abc", "r0")  # worker fica preso embutindo este
+    time.sleep(0.1)
+    produtor = threading.Thread(target=lambda: [memoria.salvar_contexto(f"p{i}", f"r{i}") for i in range(1, 7)])
+    produtor.start()
+    produtor.join(0.3)
+    assert produtor.is_alive()  # fila cheia: salvar_contexto espera
+
+    liberar.set()
+    produtor.join(5)
+    memoria.fechar()
+
+    assert [r["id"] for r in memoria.obter_historico()] == list(range(7))
+    assert max(chamadas) > 1  # registros acumulados foram embutidos em lote
+
+
+def test_retencao_despeja_antigos_e_menos_usados(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: EmbeddingsLetras())
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path), compactar_a_cada=1000,
+                                               max_registros=0, max_idade_dias=30, max_mb=0)
+    for pergunta in ["aaa", "bbb", "ccc", "ddd"]:
+        memoria.salvar_contexto(pergunta, "r")
+    memoria.flush()
+
+    memoria.metadados[1]["timestamp"] = "2000-01-01T00:00:00"  # "bbb": sem uso há anos
+    memoria.metadados[0]["ultimo_acesso"] = "2999-01-01T00:00:00"  # "aaa": usado por último
+    memoria.salvar_contexto("eee", "r")
+    memoria.flush()
+    memoria.max_registros = 3
+    memoria.compactar()
+
+    assert [r["pergunta"] for r in memoria.obter_historico()] == ["aaa", "ddd", "eee"]
+    assert [r["id"] for r in memoria.obter_historico()] == [0, 1, 2]
+    assert memoria.index.ntotal == 3
+    assert "ddd" in memoria.buscar_contexto_relevante("ddd", k=1)
+
+    stats = memoria.estatisticas()["ultima_compactacao"]
+    assert stats["registros_antes"] == 5 and stats["registros_depois"] == 3
+    assert stats["tamanho_depois_mb"] > 0
+
+
+def test_ultimo_acesso_persistido_e_retencao_por_idade_e_tamanho(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: EmbeddingsLetras())
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path), compactar_a_cada=1000,
+                                               max_registros=0, max_idade_dias=30, max_mb=0)
+    for pergunta in ["aaa", "bbb", "ccc"]:
+        memoria.salvar_contexto(pergunta, "r")
+    memoria.flush()
+    assert not memoria._excede_retencao()
+
+    assert "bbb" in memoria.buscar_contexto_relevante("bbb", k=1, threshold=0.99)
+    acesso = memoria.metadados[1]["ultimo_acesso"]
+    memoria.fechar()
+
+    # Sem compactação no meio: o acesso vem do log
+    reaberta = memory_module.MemoriaInteligente(persist_dir=str(tmp_path), compactar_a_cada=1000,
+                                                max_registros=0, max_idade_dias=30, max_mb=0)
+    assert reaberta.metadados[1]["ultimo_acesso"] == acesso
+    assert "ultimo_acesso" not in reaberta.metadados[0]
+
+    # Idade e tamanho também antecipam a compactação, não só a contagem
+    reaberta._vencimento = "2000-01-01T00:00:00"
+    assert reaberta._excede_retencao()
+    reaberta._atualizar_estimativas()
+    reaberta.max_mb = reaberta._bytes_estimados / (1024 * 1024) / 2
+    assert reaberta._excede_retencao()
+    reaberta.fechar()
+
+
+def test_acesso_no_log_sobrevive_a_snapshot_que_falhou(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: EmbeddingsLetras())
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path), compactar_a_cada=1000,
+                                               max_registros=0, max_idade_dias=0, max_mb=0)
+    for pergunta in ["aaa", "bbb", "ccc"]:
+        memoria.salvar_contexto(pergunta, "r")
+    memoria.flush()
+
+    # A retenção despeja "aaa" e renumera; o log é rotacionado, mas o snapshot falha
+    def falhar(*args, **kwargs):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(memoria.log, "gravar_snapshot", falhar)
+    memoria.max_registros = 2
+    memoria.compactar()
+    assert [r["pergunta"] for r in memoria.metadados] == ["bbb", "ccc"]
+
+    assert "ccc" in memoria.buscar_contexto_relevante("ccc", k=1, threshold=0.99)
+    memoria.fechar()
+
+    # Reaberta sem snapshot: o acesso (posição 1 após a renumeração) vale para "ccc", não "bbb"
+    reaberta = memory_module.MemoriaInteligente(persist_dir=str(tmp_path), compactar_a_cada=1000,
+                                                max_registros=0, max_idade_dias=0, max_mb=0)
+    por_pergunta = {r["pergunta"]: r for r in reaberta.metadados}
+    assert "ultimo_acesso" in por_pergunta["ccc"]
+    assert "ultimo_acesso" not in por_pergunta["bbb"]
+    reaberta.fechar()
@@ -0,0 +1,141 @@
+# test_memory_module.py
+
+import os
+import sys
+import subprocess
+import numpy as np
+import memory_module
+from vector_index import MatrizVetorial
+
+
+class EmbeddingsContados:
+    """Embeddings falsos que contam quantos textos foram embutidos."""
+
+    def __init__(self):
+        self.textos = []
+
+    def embed_query(self, text):
+        self.textos.append(text)
+        return [float(text.count(c)) + 0.1 for c in "abcdefgh"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def test_uma_embedding_por_turno(tmp_path, monkeypatch):
+    embeddings = EmbeddingsContados()
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: embeddings)
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path))
+    memoria.salvar_contexto("qual o total de abc?", "R$ 10", {"fingerprint": "f1"})
+    memoria.flush()
+    embeddings.textos.clear()
+
+    # Busca (contexto + cache semântico) e gravação do turno: uma única embedding
+    consulta = memoria.consultar("qual o total de abc", "f1")
+    assert consulta["resposta_semelhante"]["resposta"] == "R$ 10"
+    assert "qual o total de abc?" in consulta["contexto"]
+
+    memoria.salvar_contexto("qual o total de abc", "R$ 10", {"fingerprint": "f1"}, vetor=consulta["vetor"])
+    memoria.flush()
+    assert embeddings.textos == ["qual o total de abc"]
+
+    # Outro conjunto de dados: sem reaproveitamento
+    assert memoria.consultar("qual o total de abc", "f2")["resposta_semelhante"] is None
+    memoria.fechar()
+
+
+def test_memoria_unica_por_diretorio(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: EmbeddingsContados())
+    primeira = memory_module.obter_memoria(str(tmp_path))
+    assert memory_module.obter_memoria(str(tmp_path / ".." / tmp_path.name)) is primeira
+    assert memory_module.obter_memoria(str(tmp_path / "outra")) is not primeira
+
+
+def test_fallback_hashing_e_matriz_numpy(tmp_path, monkeypatch):
+    def sem_modelo(*args, **kwargs):
+        raise ImportError("langchain_huggingface")
+
+    monkeypatch.setattr(memory_module, "obter_embeddings", sem_modelo)
+    monkeypatch.setattr(memory_module, "IndiceMemoria", MatrizVetorial)
+
+    embeddings = memory_module.EmbeddingsHashing()
+    proxima, distante = embeddings.embed_documents(["Quantas notas fiscais?", "Qual o CFOP usado?"])
+    consulta = np.array(embeddings.embed_query("quantas notas fiscais"))
+    assert consulta @ np.array(proxima) > consulta @ np.array(distante)
+
+    # Determinístico entre processos (hash() do Python muda a cada execução)
+    codigo = "import memory_module; print(memory_module.EmbeddingsHashing().embed_query('CFOP 5102')[:5])"
+    ambiente = dict(os.environ, PYTHONPATH=os.path.dirname(memory_module.__file__))
+    saidas = {
+        subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, cwd=tmp_path,
+                       env=dict(ambiente, PYTHONHASHSEED=semente)).stdout.strip().splitlines()[-1]
+        for semente in ("1", "2")
+    }
+    assert saidas == {str(embeddings.embed_query("CFOP 5102")[:5])}
+
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path / "m"))
+    memoria.salvar_contexto("Quantas notas fiscais?", "3 notas")
+    memoria.flush()
+    memoria.compactar()
+    memoria.fechar()
+
+    reaberta = memory_module.MemoriaInteligente(persist_dir=str(tmp_path / "m"))
+    assert reaberta.index.tipo == "numpy"
+    assert "3 notas" in reaberta.buscar_contexto_relevante("quantas notas fiscais")
+    reaberta.fechar()
+
+
+def test_embedding_da_consulta_fora_do_lock(tmp_path, monkeypatch):
+    sob_lock = []
+
+    class EmbeddingsVigiados(EmbeddingsContados):
+        def embed_query(self, text):
+            sob_lock.append(memoria.lock.locked())
+            return super().embed_query(text)
+
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: EmbeddingsVigiados())
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path))
+    memoria.salvar_contexto("qual o total de abc?", "R$ 10", {"fingerprint": "f1"})
+    memoria.flush()
+
+    assert memoria.consultar("qual o total de abc", "f1")["resposta_semelhante"]["resposta"] == "R$ 10"
+    assert sob_lock and not any(sob_lock)
+    memoria.fechar()
+
+
+def test_falha_ao_carregar_modelo_cai_no_hashing_e_reindexa(tmp_path, monkeypatch):
+    import embedding_registry
+
+    monkeypatch.setattr(embedding_registry, "_carregar_modelo", lambda *a: EmbeddingsContados())
+    handle = embedding_registry.EmbeddingsCompartilhados("modelo-x", "cpu")
+    monkeypatch.setattr(memory_module, "obter_embeddings", lambda *a, **k: handle)
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path))
+    memoria.salvar_contexto("qual o total de abc?", "R$ 10", {"fingerprint": "f1"})
+    memoria.flush()
+    memoria.fechar()
+
+    # Outro processo: o modelo não carrega (sem rede, torch ausente...)
+    tentativas = []
+
+    def falhar(*args):
+        tentativas.append(args)
+        raise OSError("sem rede")
+
+    monkeypatch.setattr(embedding_registry, "_carregar_modelo", falhar)
+    handle = embedding_registry.EmbeddingsCompartilhados("modelo-x", "cpu")
+    memoria = memory_module.MemoriaInteligente(persist_dir=str(tmp_path))
+    assert memoria.modelo_vetores == "modelo-x"
+
+    consulta = memoria.consultar("qual o total de abc", "f1")
+    assert handle.falha_carregamento == "sem rede"
+    assert handle.nome == memoria.modelo_vetores == "hashing-256"
+    assert memoria.dimension == 256
+    assert consulta["resposta_semelhante"]["resposta"] == "R$ 10"
+
+    # A falha é lembrada: sem nova tentativa, e a memória continua gravando
+    memoria.salvar_contexto("qual o total de abc", "R$ 10", {"fingerprint": "f1"}, vetor=consulta["vetor"])
+    memoria.flush()
+    handle.embed_query("outra")
+    assert len(tentativas) == 1
+    assert len(memoria.metadados) == 2 and memoria.index.ntotal == 2
+    memoria.fechar()
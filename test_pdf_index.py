@@ -0,0 +1,123 @@
+# test_pdf_index.py
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from pdf_index import IndicePDF
+
+
+class EmbeddingsLetras(Embeddings):
+    """Embeddings falsos: contagem de algumas letras."""
+
+    nome = "letras-6"
+
+    def embed_documents(self, texts):
+        return [[float(t.count(c)) for c in "abcxyz"] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def criar_indice():
+    indice = IndicePDF(EmbeddingsLetras())
+    indice.adicionar_documento("d1", "contrato.pdf", [Document(page_content="aaa bbb"), Document(page_content="xxx")])
+    indice.adicionar_documento("d2", "nota.pdf", [Document(page_content="aaa ccc"), Document(page_content="yyy")])
+    return indice
+
+
+def test_indice_unico_com_metadados():
+    indice = criar_indice()
+    assert len(indice) == 2
+    assert indice.total_chunks == 4
+
+    # Reenvio do mesmo documento não duplica chunks
+    indice.adicionar_documento("d1", "contrato_copia.pdf", [Document(page_content="aaa bbb")])
+    assert indice.total_chunks == 4
+
+
+def test_busca_em_lote_e_filtro_por_documento():
+    indice = criar_indice()
+
+    por_consulta = indice.buscar(["aaa", "xxx"], k=1)
+    assert len(por_consulta) == 2
+    assert por_consulta[1][0][1].page_content == "xxx"
+
+    trechos = indice.buscar_trechos(["aaa"], k=5, doc_ids=["d2"])
+    assert {t.metadata["arquivo"] for t in trechos} == {"nota.pdf"}
+
+
+def test_documentos_citados():
+    indice = criar_indice()
+    assert indice.documentos_citados("O que diz o CONTRATO?") == ["d1"]
+    assert indice.documentos_citados("qual o total?") == []
+
+
+def test_tabela_produtos_marcada_na_indexacao():
+    indice = IndicePDF(EmbeddingsLetras(), k_produtos=1)
+    chunks = [Document(page_content="zzz zzz"), Document(page_content="VALOR UNIT QUANTIDADE")]
+    indice.adicionar_documento("d1", "danfe.pdf", chunks)
+
+    produtos = indice.trechos_produtos()
+    assert [doc.page_content for _, doc in produtos] == ["VALOR UNIT QUANTIDADE"]
+    assert produtos[0][1].metadata["tabela_produtos"] is True
+
+    trechos = indice.buscar_trechos(["zzz"], k=2, incluir_produtos=True)
+    assert trechos[0].page_content == "VALOR UNIT QUANTIDADE"
+    assert len(trechos) == 2
+
+
+def test_documento_persistido_e_reanexado(tmp_path):
+    indice = IndicePDF(EmbeddingsLetras(), persist_dir=str(tmp_path))
+    indice.adicionar_documento("d1", "contrato.pdf", [Document(page_content="aaa bbb"), Document(page_content="xxx")])
+
+    class SemEmbeddings(EmbeddingsLetras):
+        def embed_documents(self, texts):
+            raise AssertionError("reanexar não deve recalcular embeddings")
+
+    nova_sessao = IndicePDF(SemEmbeddings(), EmbeddingsLetras(), persist_dir=str(tmp_path))
+    assert nova_sessao.carregar_documento("d1", "contrato_v2.pdf")
+    assert not nova_sessao.carregar_documento("d9", "outro.pdf")
+    assert nova_sessao.total_chunks == 2
+    assert nova_sessao.texto_documento("d1") == "aaa bbb\nxxx"
+
+    trechos = nova_sessao.buscar_trechos(["xxx"], k=1)
+    assert trechos[0].metadata["arquivo"] == "contrato_v2.pdf"
+
+
+def test_filtro_por_documento_dentro_da_busca_vetorial():
+    indice = IndicePDF(EmbeddingsLetras())
+    # 30 PDFs mais próximos da consulta do que o documento pedido
+    for i in range(30):
+        indice.adicionar_documento(f"outro{i}", f"outro{i}.pdf", [Document(page_content="aaa")])
+    indice.adicionar_documento("alvo", "alvo.pdf", [Document(page_content="ccc"), Document(page_content="yyy")])
+
+    # Sem sobreposição léxica com a consulta: só o ranking vetorial encontra o documento
+    [encontrados] = indice.buscar(["aaa"], k=1, doc_ids=["alvo"])
+    assert [doc.metadata["arquivo"] for _, doc, _ in encontrados] == ["alvo.pdf"]
+    assert indice.buscar(["aaa"], k=1, doc_ids=["inexistente"]) == [[]]
+
+
+def test_documento_salvo_com_outro_modelo_e_reembutido(tmp_path):
+    indice = IndicePDF(EmbeddingsLetras(), persist_dir=str(tmp_path))
+    indice.adicionar_documento("d1", "contrato.pdf", [Document(page_content="aaa bbb"), Document(page_content="xxx")])
+
+    class EmbeddingsVogais(Embeddings):
+        nome = "vogais-5"
+
+        def embed_documents(self, texts):
+            return [[float(t.count(c)) for c in "aeiou"] for t in texts]
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    # Outro backend: os vetores do disco (dimensão 6) não são reaproveitados
+    outro_modelo = IndicePDF(EmbeddingsVogais(), persist_dir=str(tmp_path))
+    assert outro_modelo.carregar_documento("d1", "contrato.pdf")
+    assert outro_modelo.vetorstore.index.d == 5
+    assert outro_modelo.buscar_trechos(["aaa"], k=1)[0].page_content == "aaa bbb"
+
+    # O disco passa a guardar os vetores do modelo atual
+    class VogaisSemCalculo(EmbeddingsVogais):
+        def embed_documents(self, texts):
+            raise AssertionError("vetores do mesmo modelo não devem ser recalculados")
+
+    assert IndicePDF(VogaisSemCalculo(), persist_dir=str(tmp_path)).carregar_documento("d1", "contrato.pdf")
@@ -0,0 +1,25 @@
+# test_quick_answer.py
+
+import pandas as pd
+
+from quick_answer import RespostaRapida, gerar_resposta_rapida, AVISO
+
+
+def test_resposta_rapida_registros_citados_agregados_e_top():
+    df = pd.DataFrame({
+        "ide_nNF": [101, 102, 103, 104],
+        "emit_xNome": ["ALFA LTDA", "BETA SA", "ALFA LTDA", "GAMA ME"],
+        "valor_total": [100.0, 250.0, 50.0, 400.0]
+    })
+
+    citada = gerar_resposta_rapida("Quanto a ALFA LTDA faturou?", df)
+    assert isinstance(citada, RespostaRapida) and citada.startswith(AVISO)
+    assert "emit_xNome=ALFA LTDA" in citada and "BETA SA" not in citada
+
+    # Sem registros citados: agregados de tudo e os maiores valores
+    geral = gerar_resposta_rapida("Como estão as notas?", df, top=2)
+    assert "2 maiores valores de valor_total" in geral
+    assert geral.index("valor_total=400") < geral.index("valor_total=250")
+
+    assert "cláusula 7" in gerar_resposta_rapida("O que diz a cláusula 7?", contexto_pdf="A cláusula 7 trata de multas.")
+    assert "Nenhum dado" in gerar_resposta_rapida("Oi?")
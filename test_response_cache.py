@@ -0,0 +1,70 @@
+# test_response_cache.py
+
+import pandas as pd
+from response_cache import CacheRespostas, normalizar_pergunta, calcular_fingerprint
+
+
+def test_normalizar_pergunta():
+    assert normalizar_pergunta("  Qual o VALOR   total? ") == "qual o valor total"
+    assert normalizar_pergunta("Emissão") == normalizar_pergunta("emissao")
+
+
+def test_fingerprint_muda_com_dados():
+    df1 = pd.DataFrame({"valor": [10.0, 20.0]})
+    df2 = pd.DataFrame({"valor": [10.0, 21.0]})
+    assert calcular_fingerprint(df1) == calcular_fingerprint(df1.copy())
+    assert calcular_fingerprint(df1) != calcular_fingerprint(df2)
+    assert calcular_fingerprint(df1) != calcular_fingerprint(df1, "texto do pdf")
+
+
+def test_hit_miss_e_persistencia(tmp_path):
+    caminho = str(tmp_path / "cache.json")
+    cache = CacheRespostas(persist_path=caminho)
+
+    assert cache.obter("Qual o total?", "fp") is None
+    cache.salvar("Qual o total?", "fp", "R$ 30,00")
+    assert cache.obter("qual o total", "fp") == "R$ 30,00"
+    assert cache.obter("qual o total", "outro_fp") is None
+
+    stats = cache.estatisticas()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+    recarregado = CacheRespostas(persist_path=caminho)
+    assert recarregado.obter("Qual o total?", "fp") == "R$ 30,00"
+
+
+def test_lru_e_ttl(tmp_path):
+    cache = CacheRespostas(persist_path=None, max_itens=2)
+    cache.salvar("a", "fp", "1")
+    cache.salvar("b", "fp", "2")
+    cache.obter("a", "fp")
+    cache.salvar("c", "fp", "3")
+    assert cache.obter("b", "fp") is None
+    assert cache.obter("a", "fp") == "1"
+
+    expira = CacheRespostas(persist_path=None, ttl_segundos=-1)
+    expira.salvar("a", "fp", "1")
+    assert expira.obter("a", "fp") is None
+
+
+def test_salvar_acrescenta_ao_log_e_compacta(tmp_path):
+    caminho = tmp_path / "cache.json"
+    cache = CacheRespostas(persist_path=str(caminho), max_itens=3)
+
+    cache.salvar("a", "fp", "1")
+    cache.salvar("b", "fp", "2")
+    # Inserções só acrescentam linhas ao log: o JSON completo não é regravado
+    assert not caminho.exists()
+    assert len((tmp_path / "cache.json.log").read_text(encoding="utf-8").splitlines()) == 2
+
+    cache.salvar("c", "fp", "3")
+    cache.salvar("d", "fp", "4")
+    assert caminho.exists() and cache.entradas_no_log == 1
+
+    recarregado = CacheRespostas(persist_path=str(caminho), max_itens=3)
+    assert recarregado.obter("a", "fp") is None
+    assert [recarregado.obter(p, "fp") for p in "bcd"] == ["2", "3", "4"]
+
+    cache.limpar()
+    assert not caminho.exists() and not (tmp_path / "cache.json.log").exists()
@@ -0,0 +1,60 @@
+# test_row_selector.py
+
+import numpy as np
+import pytest
+import pandas as pd
+from row_selector import selecionar_linhas, obter_indice_linhas
+
+
+def notas(n=3000):
+    df = pd.DataFrame({
+        "emit_cnpj": [f"{11222333000100 + i % 200:014d}" for i in range(n)],
+        "emit_xNome": [f"FORNECEDOR {i % 200} LTDA" for i in range(n)],
+        "ide_nNF": np.arange(1, n + 1),
+        "valor_total": np.full(n, 10.0),
+    })
+    return df
+
+
+def test_encontra_registros_alem_das_primeiras_linhas():
+    df = notas()
+    df.loc[2500, "emit_xNome"] = "ACME DISTRIBUIDORA LTDA"
+
+    linhas, selecao = selecionar_linhas(df, "Qual o valor da nota da Acme Distribuidora?")
+    assert list(linhas.index) == [2500]
+    assert "acme" in selecao and "valor_total: Soma=10.00" in selecao
+
+    linhas, _ = selecionar_linhas(df, "qual o emitente da nota 2999?")
+    assert list(linhas["ide_nNF"]) == [2999]
+
+    # CNPJ com pontuação: os pedaços ("11", "222"...) não contam, só o código inteiro
+    linhas, selecao = selecionar_linhas(df, "notas do CNPJ 11.222.333/0001-42")
+    assert set(linhas["emit_cnpj"]) == {"11222333000142"}
+    assert selecao.startswith("15 de 3000 registros")
+
+
+def test_sem_entidade_usa_amostra_e_indice_e_reaproveitado():
+    df = notas(100)
+    linhas, selecao = selecionar_linhas(df, "qual o total geral?", max_linhas=20)
+    assert list(linhas.index) == list(range(20))
+    assert "primeiros 20 de 100" in selecao
+    assert obter_indice_linhas(df) is obter_indice_linhas(df.copy())
+
+
+def test_dicas_de_identificador_por_palavra_inteira_e_chave_reaproveitada(monkeypatch):
+    import row_selector
+    from row_selector import IndiceLinhas
+
+    inteiros = pd.Series([100, 200])
+    assert IndiceLinhas._eh_identificador("ide_nNF", inteiros)
+    assert IndiceLinhas._eh_identificador("emit_CNPJ", inteiros)
+    # Valores da nota: "vnf" contém "nf", mas não é um identificador
+    assert not IndiceLinhas._eh_identificador("total_vNF", inteiros)
+    assert not IndiceLinhas._eh_identificador("vNF", inteiros)
+
+    # Com a chave (fingerprint do DataFrame no plano), o DataFrame não é re-hasheado a cada pergunta
+    df = notas(50)
+    obter_indice_linhas(df, chave="fp-notas")
+    monkeypatch.setattr(row_selector, "fingerprint_tabela", lambda *a: pytest.fail("hash recalculado"))
+    linhas, _ = selecionar_linhas(df, "qual o emitente da nota 42?", chave="fp-notas")
+    assert 42 in list(linhas["ide_nNF"])
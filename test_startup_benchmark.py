@@ -0,0 +1,28 @@
+# test_startup_benchmark.py
+
+import startup_benchmark
+
+
+def test_interpretar_importtime():
+    saida = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       702 |        959 |     json.scanner\n"
+        "import time:       696 |       1655 |   json.decoder\n"
+        "import time:       452 |       2860 | json\n"
+        "linha qualquer do programa\n"
+    )
+    registros = startup_benchmark.interpretar_importtime(saida)
+
+    assert [(r["modulo"], r["nivel"]) for r in registros] == [("json.scanner", 2), ("json.decoder", 1), ("json", 0)]
+    assert registros[-1]["cumulativo_ms"] == 2.86
+
+
+def test_abertura_nao_importa_modulos_adiados():
+    modulos = startup_benchmark.modulos_do_app()
+    assert "agent_manager" in modulos and "streamlit" in modulos
+    assert not {"gerar_pdf", "visualizacao.interface"} & set(modulos)
+
+    # Leitores de PDF, índice de PDF, OCR e gráficos só entram no uso
+    medicao = startup_benchmark.medir_importacoes(["agent_manager", "file_reader", "llm_utils"], repeticoes=1)
+    assert medicao["adiados_carregados"] == []
+    assert medicao["por_modulo"]["agent_manager"] > 0
@@ -0,0 +1,46 @@
+# test_table_encoder.py
+
+import numpy as np
+import pandas as pd
+from context_packer import estimar_tokens
+from table_encoder import codificar_tabela, formatar_valor
+
+
+def nfe_larga(n=100):
+    df = pd.DataFrame({
+        "emit_cnpj": ["12345678000199"] * n,
+        "emit_xNome": ["ACME COMERCIO LTDA"] * n,
+        "ide_nNF": np.arange(1, n + 1),
+        "item_xProd": [f"PRODUTO {i % 7}" for i in range(n)],
+        "item_vProd": np.linspace(10.5, 500.0, n).round(2),
+    })
+    vazias = pd.DataFrame({f"dest_campo_{i}": [None] * n for i in range(80)})
+    return pd.concat([df, vazias], axis=1)
+
+
+def test_remove_vazias_e_extrai_valores_comuns():
+    texto = codificar_tabela(nfe_larga(3))
+    linhas = texto.splitlines()
+
+    assert linhas[0] == "Valores comuns a todos os registros listados (não necessariamente aos demais): emit_cnpj=12345678000199;emit_xNome=ACME COMERCIO LTDA"
+    assert linhas[1] == "ide_nNF;item_xProd;item_vProd"
+    assert linhas[2] == "1;PRODUTO 0;10.5"
+    assert "dest_campo" not in texto
+
+
+def test_orcamento_e_reducao_frente_ao_json():
+    df = nfe_larga(100)
+    texto = codificar_tabela(df, orcamento_tokens=200, max_linhas=50)
+
+    assert estimar_tokens(texto) <= 220
+    assert texto.endswith("não exibido(s)]")
+
+    json_antigo = df.head(50).to_json(orient="records", force_ascii=False, indent=2)
+    assert estimar_tokens(codificar_tabela(df, max_linhas=50)) * 10 < estimar_tokens(json_antigo)
+
+
+def test_formatar_valor():
+    assert formatar_valor(float("nan")) == ""
+    assert formatar_valor(1500.0) == "1500"
+    assert formatar_valor("a;b") == '"a;b"'
+    assert formatar_valor("x" * 500).endswith("...")
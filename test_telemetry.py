@@ -0,0 +1,61 @@
+# test_telemetry.py
+
+import json
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import telemetry
+from telemetry import Telemetria
+from llm_client import ClienteLLMAssincrono
+
+
+def test_medicoes_rotulos_erros_e_exportacao(tmp_path):
+    t = Telemetria(arquivo=str(tmp_path / "metricas.prom"), intervalo=0)
+    for _ in range(19):
+        t.observar("resposta", 0.2, modo="csv")
+    with t.medir("resposta", modo="deterministica") as rotulos:
+        rotulos["modo"] = "csv"  # modo descoberto no meio da resposta
+    with pytest.raises(ValueError):
+        with t.medir("llm", modo="pdf"):
+            raise ValueError("falhou")
+    t.contar("cache", cache="exato", resultado="acerto")
+
+    dados = t.exportar_json()
+    [csv] = dados["histogramas"]["resposta"]
+    assert csv["rotulos"] == {"modo": "csv"} and csv["total"] == 20
+    assert 0.1 < csv["p95_segundos"] <= 0.25
+    assert dados["contadores"]["erros"] == [{"rotulos": {"etapa": "llm"}, "valor": 1}]
+
+    texto = t.exportar_prometheus()
+    assert "# TYPE chatfiscal_resposta_segundos histogram" in texto
+    assert 'chatfiscal_resposta_segundos_bucket{modo="csv",le="0.25"} 20' in texto
+    assert 'chatfiscal_resposta_segundos_bucket{modo="csv",le="+Inf"} 20' in texto
+    assert 'chatfiscal_llm_segundos_count{modo="pdf"} 1' in texto
+    assert 'chatfiscal_cache_total{cache="exato",resultado="acerto"} 1' in texto
+
+    t.gravar_periodicamente()
+    assert (tmp_path / "metricas.prom").read_text(encoding="utf-8") == t.exportar_prometheus()
+    t.gravar(str(tmp_path / "metricas.json"))
+    assert json.loads((tmp_path / "metricas.json").read_text(encoding="utf-8"))["contadores"]["cache"]
+
+
+def test_chamada_llm_registra_latencia_e_tokens(monkeypatch):
+    t = Telemetria(arquivo="")
+    monkeypatch.setattr(telemetry, "_telemetria", t)
+    modelo = GenericFakeChatModel(messages=iter([AIMessage(content="O total das notas é R$ 30,00"),
+                                                 AIMessage(content="Cláusula 1 fala de pagamento")]))
+    cadeia = ChatPromptTemplate.from_messages([("human", "{pergunta}")]) | modelo | StrOutputParser()
+    cliente = ClienteLLMAssincrono(max_concorrentes=1, timeout=5)
+
+    assert cliente.executar(cadeia, {"pergunta": "Qual o total das notas fiscais?"}, modo="csv").startswith("O total")
+    assert "".join(cliente.transmitir(cadeia, {"pergunta": "O que diz a cláusula 1?"}, modo="pdf"))
+
+    dados = t.exportar_json()
+    assert {tuple(h["rotulos"].values()) for h in dados["histogramas"]["llm"]} == {("csv",), ("pdf",)}
+    tokens = {(c["rotulos"]["modo"], c["rotulos"]["tipo"]): c["valor"] for c in dados["contadores"]["llm_tokens"]}
+    assert tokens[("csv", "prompt")] == 8 and tokens[("csv", "resposta")] == 7
+    assert tokens[("pdf", "prompt")] > 0 and tokens[("pdf", "resposta")] > 0
+    assert dados["histogramas"]["llm_primeiro_pedaco"][0]["rotulos"] == {"modo": "pdf"}
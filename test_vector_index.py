@@ -0,0 +1,66 @@
+# test_vector_index.py
+
+import time
+import faiss
+import numpy as np
+from vector_index import IndiceVetorialAdaptativo, MatrizVetorial
+
+
+def vetores_aleatorios(n, d=32, semente=0):
+    return np.random.default_rng(semente).normal(size=(n, d)).astype("float32")
+
+
+def test_produto_interno_normalizado():
+    indice = IndiceVetorialAdaptativo(3, tipo="flat")
+    indice.add([[10.0, 0.0, 0.0], [0.0, 2.0, 0.0]])
+
+    similaridades, posicoes = indice.search([[5.0, 0.0, 0.0]], 2)
+    assert posicoes[0][0] == 0
+    assert abs(similaridades[0][0] - 1.0) < 1e-6
+    assert abs(similaridades[0][1]) < 1e-6
+
+
+def test_migra_para_hnsw_no_limiar():
+    indice = IndiceVetorialAdaptativo(32, tipo="auto", tipo_ann="hnsw", limiar_ann=500)
+    indice.add(vetores_aleatorios(499))
+    assert indice.tipo == "flat"
+
+    indice.add(vetores_aleatorios(101, semente=1))
+    assert indice.tipo == "hnsw"
+    assert indice.ntotal == indice.index.ntotal == 600
+
+    medicao = indice.medir(amostras=100, k=5)
+    assert medicao["recall"] >= 0.9
+
+
+def test_reconstruir_ivfpq_e_persistir(tmp_path):
+    indice = IndiceVetorialAdaptativo.a_partir_de_vetores(vetores_aleatorios(2000), tipo="flat")
+    indice.reconstruir("ivfpq")
+    assert isinstance(indice.index, faiss.IndexIVFPQ)
+    assert indice.medir(amostras=50, k=10)["recall"] > 0.3
+
+    indice.salvar(str(tmp_path / "i.faiss"), str(tmp_path / "v.npy"))
+    carregado = IndiceVetorialAdaptativo.carregar(str(tmp_path / "i.faiss"), str(tmp_path / "v.npy"))
+    assert carregado.tipo == "ivfpq"
+    assert carregado.ntotal == 2000
+    np.testing.assert_allclose(np.linalg.norm(carregado.vetores, axis=1), 1.0, rtol=1e-5)
+
+
+def test_ivfpq_com_poucos_vetores_fica_exato():
+    indice = IndiceVetorialAdaptativo.a_partir_de_vetores(vetores_aleatorios(100), tipo="flat")
+    indice.reconstruir("ivfpq")
+    assert indice.tipo == "flat" and isinstance(indice.index, faiss.IndexFlatIP)
+    assert indice.medir(amostras=20, k=5)["recall"] == 1.0
+
+def test_matriz_numpy_top_k_exato_em_100k():
+    vetores = vetores_aleatorios(100_000, d=256)
+    matriz = MatrizVetorial.a_partir_de_vetores(vetores)
+    consultas = vetores[[7, 99_999]] + 0.01
+
+    inicio = time.perf_counter()
+    similaridades, posicoes = matriz.search(consultas, 5)
+    assert time.perf_counter() - inicio < 1.0
+
+    assert list(posicoes[:, 0]) == [7, 99_999]
+    assert (np.diff(similaridades, axis=1) <= 0).all()
+    assert matriz.medir(amostras=20, k=5)["recall"] == 1.0
@@ -0,0 +1,278 @@
+# vector_index.py - ÍNDICE VETORIAL ADAPTATIVO DA MEMÓRIA
+"""
+Índice vetorial adaptativo do ChatFiscal
+
+Usado pela MemoriaInteligente, cujo histórico cresce sem parar:
+- Vetores normalizados + produto interno (score = similaridade de cosseno)
+- Começa exato (IndexFlatIP) e migra sozinho para ANN (HNSW, ou IVF-PQ
+  quando configurado) ao passar de um limiar de tamanho
+- Mantém uma cópia float32 dos vetores para reconstruções e medições
+  de recall/latência contra a busca exata
+- Sem FAISS instalado: MatrizVetorial, busca exata vetorizada em NumPy
+"""
+
+import os
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+    HAVE_FAISS = True
+except ImportError:
+    faiss = None
+    HAVE_FAISS = False
+
+logger = logging.getLogger(__name__)
+
+TIPOS_INDICE = ("flat", "hnsw", "ivfpq")
+
+# auto → flat até o limiar, depois o tipo ANN configurado
+TIPO_INDICE = os.getenv("CHATFISCAL_MEMORIA_INDICE", "auto")
+TIPO_ANN = os.getenv("CHATFISCAL_MEMORIA_ANN", "hnsw")
+LIMIAR_ANN = int(os.getenv("CHATFISCAL_MEMORIA_LIMIAR_ANN", "10000"))
+
+# Vetores mínimos para treinar IVF-PQ: 39 pontos por centroide do PQ de 4 bits
+# (16 centroides), como o FAISS recomenda; abaixo disso o índice fica exato
+MIN_TREINO_IVFPQ = 39 * 16
+
+
+def normalizar(vetores) -> np.ndarray:
+    """Matriz float32 contígua com linhas de norma unitária."""
+    matriz = np.atleast_2d(np.asarray(vetores, dtype="float32"))
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return np.ascontiguousarray(matriz / normas)
+
+
+class MatrizVetorial:
+    """
+    🧮 Vetores normalizados em uma matriz NumPy com busca exata por produto interno.
+
+    Top-k vetorizado (uma multiplicação de matrizes + argpartition): dezenas de
+    milhares de registros em poucos milissegundos, sem FAISS.
+    """
+
+    def __init__(self, dimensao: int, **_):
+        self.dimensao = dimensao
+        self.tipo = "numpy"
+        self._vetores = np.zeros((0, dimensao), dtype="float32")
+        self._total = 0
+
+    @property
+    def ntotal(self) -> int:
+        return self._total
+
+    @property
+    def vetores(self) -> np.ndarray:
+        """Vetores normalizados armazenados (visão somente leitura)."""
+        visao = self._vetores[:self._total]
+        visao.flags.writeable = False
+        return visao
+
+    def add(self, vetores) -> None:
+        """Adiciona vetores (normalizados aqui)."""
+        self._anexar_matriz(normalizar(vetores))
+
+    def search(self, consultas, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (similaridades, posições) — maior similaridade primeiro."""
+        return self._busca_exata(normalizar(consultas), k)
+
+    def reconstruir(self, tipo: Optional[str] = None) -> None:
+        """Busca já é exata: nada a reconstruir."""
+
+    def medir(self, amostras: int = 200, k: int = 10) -> Dict[str, Any]:
+        """Recall@k e latência média do índice atual contra a busca exata (consultas = vetores armazenados)."""
+        if self._total == 0:
+            return {"tipo": self.tipo, "vetores": 0}
+
+        k = min(k, self._total)
+        rng = np.random.default_rng(0)
+        posicoes = rng.choice(self._total, size=min(amostras, self._total), replace=False)
+        consultas = np.ascontiguousarray(self.vetores[posicoes])
+
+        inicio = time.perf_counter()
+        _, esperado = self._busca_exata(consultas, k)
+        latencia_exata = (time.perf_counter() - inicio) / len(consultas)
+
+        inicio = time.perf_counter()
+        _, obtido = self.search(consultas, k)
+        latencia = (time.perf_counter() - inicio) / len(consultas)
+
+        acertos = sum(len(set(e) & set(o)) for e, o in zip(esperado, obtido))
+        return {
+            "tipo": self.tipo,
+            "vetores": self._total,
+            "k": k,
+            "recall": acertos / (len(consultas) * k),
+            "latencia_ms": latencia * 1000,
+            "latencia_exata_ms": latencia_exata * 1000
+        }
+
+    def serializar(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Cópia em memória (índice serializado, vetores) — permite gravar fora do lock."""
+        return np.zeros(0, dtype="uint8"), self.vetores.copy()
+
+    def salvar(self, caminho_indice: str, caminho_vetores: str) -> None:
+        """Grava a matriz de vetores (o índice é a própria matriz)."""
+        np.save(caminho_vetores, self.vetores)
+
+    @classmethod
+    def carregar(cls, caminho_indice: str, caminho_vetores: str, **kwargs) -> "MatrizVetorial":
+        """Lê vetores salvos por `salvar` (o arquivo de índice é ignorado)."""
+        vetores = np.load(caminho_vetores)
+        indice = cls(vetores.shape[1], **kwargs)
+        indice._anexar_matriz(vetores.astype("float32"))
+        return indice
+
+    @classmethod
+    def a_partir_de_vetores(cls, vetores, **kwargs) -> "MatrizVetorial":
+        """Cria um índice novo com os vetores dados (normalizados)."""
+        matriz = normalizar(vetores)
+        indice = cls(matriz.shape[1], **kwargs)
+        indice._anexar_matriz(matriz)
+        indice.reconstruir()
+        return indice
+
+    def _busca_exata(self, consultas: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k exato por produto interno: (q, n) similaridades → argpartition → ordena só os k."""
+        k = min(k, self._total)
+        if k <= 0:
+            return np.zeros((len(consultas), 0), dtype="float32"), np.zeros((len(consultas), 0), dtype="int64")
+
+        similaridades = consultas @ self.vetores.T
+        if k < self._total:
+            posicoes = np.argpartition(-similaridades, k - 1, axis=1)[:, :k]
+        else:
+            posicoes = np.tile(np.arange(self._total), (len(consultas), 1))
+        parciais = np.take_along_axis(similaridades, posicoes, axis=1)
+        ordem = np.argsort(-parciais, axis=1)
+        return np.take_along_axis(parciais, ordem, axis=1), np.take_along_axis(posicoes, ordem, axis=1).astype("int64")
+
+    def _anexar_matriz(self, matriz: np.ndarray) -> None:
+        """Acrescenta linhas à cópia dos vetores (capacidade dobra → O(1) amortizado)."""
+        necessario = self._total + len(matriz)
+        if necessario > len(self._vetores):
+            capacidade = max(necessario, 2 * len(self._vetores), 64)
+            novo = np.zeros((capacidade, self.dimensao), dtype="float32")
+            novo[:self._total] = self._vetores[:self._total]
+            self._vetores = novo
+        self._vetores[self._total:necessario] = matriz
+        self._total = necessario
+
+
+class IndiceVetorialAdaptativo(MatrizVetorial):
+    """
+    🧭 Índice FAISS por produto interno que migra de busca exata para ANN conforme cresce.
+    """
+
+    def __init__(self, dimensao: int, tipo: str = TIPO_INDICE, tipo_ann: str = TIPO_ANN,
+                 limiar_ann: int = LIMIAR_ANN, hnsw_m: int = 32, ef_search: int = 128, nprobe: int = 16):
+        """
+        Args:
+            dimensao: Dimensão dos vetores
+            tipo: "auto", "flat", "hnsw" ou "ivfpq"
+            tipo_ann: Índice ANN usado pelo modo "auto" após o limiar ("hnsw" ou "ivfpq")
+            limiar_ann: Nº de vetores a partir do qual o modo "auto" migra para ANN
+            hnsw_m: Conexões por nó do HNSW
+            ef_search: Amplitude da busca no HNSW
+            nprobe: Listas visitadas por busca no IVF
+        """
+        super().__init__(dimensao)
+        self.tipo_config = tipo
+        self.tipo_ann = tipo_ann
+        self.limiar_ann = limiar_ann
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+
+        self.tipo = "flat"
+        self.index = faiss.IndexFlatIP(dimensao)
+
+    def add(self, vetores) -> None:
+        """Adiciona vetores (normalizados aqui) e migra para ANN se passar do limiar."""
+        matriz = normalizar(vetores)
+        self._anexar_matriz(matriz)
+        self.index.add(matriz)
+
+        if self.tipo_config == "auto" and self.tipo == "flat" and self._total >= self.limiar_ann:
+            logger.info(f"📈 Memória passou de {self.limiar_ann} vetores: migrando para {self.tipo_ann.upper()}")
+            self.reconstruir(self.tipo_ann)
+
+    def search(self, consultas, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Retorna (similaridades, posições) — maior similaridade primeiro."""
+        return self.index.search(normalizar(consultas), k)
+
+    def reconstruir(self, tipo: Optional[str] = None) -> None:
+        """Recria o índice a partir dos vetores armazenados (tipo padrão: o configurado)."""
+        if tipo is None:
+            if self.tipo_config == "auto":
+                tipo = self.tipo_ann if self._total >= self.limiar_ann else "flat"
+            else:
+                tipo = self.tipo_config
+        if tipo not in TIPOS_INDICE:
+            raise ValueError(f"Tipo de índice inválido: {tipo} (use {', '.join(TIPOS_INDICE)})")
+
+        inicio = time.perf_counter()
+        self.index = self._criar_indice(tipo, self.vetores)
+        self.index.add(self.vetores)
+        self.tipo = self._tipo_de(self.index)
+        logger.info(f"🔧 Índice {self.tipo.upper()} reconstruído: {self._total} vetores em {time.perf_counter() - inicio:.2f}s")
+
+    def serializar(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Cópia em memória (índice serializado, vetores) — permite gravar fora do lock."""
+        return faiss.serialize_index(self.index), self.vetores.copy()
+
+    def salvar(self, caminho_indice: str, caminho_vetores: str) -> None:
+        """Grava o índice FAISS e a matriz de vetores."""
+        faiss.write_index(self.index, caminho_indice)
+        np.save(caminho_vetores, self.vetores)
+
+    @classmethod
+    def carregar(cls, caminho_indice: str, caminho_vetores: str, **kwargs) -> "IndiceVetorialAdaptativo":
+        """Lê um índice salvo por `salvar` (sem arquivo de índice, reconstrói a partir dos vetores)."""
+        indice = super().carregar(caminho_indice, caminho_vetores, **kwargs)
+        if os.path.exists(caminho_indice) and os.path.getsize(caminho_indice) > 0:
+            indice.index = faiss.read_index(caminho_indice)
+            indice.tipo = cls._tipo_de(indice.index)
+        else:
+            indice.reconstruir()
+        return indice
+
+    def _criar_indice(self, tipo: str, vetores: np.ndarray):
+        """Cria (e treina, se preciso) um índice FAISS vazio do tipo pedido."""
+        if tipo == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dimensao, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = self.ef_search
+            return index
+
+        if tipo == "ivfpq" and len(vetores) < MIN_TREINO_IVFPQ:
+            logger.warning(f"⚠️ {len(vetores)} vetores não bastam para treinar IVF-PQ "
+                           f"(mínimo {MIN_TREINO_IVFPQ}): usando índice exato (flat)")
+            tipo = "flat"
+
+        if tipo == "ivfpq":
+            nlist = max(1, min(int(4 * np.sqrt(len(vetores))), len(vetores) // 39))
+            m = next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if self.dimensao % m == 0)
+            bits = 8 if len(vetores) >= 256 * 39 else 4
+            quantizador = faiss.IndexFlatIP(self.dimensao)
+            index = faiss.IndexIVFPQ(quantizador, self.dimensao, nlist, m, bits, faiss.METRIC_INNER_PRODUCT)
+            index.train(vetores)
+            index.nprobe = min(self.nprobe, nlist)
+            return index
+
+        return faiss.IndexFlatIP(self.dimensao)
+
+    @staticmethod
+    def _tipo_de(index) -> str:
+        if isinstance(index, faiss.IndexHNSWFlat):
+            return "hnsw"
+        if isinstance(index, faiss.IndexIVFPQ):
+            return "ivfpq"
+        return "flat"
+
+
+# Índice usado pela memória: FAISS quando instalado, senão a matriz NumPy
+IndiceMemoria = IndiceVetorialAdaptativo if HAVE_FAISS else MatrizVetorial
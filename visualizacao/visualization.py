@@ -1,9 +1,6 @@
 # visualization.py
 
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
 from llm_utils import gerar_resposta_llm
 
 class Visualization:
@@ -13,6 +10,8 @@ class Visualization:
 
     @staticmethod
     def gerar_grafico_barras(df: pd.DataFrame, x: str, y: str):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
         plt.figure(figsize=(10, 6))
         sns.barplot(data=df, x=x, y=y)
         plt.title("Gráfico de Barras")
@@ -20,6 +19,8 @@ class Visualization:
 
     @staticmethod
     def gerar_grafico_linhas(df: pd.DataFrame, x: str, y: str):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
         plt.figure(figsize=(10, 6))
         sns.lineplot(data=df, x=x, y=y)
         plt.title("Gráfico de Linhas")
@@ -27,6 +28,7 @@ class Visualization:
 
     @staticmethod
     def gerar_grafico_interativo(df: pd.DataFrame, x: str, y: str):
+        import plotly.express as px
         fig = px.bar(df, x=x, y=y, title="Gráfico Interativo de Barras")
         fig.show()
 
@@ -75,6 +77,8 @@ def gerar_grafico_visualizacao(tipo, df, foco):
     """
     Gera gráfico com base no tipo sugerido e na coluna foco.
     """
+    import plotly.express as px  # só quando há gráfico a desenhar (plotly pesa na abertura do app)
+
     try:
         # Se a coluna foco não existir, usa a primeira coluna
         if foco not in df.columns: